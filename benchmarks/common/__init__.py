@@ -0,0 +1 @@
+# Shared benchmark modules used by every backend benchmark tool
@@ -0,0 +1,245 @@
+# Adaptive batch sizing from measured throughput, request latency and rejections
+
+import logging
+import threading
+import time
+
+from .histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+MIN_BATCH_SIZE = 10
+MAX_BATCH_SIZE = 100000
+LATENCY_LIMIT = 5.0  # Seconds of median request latency above which a batch size is rejected
+_GAIN = 1.05  # A candidate size has to beat the best throughput by 5% to be kept
+_SETTLE_STEP = 1.15  # Search ends once the step factor drops below this
+
+class BatchController:
+    """
+    Tunes the number of documents and bytes per request while ingestion runs.
+
+    The search is a pattern search on the batch size: starting from the initial
+    size it tries a size `step` times larger (or smaller), measures the ingest
+    throughput over a window of requests, keeps the candidate if it was at least
+    5% faster, and otherwise tries the other direction. Once both directions lose,
+    the step shrinks (x4, x2, x1.4, ...), and when it is below 1.15 the controller
+    settles and logs the size it chose. A candidate whose median request latency
+    exceeds LATENCY_LIMIT is treated as a loss, so the search does not trade
+    latency for a few percent of throughput.
+
+    Rejections override the search at any time:
+
+    - 413 (request too large): requests are capped at 80% of the rejected body's
+      bytes from then on; the document count per request is that cap divided by
+      the average encoded document size.
+    - 429 (throttled): the first 429 of an episode halves the batch size and
+      restarts the search from there, since the backend's state changed; sizes
+      at or above the throttled one are not tried again. Further
+      429s count as requests that ingested nothing, so the search settles on the
+      size with the best accepted throughput instead of shrinking batches that
+      smaller sizes would not help; the episode ends with a window without 429s.
+
+    `batch_size()` is read by the batching loop before every batch, `encoded()`
+    learns the average bytes per document from every encoded body, and `record()`
+    is called as each request completes (from any worker thread).
+    """
+
+    def __init__(self, batch_size, concurrency=1, max_bytes=None, min_size=MIN_BATCH_SIZE, max_size=MAX_BATCH_SIZE,
+                 latency_limit=LATENCY_LIMIT, window_requests=None, window_seconds=0.5):
+        """
+        Args:
+            batch_size: Initial documents per request.
+            concurrency: Requests kept in flight (the first ones completed after a change are not measured).
+            max_bytes: Initial cap on the encoded bytes per request (None: learned from 413 responses).
+            min_size: Smallest document count tried.
+            max_size: Largest document count tried.
+            latency_limit: Median request latency (seconds) above which a size counts as worse.
+            window_requests: Requests measured per candidate (default: max(8, 2 x concurrency)).
+            window_seconds: Minimum duration of a measurement window.
+        """
+        self.initial_size = batch_size
+        self.size = max(min_size, min(max_size, batch_size))
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self.max_size = max_size
+        self.latency_limit = latency_limit
+        self.concurrency = max(1, concurrency)
+        self.window_requests = window_requests or max(8, 2 * self.concurrency)
+        self.window_seconds = window_seconds
+        self.doc_bytes = None  # Moving average of encoded bytes per document
+        self.settled = False
+        self.steps = []
+        self.too_large_requests = 0
+        self.throttled_requests = 0
+        self._lock = threading.Lock()
+        self._best_size = self.size
+        self._best_rate = None
+        self._step = 4.0
+        self._direction = 1
+        self._reversed = False
+        self._settled_after = None
+        self._requests = 0
+        self._throttling = False
+        self._ceiling = None  # Smallest batch size that was throttled
+        self._start_window()
+
+    # --- Batching side ---
+    def batch_size(self):
+        """The number of documents for the next batch: the current size, limited by the byte cap."""
+        size = self.size
+        if self.max_bytes and self.doc_bytes:
+            size = min(size, int(self.max_bytes / self.doc_bytes))
+        return max(1, size)
+
+    def encoded(self, body_bytes, doc_count):
+        """Learns the average encoded document size from one encoded request body."""
+        if doc_count:
+            per_doc = body_bytes / doc_count
+            self.doc_bytes = per_doc if self.doc_bytes is None else 0.9 * self.doc_bytes + 0.1 * per_doc
+
+    # --- Feedback side ---
+    def record(self, doc_count, num_success, body_bytes, latency, rejection=None):
+        """
+        Accounts for one completed request.
+
+        Args:
+            doc_count: Documents in the request.
+            num_success: Documents the backend accepted.
+            body_bytes: Encoded (uncompressed) size of the request body.
+            latency: Seconds the request took.
+            rejection: "too_large" (413), "throttled" (429) or None.
+        """
+        with self._lock:
+            self._requests += 1
+            if rejection == "too_large":
+                self._too_large(body_bytes)
+                return
+            if rejection == "throttled":
+                self.throttled_requests += 1
+                if not self._throttling:
+                    self._throttled()
+                    return
+            if self._skip > 0:
+                # Still completing requests that were batched before the last change
+                self._skip -= 1
+                if self._skip == 0:
+                    self._window_start = time.perf_counter()
+                return
+            self._window_docs += num_success
+            self._window_count += 1
+            if rejection == "throttled":
+                self._window_throttled += 1
+            else:
+                self._window_latency.record(latency)
+            elapsed = time.perf_counter() - self._window_start
+            if self._window_count >= self.window_requests and elapsed >= self.window_seconds and not self.settled:
+                self._evaluate(self._window_docs / elapsed)
+
+    def _start_window(self):
+        self._skip = self.concurrency
+        self._window_start = time.perf_counter()
+        self._window_docs = 0
+        self._window_count = 0
+        self._window_throttled = 0
+        self._window_latency = LatencyHistogram()
+
+    def _evaluate(self, rate):
+        """Ends the window of the current size and picks the next candidate."""
+        latency = self._window_latency.percentile(50)
+        self.steps.append({"batch_size": self.batch_size(), "docs_per_sec": rate, "p50_latency": latency,
+                           "throttled": self._window_throttled})
+        if self._window_throttled == 0:
+            self._throttling = False
+        if latency > self.latency_limit:
+            rate = 0.0
+        if self._best_rate is None:
+            self._best_rate = rate
+        elif self.size != self._best_size:
+            if rate >= self._best_rate * _GAIN:
+                self._best_size = self.size
+                self._best_rate = rate
+                self._reversed = False
+            elif not self._reversed:
+                self._direction = -self._direction
+                self._reversed = True
+            else:
+                self._step **= 0.5
+                self._reversed = False
+        self._next_candidate()
+
+    def _next_candidate(self):
+        while True:
+            if self._step < _SETTLE_STEP:
+                self._settle()
+                return
+            candidate = max(self.min_size, min(self.max_size, round(self._best_size * self._step ** self._direction)))
+            if self.max_bytes and self.doc_bytes:
+                candidate = min(candidate, max(1, int(self.max_bytes / self.doc_bytes)))
+            if self._ceiling:
+                candidate = min(candidate, max(self.min_size, int(self._ceiling / _SETTLE_STEP)))
+            if candidate != self._best_size:
+                break
+            # Against a limit in this direction: try the other one, or refine the step
+            if not self._reversed:
+                self._direction = -self._direction
+                self._reversed = True
+            else:
+                self._step **= 0.5
+                self._reversed = False
+        self.size = candidate
+        self._start_window()
+
+    def _settle(self):
+        self.size = self._best_size
+        self.settled = True
+        self._settled_after = self._requests
+        bytes_note = f", about {self.batch_size() * self.doc_bytes / 1e6:.2f} MB" if self.doc_bytes else ""
+        rate_note = f" ({self._best_rate:.0f} docs/sec)" if self._best_rate else ""
+        cap_note = f", capped at {self.max_bytes / 1e6:.2f} MB per request" if self.max_bytes else ""
+        logger.info(f"Adaptive batching settled on {self.batch_size()} documents per request{bytes_note}{rate_note} "
+                    f"after {self._requests} requests{cap_note}.")
+
+    def _too_large(self, body_bytes):
+        self.too_large_requests += 1
+        if self.max_bytes is not None and body_bytes > self.max_bytes:
+            return  # Batched before the cap took effect
+        cap = int(body_bytes * 0.8)
+        if self.max_bytes is None or cap < self.max_bytes:
+            self.max_bytes = cap
+            logger.warning(f"A request of {body_bytes} bytes was rejected as too large (413); "
+                           f"capping requests at {cap} bytes.")
+            self._restart()
+
+    def _throttled(self):
+        self._throttling = True
+        self._ceiling = min(self._ceiling or self.batch_size(), self.batch_size())
+        size = max(self.min_size, self.batch_size() // 2)
+        logger.warning(f"The backend is throttling requests (429); reducing the batch size from {self.batch_size()} to {size}.")
+        self.size = self._best_size = size
+        self._restart()
+
+    def _restart(self):
+        """Restarts the search from the current size after the backend's limits changed."""
+        self._best_size = min(self._best_size, self.batch_size())
+        self.size = self._best_size
+        self._best_rate = None
+        self._step = 2.0
+        self._direction = -1
+        self._reversed = False
+        self.settled = False
+        self._start_window()
+
+    def stats(self):
+        """The chosen batch size and the measurements behind it, for the run results."""
+        with self._lock:
+            return {
+                "initial_batch_size": self.initial_size,
+                "batch_size": self.batch_size(),
+                "batch_bytes": round(self.batch_size() * self.doc_bytes) if self.doc_bytes else None,
+                "max_bytes": self.max_bytes,
+                "settled": self.settled,
+                "settled_after_requests": self._settled_after,
+                "too_large_requests": self.too_large_requests,
+                "throttled_requests": self.throttled_requests,
+                "steps": self.steps,
+            }
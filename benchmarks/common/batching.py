@@ -0,0 +1,102 @@
+# Byte-bounded batching: request size limits and per-request payload size histograms
+
+import argparse
+import re
+
+from .histogram import SizeHistogram
+
+_SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]i?b?|b)?\s*$', re.IGNORECASE)
+_UNITS = {"": 1, "b": 1, "k": 1000, "kb": 1000, "m": 10**6, "mb": 10**6, "g": 10**9, "gb": 10**9,
+          "ki": 1024, "kib": 1024, "mi": 1024**2, "mib": 1024**2, "gi": 1024**3, "gib": 1024**3}
+
+def parse_size(value):
+    """
+    argparse type for byte sizes such as --batch-bytes: a number of bytes, or a
+    number with a decimal (KB, MB, GB) or binary (KiB, MiB, GiB) unit. Returns bytes.
+    """
+    match = _SIZE.match(value)
+    if not match or float(match.group(1)) <= 0:
+        raise argparse.ArgumentTypeError(f"Invalid size '{value}'. Use bytes (e.g. 1048576) or a unit (e.g. 5MB, 4MiB).")
+    return int(float(match.group(1)) * _UNITS[(match.group(2) or "").lower()])
+
+def format_size(num_bytes):
+    """Formats a byte count for log lines (e.g. 1.05 MB)."""
+    for unit, factor in (("GB", 10**9), ("MB", 10**6), ("KB", 10**3)):
+        if num_bytes >= factor:
+            return f"{num_bytes / factor:.2f} {unit}"
+    return f"{num_bytes:.0f} B"
+
+class BodySizes:
+    """
+    Measures every request body and, with a limit, bounds batches by bytes while they are assembled.
+
+    The exact size of a body is only known once the driver has encoded it, so the
+    batching loop calls `admit` for each document before adding it. The driver's
+    `doc_size` estimates the bytes the document adds (for raw lines, about the line
+    length), and the batch's running estimate, scaled by the ratio of encoded to
+    estimated bytes over the previous bodies, is compared with the limit. The scale
+    absorbs per-request overhead, escaping and any compression done while encoding,
+    so bodies end up just below the limit however much the document sizes vary.
+    A document that alone exceeds the limit is sent in a request of its own.
+
+    `encoded` records the size of each body in a SizeHistogram. Bodies of more than
+    one document that still exceed the limit are counted, so an estimate that runs
+    short shows up in the results. Used by the reading thread only.
+    """
+
+    def __init__(self, doc_size, limit=None):
+        """
+        Args:
+            doc_size: Function returning the estimated bytes a document adds to a body.
+            limit: Bytes per request body (None: bodies are only measured).
+        """
+        self.limit = limit
+        self.histogram = SizeHistogram()
+        self.byte_limited_batches = 0
+        self.oversized_docs = 0
+        self.over_limit_requests = 0
+        self._doc_size = doc_size
+        self._scale = None  # Encoded body bytes per estimated byte
+        self._estimate = 0  # Estimated bytes of the batch being assembled
+        self._carry = 0  # Estimate of the document that starts the next batch
+
+    def admit(self, doc, batched):
+        """
+        Adds a document's estimated size to the batch being assembled.
+
+        Returns:
+            True if the `batched` documents already in the batch have to be sent
+            first; the document then starts the next batch.
+        """
+        size = self._doc_size(doc)
+        scale = self._scale or 1.0
+        if size * scale > self.limit:
+            self.oversized_docs += 1
+        if batched and (self._estimate + size) * scale > self.limit:
+            self.byte_limited_batches += 1
+            self._carry = size
+            return True
+        self._estimate += size
+        return False
+
+    def encoded(self, body, doc_count):
+        """Records the size of an encoded body and, with a limit, learns the scale from it."""
+        size = len(body)
+        self.histogram.record(size)
+        if self.limit:
+            if self._estimate:
+                ratio = size / self._estimate
+                self._scale = ratio if self._scale is None else 0.8 * self._scale + 0.2 * ratio
+            if size > self.limit and doc_count > 1:
+                self.over_limit_requests += 1
+            self._estimate, self._carry = self._carry, 0
+
+    def stats(self):
+        """The byte limit and how batches kept to it, for the run results."""
+        return {
+            "limit": self.limit,
+            "byte_limited_batches": self.byte_limited_batches,
+            "oversized_docs": self.oversized_docs,
+            "over_limit_requests": self.over_limit_requests,
+            "estimate_scale": self._scale,
+        }
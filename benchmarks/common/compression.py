@@ -0,0 +1,100 @@
+# Request-body compression with per-run cost accounting
+
+import gzip
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:  # Only required for zstd
+    zstandard = None
+
+ALGORITHMS = ("none", "gzip", "zstd")
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+class Compressor:
+    """
+    Compresses request bodies and records what it cost.
+
+    `compress` may be called from several sender threads at once. CPU time is
+    measured with the calling thread's CPU clock, so the total is the client CPU
+    seconds spent compressing, independent of how many senders run in parallel.
+    With algorithm "none" bodies are passed through but still counted, so every
+    run reports the bytes it sent.
+    """
+
+    def __init__(self, algorithm="none", level=None):
+        """
+        Args:
+            algorithm: One of "none", "gzip" or "zstd".
+            level: Compression level (defaults: gzip 6, zstd 3).
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unsupported compression '{algorithm}'. Use one of: {', '.join(ALGORITHMS)}")
+        if algorithm == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package (pip install zstandard).")
+        self.algorithm = algorithm
+        self.level = level if level is not None else DEFAULT_LEVELS.get(algorithm)
+        self._lock = threading.Lock()
+        self._local = threading.local()  # zstd compressors are not safe to share between threads
+        self._requests = 0
+        self._raw_bytes = 0
+        self._sent_bytes = 0
+        self._cpu_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.algorithm != "none"
+
+    @property
+    def content_encoding(self):
+        """Value for the Content-Encoding request header, or None when not compressing."""
+        return self.algorithm if self.enabled else None
+
+    def _zstd(self):
+        compressor = getattr(self._local, "zstd", None)
+        if compressor is None:
+            compressor = self._local.zstd = zstandard.ZstdCompressor(level=self.level)
+        return compressor
+
+    def compress(self, body):
+        """Returns the (possibly) compressed body and records its sizes and CPU cost."""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        cpu_start = time.thread_time()
+        if self.algorithm == "gzip":
+            sent = gzip.compress(body, compresslevel=self.level, mtime=0)
+        elif self.algorithm == "zstd":
+            sent = self._zstd().compress(body)
+        else:
+            sent = body
+        cpu_seconds = time.thread_time() - cpu_start
+        with self._lock:
+            self._requests += 1
+            self._raw_bytes += len(body)
+            self._sent_bytes += len(sent)
+            self._cpu_seconds += cpu_seconds
+        return sent
+
+    def stats(self, total_time=None):
+        """
+        Returns the compression figures for the run.
+
+        Args:
+            total_time: Wall time of the run, used to report raw and wire throughput in MB/s.
+        """
+        with self._lock:
+            s = {
+                "algorithm": self.algorithm,
+                "level": self.level,
+                "requests": self._requests,
+                "raw_bytes": self._raw_bytes,
+                "sent_bytes": self._sent_bytes,
+                "ratio": self._raw_bytes / self._sent_bytes if self._sent_bytes else 0,
+                "cpu_seconds": self._cpu_seconds,
+            }
+        if total_time:
+            s["raw_mb_per_sec"] = s["raw_bytes"] / (1024 * 1024) / total_time
+            s["wire_mb_per_sec"] = s["sent_bytes"] / (1024 * 1024) / total_time
+            s["cpu_share"] = s["cpu_seconds"] / total_time
+        return s
@@ -0,0 +1,773 @@
+# Shared benchmark core: reading, batching, concurrency, pacing and measurement for every backend
+
+import itertools
+import logging
+import math
+import queue
+import re
+import threading
+import time
+
+from . import fastjson
+from .autobatch import BatchController
+from .batching import BodySizes, format_size
+from .histogram import LatencyHistogram
+from .ndjson_reader import ShardedNDJSONReader
+from .pacing import RatePacer, ReplayPacer
+from .passthrough import splice_field
+from .profiling import StageTimes, breakdown, log_breakdown
+from .query_load import run_query_load
+from .resources import ResourceMonitor
+from .retry import RetryPolicy
+from .timeseries import INGEST_COUNTERS, INGEST_GAUGES, INGEST_LATENCIES, Progress, TimeSeriesSampler, rate_summary
+from .timestamps import event_time_reader
+from .visibility import MARKER_FIELD, VisibilityProbe
+
+logger = logging.getLogger(__name__)
+
+REPLAY_BATCH_WAIT = 1.0  # Default seconds a replayed batch collects documents before it is sent
+# HTTP status in the drivers' error details: "TransportError (413): ...", "INDEX (429): ...", "HTTP 413: ..."
+_REJECTION_STATUS = re.compile(r'^[^:]*?\b(413|429)\b')
+_REJECTIONS = {"413": "too_large", "429": "throttled"}
+
+class BackendDriver:
+    """
+    What a backend has to provide for the shared load engine to drive it.
+
+    A driver turns batches of documents into request bodies (`encode_batch`),
+    sends them (`send_batch`), runs single queries (`run_query`) and reports
+    whether the backend is up (`health`). Everything else (reading the data file,
+    batching, concurrency, pacing, latency histograms, time series) is done by
+    `run_ingestion` and `run_queries` below, so it behaves the same on every engine.
+
+    `send_batch` and `run_query` are called from several threads. A driver whose
+    connections are not thread-safe returns a copy with its own connection from
+    `clone`, which the engine calls once per worker thread and query client.
+
+    During ingestion `stages` is the run's StageTimes (see common/profiling.py);
+    a driver adds the stages only it can tell apart, such as the "timestamps" part
+    of encoding a batch or the "response" part of a request.
+    """
+
+    name = "backend"
+    request_name = "request"  # Results report the request latency as "<request_name>_latency"
+    raw = False  # True: encode_batch receives raw NDJSON line bytes instead of decoded documents
+    stages = None  # common.profiling.StageTimes of the ingestion running, set by run_ingestion
+
+    def setup(self):
+        """Prepares the backend for ingestion (e.g. creates the index). Returns an error message or None."""
+        return None
+
+    def reset(self):
+        """
+        Removes what earlier trials ingested (e.g. deletes the index), so every trial of a
+        repeated run starts from the same state. Runs before `setup`. Returns an error
+        message or None. Optional.
+        """
+        raise NotImplementedError
+
+    def encode_batch(self, docs):
+        """Returns the request body (bytes) for one batch of documents. Runs on the reading thread."""
+        raise NotImplementedError
+
+    def doc_size(self, doc):
+        """
+        Estimates the bytes a document adds to a request body, for batches bounded by
+        bytes (see common/batching.py). Only called with a byte limit. The default is
+        the length of a raw line or of the document encoded with the fast JSON codec;
+        the engine scales estimates to the bodies actually encoded.
+        """
+        return len(doc) if self.raw else len(fastjson.dumps(doc))
+
+    def send_batch(self, body, doc_count):
+        """Sends one request body and returns (num_success, num_failed, error_details)."""
+        raise NotImplementedError
+
+    def send_attempt(self, body, doc_count):
+        """
+        Sends one attempt of a request and says what is worth retrying.
+
+        Returns:
+            (num_success, num_failed, error_details, retry), `retry` being a
+            (body, doc_count) payload of the throttled documents, or None. The default
+            retries the whole body when the request was rejected with a 429; drivers
+            whose backend rejects single documents (e.g. Elasticsearch bulk items)
+            return only those.
+        """
+        num_success, num_failed, error_details = self.send_batch(body, doc_count)
+        if num_failed and not num_success and self.rejection(error_details) == "throttled":
+            return num_success, num_failed, error_details, (body, doc_count)
+        return num_success, num_failed, error_details, None
+
+    def parse_query(self, line):
+        """Turns one line of the queries file into a query for run_query (None skips the line)."""
+        return line
+
+    def run_query(self, query):
+        """Runs one query and returns True on success (it may also raise)."""
+        raise NotImplementedError
+
+    def clear_cache(self):
+        """Clears the backend's query caches before a pass of `run_queries` with `clear_cache`. Optional."""
+        raise NotImplementedError
+
+    def health(self):
+        """Returns True if the backend is reachable and ready."""
+        raise NotImplementedError
+
+    def tag(self, doc, marker):
+        """Adds a visibility probe marker to one document (decoded, or a raw line if `raw`) and returns it."""
+        if self.raw:
+            return splice_field(doc, MARKER_FIELD, marker)
+        doc[MARKER_FIELD] = marker
+        return doc
+
+    def find_marker(self, marker, doc):
+        """Returns True once the document tagged with `marker` is searchable (used by the visibility probe)."""
+        raise NotImplementedError
+
+    def rejection(self, error_details):
+        """
+        Classifies a failed request from the error details returned by `send_batch`:
+        "too_large" (HTTP 413), "throttled" (HTTP 429) or None. The default finds the
+        status in the part of each detail before the first colon.
+        """
+        for detail in error_details:
+            match = _REJECTION_STATUS.match(detail)
+            if match:
+                return _REJECTIONS[match.group(1)]
+        return None
+
+    def clone(self):
+        """Returns a driver for another worker thread or query client (self if it is thread-safe)."""
+        return self
+
+    def dispatcher(self, concurrency):
+        """
+        Optionally returns a callable(payloads, progress, on_ack, retry) that sends every
+        (body, doc_count) payload with `concurrency` requests in flight and returns the
+        same stats as the default thread workers. `on_ack`, if not None, must be called
+        with (body, doc_count, num_success, latency, error_details) once each request
+        (with its retries) has completed. `retry` is a common.retry.RetryPolicy or None.
+        None (the default) uses the thread workers.
+        """
+        return None
+
+    def describe(self):
+        """Backend settings to include in the ingestion results (e.g. the body encoding)."""
+        return {}
+
+    def stats(self, total_time):
+        """Additional result sections measured by the driver (e.g. compression)."""
+        return {}
+
+    def server_stats(self):
+        """
+        Returns (counters, gauges) of the backend's own statistics for the resource monitor
+        (see common/resources.py), with column names starting with "server_", or None if
+        the backend has none. Called from the sampling thread once per interval.
+        """
+        return None
+
+# --- Ingestion ---
+def _encode(driver, batch, probe, markers, controller=None, sizes=None):
+    encode_start = time.perf_counter()
+    body = driver.encode_batch(batch)
+    if driver.stages is not None:
+        driver.stages.add("encode", time.perf_counter() - encode_start)
+    if probe is not None:
+        probe.register(body, markers)
+    if controller is not None:
+        controller.encoded(len(body), len(batch))
+    if sizes is not None:
+        sizes.encoded(body, len(batch))
+    return body, len(batch)
+
+def _byte_limit(sizes, controller):
+    """Keeps the byte limit in step with the controller's cap, which 413 responses lower."""
+    if sizes is not None and sizes.limit and controller is not None and controller.max_bytes:
+        sizes.limit = controller.max_bytes
+
+def _encoded_batches(driver, docs, batch_size, counters, pacer, stop_event=None, probe=None, batch_wait=None,
+                     controller=None, sizes=None):
+    """
+    Groups documents into batches, encodes each one and releases it at the pacer's rate.
+
+    A batch is flushed when it holds `batch_size` documents or, with `batch_wait`,
+    once it is `batch_wait` seconds old, like a log shipper's batch timer. Its age is
+    the time since its first document was read or, when the pacer holds the run to
+    a rate, the seconds of the schedule its documents span. With a BatchController
+    (see common/autobatch.py) `batch_size` is the controller's current size, read
+    again before every batch. With a byte limit in `sizes` (see common/batching.py)
+    a batch is also flushed before the document that would take it over the limit.
+    """
+    size_cap = max(1, int(pacer.rate * batch_wait)) if batch_wait and pacer.rate else None
+    if controller is not None:
+        batch_size = controller.batch_size()
+    if size_cap:
+        batch_size = min(batch_size, size_cap)
+    byte_limit = sizes is not None and sizes.limit
+    batch = []
+    markers = []
+    batch_start = None
+    for doc in docs:
+        if byte_limit and sizes.admit(doc, len(batch)):
+            pacer.wait(len(batch))
+            yield _encode(driver, batch, probe, markers, controller, sizes)
+            batch = []
+            markers = []
+            if stop_event is not None and stop_event.is_set():
+                return
+            if controller is not None:
+                batch_size = min(controller.batch_size(), size_cap) if size_cap else controller.batch_size()
+                _byte_limit(sizes, controller)
+        if probe is not None:
+            doc = probe.tag(doc, markers)
+        batch.append(doc)
+        counters["total_docs"] += 1
+        if batch_wait and len(batch) == 1:
+            batch_start = time.perf_counter()
+        if len(batch) >= batch_size or (batch_wait and time.perf_counter() - batch_start >= batch_wait):
+            pacer.wait(len(batch))
+            yield _encode(driver, batch, probe, markers, controller, sizes)
+            batch = []
+            markers = []
+            if stop_event is not None and stop_event.is_set():
+                return
+            if controller is not None:
+                batch_size = min(controller.batch_size(), size_cap) if size_cap else controller.batch_size()
+                _byte_limit(sizes, controller)
+    if batch:
+        pacer.wait(len(batch))
+        yield _encode(driver, batch, probe, markers, controller, sizes)
+
+def _replayed_batches(driver, docs, batch_size, counters, pacer, event_time, stop_event=None, probe=None,
+                      batch_wait=REPLAY_BATCH_WAIT, controller=None, sizes=None):
+    """
+    Groups documents into batches and releases each one when its documents were originally logged.
+
+    Every document is due at the replay pacer's time for its timestamp. A batch is
+    sent once it is full (when its last document is due) or once the next document
+    is due `batch_wait` seconds or more after the batch's first (at the end of that
+    wait), so quiet periods in the data become quiet periods on the wire. A batch
+    that reaches the byte limit in `sizes` is sent when its last document is due.
+    """
+    if controller is not None:
+        batch_size = controller.batch_size()
+    byte_limit = sizes is not None and sizes.limit
+    batch = []
+    markers = []
+    batch_due = last_due = None
+    for doc in docs:
+        due = pacer.due(event_time(doc))
+        if batch and due - batch_due >= batch_wait:
+            pacer.wait_until(batch_due + batch_wait)
+            yield _encode(driver, batch, probe, markers, controller, sizes)
+            batch = []
+            markers = []
+            if stop_event is not None and stop_event.is_set():
+                return
+            if controller is not None:
+                batch_size = controller.batch_size()
+                _byte_limit(sizes, controller)
+        if byte_limit and sizes.admit(doc, len(batch)):
+            pacer.wait_until(last_due)
+            yield _encode(driver, batch, probe, markers, controller, sizes)
+            batch = []
+            markers = []
+            if stop_event is not None and stop_event.is_set():
+                return
+            if controller is not None:
+                batch_size = controller.batch_size()
+                _byte_limit(sizes, controller)
+        if probe is not None:
+            doc = probe.tag(doc, markers)
+        batch.append(doc)
+        counters["total_docs"] += 1
+        if len(batch) == 1:
+            batch_due = due
+        last_due = due
+        if len(batch) >= batch_size:
+            pacer.wait_until(due)
+            yield _encode(driver, batch, probe, markers, controller, sizes)
+            batch = []
+            markers = []
+            if stop_event is not None and stop_event.is_set():
+                return
+            if controller is not None:
+                batch_size = controller.batch_size()
+                _byte_limit(sizes, controller)
+    if batch:
+        pacer.wait_until(last_due)
+        yield _encode(driver, batch, probe, markers, controller, sizes)
+
+def _send_with_retries(driver, body, doc_count, retry=None):
+    """
+    Sends one payload and, with a RetryPolicy, resends its throttled part after a backoff.
+
+    Returns:
+        (first_success, retried_success, num_failed, error_details, throttled_errors, latencies):
+        documents accepted on the first attempt and on retries, documents that failed for
+        good with their error details, the error details of the attempts that were
+        retried, and the latency of every attempt.
+    """
+    if retry is not None:
+        retry.request()
+    first_success = retried_success = num_failed = 0
+    error_details = []
+    throttled_errors = []
+    latencies = []
+    attempt = 0
+    while True:
+        attempt_start = time.perf_counter()
+        try:
+            num_success, failed, errors, again = driver.send_attempt(body, doc_count)
+        except Exception as e:
+            logger.error(f"Unexpected error sending batch: {e}")
+            num_success, failed, errors, again = 0, doc_count, [f"Unexpected Send Error: {e}"], None
+        latencies.append(time.perf_counter() - attempt_start)
+        if attempt == 0:
+            first_success = num_success
+        else:
+            retried_success += num_success
+        delay = retry.backoff(attempt) if again is not None and retry is not None else None
+        if delay is None:
+            return first_success, retried_success, num_failed + failed, error_details + errors, throttled_errors, latencies
+        # Documents failed for other reasons than throttling are not retried
+        num_failed += failed - again[1]
+        throttled_errors.extend(errors[:10])
+        time.sleep(delay)
+        body, doc_count = again
+        attempt += 1
+
+def _send_worker(driver, batch_queue, stats, progress, in_flight, on_ack=None, retry=None):
+    """
+    Pulls payloads off the queue and sends them until a None sentinel is received.
+
+    Each worker keeps its own stats dict (including its latency histogram), so the
+    only shared state touched per request is the in-flight gauge and, when the run
+    is sampled, the Progress counters. A worker backing off before a retry holds its
+    payload, so throttling slows the reader down through the bounded queue.
+    """
+    while True:
+        payload = batch_queue.get()
+        if payload is None:
+            break
+        body, doc_count = payload
+        with in_flight["lock"]:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        if progress is not None:
+            progress.add("requests_in_flight", 1)
+        request_start = time.perf_counter()
+        first_success, retried_success, num_failed, chunk_errors, throttled_errors, latencies = \
+            _send_with_retries(driver, body, doc_count, retry)
+        num_success = first_success + retried_success
+        latency = time.perf_counter() - request_start
+        with in_flight["lock"]:
+            in_flight["now"] -= 1
+        if on_ack is not None:
+            on_ack(body, doc_count, num_success, latency, throttled_errors + chunk_errors)
+        stats["busy_time"] += latency
+        stats["request_time"] += sum(latencies)
+        for attempt_latency in latencies:
+            stats["latency"].record(attempt_latency)
+        stats["requests"] += len(latencies)
+        stats["successful_docs"] += num_success
+        stats["first_attempt_docs"] += first_success
+        stats["retried_docs"] += retried_success
+        stats["errors"] += num_failed
+        if progress is not None:
+            progress.add("requests_in_flight", -1)
+            progress.add("ingested_docs", num_success)
+            progress.add("ingest_errors", num_failed)
+            progress.add("ingested_bytes", len(body))
+            for attempt_latency in latencies:
+                progress.record("ingest_request", attempt_latency)
+        if chunk_errors:
+            stats["error_details"].extend(chunk_errors[:10])
+        if stats["errors"] == 0:
+            logger.info(f"Worker {stats['worker']} processed batch: {stats['successful_docs']} successful docs so far.")
+        else:
+            logger.info(f"Worker {stats['worker']} processed batch: {stats['successful_docs']} successful, {stats['errors']} errors so far.")
+
+def send_with_threads(driver, payloads, concurrency, progress=None, on_ack=None, retry=None):
+    """
+    The default dispatcher: `concurrency` worker threads fed through a bounded queue,
+    so up to `concurrency` requests are in flight while the calling thread reads and
+    encodes the next batches. Throttled requests are retried under `retry`.
+
+    Returns:
+        A dictionary with successful_docs (first_attempt_docs plus retried_docs), errors,
+        error_details, requests (attempts), max_in_flight, latency (LatencyHistogram), per_worker,
+        request_time (seconds of all attempts) and handoff_time (seconds the calling thread
+        waited for a worker to take a batch).
+    """
+    # Bounded queue: the reader blocks once every worker is busy and one batch per worker is waiting
+    batch_queue = queue.Queue(maxsize=concurrency)
+    in_flight = {"lock": threading.Lock(), "now": 0, "max": 0}
+    worker_stats = [
+        {"worker": i, "requests": 0, "successful_docs": 0, "first_attempt_docs": 0, "retried_docs": 0, "errors": 0,
+         "busy_time": 0.0, "request_time": 0.0, "error_details": [], "latency": LatencyHistogram()}
+        for i in range(concurrency)
+    ]
+    threads = [
+        threading.Thread(target=_send_worker, args=(driver.clone(), batch_queue, worker_stats[i], progress, in_flight, on_ack, retry),
+                         name=f"send-worker-{i}", daemon=True)
+        for i in range(concurrency)
+    ]
+    start_time = time.perf_counter()
+    handoff_time = 0.0
+    for thread in threads:
+        thread.start()
+    try:
+        for payload in payloads:
+            put_start = time.perf_counter()
+            batch_queue.put(payload)
+            handoff_time += time.perf_counter() - put_start
+    finally:
+        for _ in threads:
+            batch_queue.put(None)
+        for thread in threads:
+            thread.join()
+    total_time = time.perf_counter() - start_time
+
+    error_details = []
+    for s in worker_stats:
+        error_details.extend(s["error_details"])
+    return {
+        "successful_docs": sum(s["successful_docs"] for s in worker_stats),
+        "first_attempt_docs": sum(s["first_attempt_docs"] for s in worker_stats),
+        "retried_docs": sum(s["retried_docs"] for s in worker_stats),
+        "errors": sum(s["errors"] for s in worker_stats),
+        "error_details": error_details,
+        "requests": sum(s["requests"] for s in worker_stats),
+        "max_in_flight": in_flight["max"],
+        "latency": LatencyHistogram.merged(s["latency"] for s in worker_stats),
+        "request_time": sum(s["request_time"] for s in worker_stats),
+        "handoff_time": handoff_time,
+        "per_worker": [{
+            "worker": s["worker"],
+            "requests": s["requests"],
+            "successful_docs": s["successful_docs"],
+            "errors": s["errors"],
+            "busy_time": s["busy_time"],
+            "p99_latency": s["latency"].percentile(99),
+            "docs_per_sec": s["successful_docs"] / total_time if total_time > 0 else 0
+        } for s in worker_stats],
+    }
+
+def run_ingestion(driver, data_file, batch_size=1000, concurrency=1, reader_workers=1, reader_ordered=True,
+                  max_docs=None, ingest_rate=None, stop_event=None, progress=None, series_interval=None,
+                  visibility_every=None, visibility_poll_interval=0.1, visibility_timeout=60.0, generator=None,
+                  batch_wait=None, replay_speed=None, auto_batch=False, max_retries=0, retry_backoff=0.1,
+                  retry_budget=0.2, batch_bytes=None, monitor_resources=False, reset=False):
+    """
+    Runs the ingestion benchmark against any backend driver.
+
+    With `reset` the driver first removes what earlier trials ingested, so repeated
+    trials are independent samples rather than runs against an ever larger backend.
+    The driver's setup runs next (a setup error ends the run). Documents are then
+    read by the shared NDJSON reader, or produced by a synthetic log generator
+    (decoded, or raw lines if the driver asks for them), grouped into batches of
+    `batch_size` (or `batch_wait` seconds, or `batch_bytes`) and encoded by the driver
+    on the calling thread, paced to `ingest_rate` docs/sec, and sent with up to `concurrency`
+    requests in flight.
+
+    With `replay_speed` the documents are instead released on the schedule of
+    their own timestamps, `replay_speed` times faster (see ReplayPacer), and
+    batches are also flushed after `batch_wait` seconds (default REPLAY_BATCH_WAIT).
+
+    With `auto_batch` a BatchController (common/autobatch.py) starts at
+    `batch_size` and tunes the documents and bytes per request from the measured
+    throughput, latency and 413/429 rejections.
+
+    With `max_retries` throttled requests (429, or bulk items rejected by a full
+    write queue) are sent again after a jittered exponential backoff, within a
+    retry budget (see common/retry.py); only the rejected documents are resent.
+
+    With `batch_bytes` a batch is also cut before the document that would take its
+    encoded body over that many bytes (see common/batching.py); with a `batch_size`
+    of 0 batches are bounded by bytes only. The size of every request body is
+    recorded either way and reported as request_bytes.
+
+    With `monitor_resources` (and a `series_interval`) every sample also holds the
+    client's CPU, memory and network use and the backend's own statistics (see
+    common/resources.py), summarized as resources.
+
+    Every run also reports where the load generator spent its time as stages: the
+    reading thread's reading, decoding, timestamps, serialization, pacing and waiting
+    for a free sender, and the senders' compression, response parsing and time on
+    the wire (see common/profiling.py). They are timed per batch and per request.
+
+    Args:
+        driver: The BackendDriver to ingest into.
+        data_file: Path to the NDJSON data file (ignored with a generator).
+        batch_size: Number of documents per request (0: bounded by batch_bytes only).
+        concurrency: Number of requests kept in flight.
+        reader_workers: Number of processes decoding the data file (see common/ndjson_reader.py).
+        reader_ordered: Whether decoded shards are consumed in file order.
+        max_docs: Stop after this many documents (None: the whole file; required with a generator).
+        ingest_rate: Target documents per second (None: as fast as possible).
+        stop_event: Optional threading.Event that stops the run at the next batch.
+        progress: Optional common.timeseries.Progress receiving live counts and latencies.
+        series_interval: Seconds between throughput samples (None: no time series).
+        visibility_every: Tag every Nth document and measure how long after its request
+            was acknowledged it becomes searchable (None: no probe, see common/visibility.py).
+        visibility_poll_interval: Seconds between the probe's polls for a marker.
+        visibility_timeout: Seconds after which a marker that never showed up counts as timed out.
+        generator: Optional common.loggen.LogGenerator streamed in place of the data file.
+        batch_wait: Also flush a batch once it is this many seconds old (None: only when full).
+        replay_speed: Replay the documents at their recorded rate times this factor (None: no replay).
+        auto_batch: Tune the batch size while the run goes, starting from batch_size.
+        max_retries: Retries per throttled request (0: no retries).
+        retry_backoff: Seconds of the first retry's backoff (it doubles with every retry).
+        retry_budget: Retries allowed per request across the run (None: unlimited).
+        batch_bytes: Bytes per encoded request body (None: batches bounded by documents only).
+        monitor_resources: Sample client and server resources into the time series.
+        reset: Have the driver remove what earlier trials ingested before its setup.
+
+    Returns:
+        A dictionary with total_docs_attempted, successful_docs, total_time, docs_per_sec,
+        concurrency, requests, max_in_flight, per_worker, <request_name>_latency, request_bytes, reader (or generator),
+        the driver's own settings and stats, stages, errors and error_details (plus throughput
+        and series when sampled, visibility and visibility_latency with the probe, replay when replayed,
+        auto_batch with the batch controller, retries with retrying, batch_bytes with a byte limit,
+        resources with the resource monitor).
+    """
+    concurrency = max(1, concurrency)
+    setup_error = None
+    if reset and type(driver).reset is BackendDriver.reset:
+        logger.warning(f"The {driver.name} driver cannot reset the backend; this run starts from what earlier runs left.")
+    elif reset:
+        setup_error = driver.reset()
+    setup_error = setup_error or driver.setup()
+    if setup_error:
+        return {"total_docs_attempted": 0, "successful_docs": 0, "total_time": 0, "docs_per_sec": 0, "errors": 1,
+                "error_details": [setup_error]}
+
+    counters = {"total_docs": 0}
+    errors = 0
+    error_details = []
+    send_stats = {"successful_docs": 0, "errors": 0, "error_details": [], "requests": 0, "max_in_flight": 0,
+                  "latency": LatencyHistogram()}
+
+    if visibility_every and type(driver).find_marker is BackendDriver.find_marker:
+        logger.warning(f"The {driver.name} driver cannot search for probe markers; visibility probe disabled.")
+        visibility_every = None
+    sampler = None
+    monitor = None
+    if series_interval and progress is None:
+        latencies = INGEST_LATENCIES + (("visibility",) if visibility_every else ()) + (("replay_lag",) if replay_speed else ())
+        progress = Progress(counters=INGEST_COUNTERS, latencies=latencies, gauges=INGEST_GAUGES)
+        monitor = ResourceMonitor(driver) if monitor_resources else None
+        sampler = TimeSeriesSampler(progress, series_interval, sources=[monitor] if monitor is not None else ())
+    probe = None
+    if visibility_every:
+        probe = VisibilityProbe(driver, every=visibility_every, poll_interval=visibility_poll_interval,
+                                timeout=visibility_timeout, progress=progress)
+    controller = BatchController(batch_size, concurrency=concurrency, max_bytes=batch_bytes) if auto_batch else None
+    sizes = BodySizes(driver.doc_size, batch_bytes)
+    stages = driver.stages = StageTimes()
+    batch_size = batch_size or math.inf  # 0: bounded by batch_bytes only
+    on_ack = None
+    if probe is not None or controller is not None:
+        def on_ack(body, doc_count, num_success, latency, error_details):
+            if probe is not None:
+                probe.acked(body, num_success > 0)
+            if controller is not None:
+                rejection = driver.rejection(error_details) if error_details else None
+                controller.record(doc_count, num_success, len(body), latency, rejection)
+    retry = RetryPolicy(max_retries, retry_backoff, retry_budget) if max_retries else None
+    dispatch = driver.dispatcher(concurrency)
+    if dispatch is None:
+        dispatch = lambda payloads, progress, on_ack, retry: send_with_threads(driver, payloads, concurrency, progress,
+                                                                               on_ack, retry)
+
+    if generator is not None:
+        reader = generator.lines(max_docs) if driver.raw else generator.docs(max_docs)
+    else:
+        reader = ShardedNDJSONReader(data_file, workers=reader_workers, ordered=reader_ordered, raw=driver.raw)
+    if replay_speed:
+        pacer = ReplayPacer(replay_speed, stop_event=stop_event, progress=progress)
+    else:
+        pacer = RatePacer(ingest_rate, stop_event=stop_event)
+    start_time_total = time.perf_counter()
+    if sampler is not None:
+        sampler.start()
+    if probe is not None:
+        probe.start()
+    try:
+        docs = itertools.islice(reader, max_docs) if max_docs else reader
+        if replay_speed:
+            batches = _replayed_batches(driver, docs, batch_size, counters, pacer, event_time_reader(driver.raw),
+                                        stop_event, probe, batch_wait or REPLAY_BATCH_WAIT, controller, sizes)
+        else:
+            batches = _encoded_batches(driver, docs, batch_size, counters, pacer, stop_event, probe, batch_wait,
+                                       controller, sizes)
+        send_stats = dispatch(batches, progress, on_ack, retry)
+    except FileNotFoundError:
+        errors += 1
+        error_details.append(f"Data file not found: {data_file}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during ingestion loop: {e}")
+        errors += counters["total_docs"] - send_stats["successful_docs"] - send_stats["errors"]
+        error_details.append(f"Unexpected Ingestion Loop Error: {e}")
+    total_time = time.perf_counter() - start_time_total
+    series = sampler.stop() if sampler is not None else None
+    visibility = probe.stop() if probe is not None else None  # Waits for the markers still outstanding
+
+    total_docs = counters["total_docs"]
+    successful_docs = send_stats["successful_docs"]
+    errors += send_stats["errors"]
+    error_details = send_stats["error_details"] + error_details
+    docs_per_sec = successful_docs / total_time if total_time > 0 else 0
+    latency = send_stats["latency"].summary()
+
+    logger.info(f"{driver.name} ingestion finished. Total Docs Attempted: {total_docs}, Successful: {successful_docs}, Errors: {errors}")
+    logger.info(f"Total Time: {total_time:.4f} seconds, Rate: {docs_per_sec:.2f} docs/sec, "
+                f"{send_stats['requests']} requests (max {send_stats['max_in_flight']} in flight)")
+    for w in send_stats.get("per_worker", []):
+        logger.info(f"  Worker {w['worker']}: {w['requests']} requests, {w['successful_docs']} docs, {w['docs_per_sec']:.2f} docs/sec, busy {w['busy_time']:.4f}s")
+    logger.info(f"{driver.request_name.capitalize()} request latency: p50 {latency['p50']:.4f}s, p99 {latency['p99']:.4f}s, max {latency['max']:.4f}s")
+    request_bytes = sizes.histogram.summary()
+    limit_note = ""
+    if batch_bytes:
+        limit_note = (f" (limit {format_size(sizes.limit)}: {sizes.byte_limited_batches} batches cut by bytes, "
+                      f"{sizes.over_limit_requests} over the limit, {sizes.oversized_docs} oversized documents)")
+    logger.info(f"{driver.request_name.capitalize()} body size: p50 {format_size(request_bytes['p50'])}, "
+                f"p99 {format_size(request_bytes['p99'])}, max {format_size(request_bytes['max'])}{limit_note}")
+
+    results = {
+        "total_docs_attempted": total_docs,
+        "successful_docs": successful_docs,
+        "total_time": total_time,
+        "docs_per_sec": docs_per_sec,
+        "concurrency": concurrency,
+        "requests": send_stats["requests"],
+        "max_in_flight": send_stats["max_in_flight"],
+    }
+    results.update(driver.describe())
+    if "per_worker" in send_stats:
+        results["per_worker"] = send_stats["per_worker"]
+    results[f"{driver.request_name}_latency"] = latency
+    results["request_bytes"] = request_bytes
+    if batch_bytes:
+        results["batch_bytes"] = sizes.stats()
+    if generator is not None:
+        results["generator"] = generator.stats()
+    else:
+        results["reader"] = reader.stats()
+    results.update(driver.stats(total_time))
+    results["stages"] = _stage_breakdown(stages, results, send_stats, reader, pacer, total_time, concurrency)
+    log_breakdown(results["stages"])
+    if visibility is not None:
+        results["visibility"], results["visibility_latency"] = visibility
+    if retry is not None:
+        results["retries"] = {
+            "first_attempt_docs": send_stats.get("first_attempt_docs", 0),
+            "retried_docs": send_stats.get("retried_docs", 0),
+            "failed_docs": errors,
+            **retry.stats(),
+        }
+        logger.info(f"Retries: {results['retries']['first_attempt_docs']} docs accepted on the first attempt, "
+                    f"{results['retries']['retried_docs']} after {retry.retries} retries, {errors} failed "
+                    f"({retry.budget_exhausted} retries refused by the budget, {retry.max_retries_reached} requests "
+                    f"out of retries)")
+    if controller is not None:
+        results["auto_batch"] = controller.stats()
+        if not controller.settled:
+            logger.info(f"Adaptive batching had not settled when ingestion ended; last batch size "
+                        f"{controller.batch_size()} documents.")
+    if replay_speed:
+        results["replay"] = replay = pacer.stats()
+        logger.info(f"Replay at {replay_speed:g}x: {replay['recorded_span']:.1f}s of recorded time in {replay['replay_time']:.1f}s "
+                    f"({replay['effective_speed']:.2f}x), lag p99 {replay['lag']['p99']:.3f}s, max {replay['lag']['max']:.3f}s, "
+                    f"{replay['late_batches']} of {replay['batches']} batches late")
+        if replay["untimed_docs"]:
+            logger.warning(f"{replay['untimed_docs']} documents had no usable timestamp and were sent with the one before them.")
+    results["errors"] = errors
+    results["error_details"] = error_details[:10]
+    if series is not None:
+        results["throughput"] = rate_summary(series, "ingested_docs_per_sec")
+        if monitor is not None:
+            results["resources"] = monitor.summary(series)
+            monitor.log_summary(results["resources"])
+        results["series"] = series
+    return results
+
+def _stage_breakdown(stages, results, send_stats, reader, pacer, total_time, concurrency):
+    """Puts the reader's, the pacer's, the dispatcher's and the driver's stage times together (see common/profiling.py)."""
+    if "generator" in results:
+        reading = {"generate": results["generator"]["generate_time"]}
+    elif reader.workers <= 1:
+        reader_stats = results["reader"]
+        reading = {"read": reader_stats["read_time"], "decode": reader_stats["decode_time"] - reader_stats["read_time"]}
+    else:
+        reading = {"read_wait": results["reader"]["wait_time"]}  # Decoded by the worker processes
+    timestamps = stages.get("timestamps")
+    reading.update(timestamps=timestamps, serialize=stages.get("encode") - timestamps)
+    sending = {}
+    if "compress_time" in send_stats:
+        reading["compress"] = send_stats["compress_time"]  # Compressed before the request is handed over
+    else:
+        sending["compress"] = results.get("compression", {}).get("cpu_seconds", 0.0)
+    reading.update(pacing=pacer.waited, handoff=send_stats.get("handoff_time", 0.0))
+    sending["response"] = stages.get("response")
+    return breakdown(reading, sending, total_time, send_stats.get("request_time", 0.0), concurrency)
+
+# --- Queries ---
+def run_queries(driver, queries_file, target_qps=None, duration=None, clients=1, order="round-robin",
+                stop_event=None, progress=None, passes=None, clear_cache=None):
+    """
+    Runs the query benchmark against any backend driver (see common/query_load.py).
+
+    Every query client (or open-loop sender) after the first gets its own
+    `driver.clone()`, so drivers with per-connection state never share a connection.
+
+    With `passes` every query runs once per pass and the first executions are
+    reported apart from the repeated ones, to tell cached from uncached latency.
+    `clear_cache` ("first" or "every") has the driver clear the backend's caches
+    before the first pass or before every pass.
+
+    Returns:
+        The results dict of run_query_load (total_queries, latency percentiles,
+        achieved_qps, errors, ...).
+    """
+    queries = []
+    try:
+        with open(queries_file, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                query = driver.parse_query(line)
+                if query is not None:
+                    queries.append(query)
+    except FileNotFoundError:
+        logger.error(f"Queries file not found: {queries_file}")
+        return {"total_queries": 0, "successful_queries": 0, "avg_latency": 0, "errors": 1}
+
+    if not queries:
+        logger.warning("No queries found in the queries file.")
+        return {"total_queries": 0, "successful_queries": 0, "avg_latency": 0, "errors": 0}
+
+    def make_execute(client_index):
+        return (driver if client_index == 0 else driver.clone()).run_query
+
+    before_pass = None
+    if clear_cache and type(driver).clear_cache is BackendDriver.clear_cache:
+        logger.warning(f"The {driver.name} driver cannot clear the backend's caches; they are left as they are.")
+    elif clear_cache:
+        def before_pass(pass_index):
+            if pass_index > 0 and clear_cache != "every":
+                return False
+            try:
+                driver.clear_cache()
+            except Exception as e:
+                logger.warning(f"Could not clear the {driver.name} caches before pass {pass_index + 1}: {e}")
+                return False
+            return True
+
+    return run_query_load(queries, make_execute, target_qps=target_qps, duration=duration, clients=clients, order=order,
+                          stop_event=stop_event, progress=progress, passes=passes, before_pass=before_pass)
@@ -0,0 +1,26 @@
+# JSON codec used on the hot path: orjson when installed, the standard library otherwise
+
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional speedup
+    orjson = None
+
+if orjson is not None:
+    CODEC = "orjson"
+    loads = orjson.loads
+
+    def dumps(obj):
+        """Serializes obj to compact JSON bytes."""
+        return orjson.dumps(obj)
+else:
+    CODEC = "json"
+    loads = json.loads
+
+    def dumps(obj):
+        """Serializes obj to compact JSON bytes."""
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+# Both codecs raise a subclass of this on malformed input
+JSONDecodeError = json.JSONDecodeError
@@ -0,0 +1,127 @@
+# HDR-style latency histogram with bounded memory and tail percentiles
+
+import math
+
+PERCENTILES = (50, 90, 99, 99.9)
+SUB_BUCKET_BITS = 7  # 128 sub-buckets per power of two: values are kept to within 1/128 (~0.8%)
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+_HALF = _SUB_BUCKETS >> 1
+_UNITS_PER_SECOND = 1_000_000  # Values are bucketed in microseconds
+
+def percentile_key(p):
+    """Result key for a percentile: 50 -> "p50", 99.9 -> "p99_9"."""
+    return "p" + f"{p:g}".replace(".", "_")
+
+def _bucket_index(value):
+    """Maps a non-negative integer to its log-linear bucket."""
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return _SUB_BUCKETS + (shift - 1) * _HALF + (value >> shift) - _HALF
+
+def _bucket_bounds(index):
+    """Returns the (lowest, highest) integer value that falls into a bucket."""
+    if index < _SUB_BUCKETS:
+        return index, index
+    shift, offset = divmod(index - _SUB_BUCKETS, _HALF)
+    shift += 1
+    low = (offset + _HALF) << shift
+    return low, low + (1 << shift) - 1
+
+class LatencyHistogram:
+    """
+    Records latencies (in seconds) into log-linear buckets, like HdrHistogram.
+
+    Each power-of-two range of microseconds is split into 64-128 linear
+    sub-buckets, so any percentile is reported to within ~1% of the true value
+    while memory stays bounded: an hour-long request still lands in one of
+    fewer than 2,000 buckets, however many values are recorded. Min, max, count
+    and mean are exact.
+
+    A histogram is not thread-safe; give each worker its own and `merge` them.
+    """
+
+    units = _UNITS_PER_SECOND  # Bucketed integer units per recorded value
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Records one latency in seconds."""
+        seconds = max(0.0, seconds)
+        index = _bucket_index(int(seconds * self.units))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        """Adds the values recorded by another histogram to this one and returns self."""
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @classmethod
+    def merged(cls, histograms):
+        """Returns a new histogram holding the values of all given histograms."""
+        result = cls()
+        for histogram in histograms:
+            result.merge(histogram)
+        return result
+
+    def percentile(self, p):
+        """
+        Returns the latency (seconds) at or below which `p` percent of the values fall.
+
+        The midpoint of the matching bucket is reported, clamped to the exact min and max.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                low, high = _bucket_bounds(index)
+                value = (low + high) / 2 / self.units
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        """
+        Returns the figures reported in the results: count, min, mean, p50, p90,
+        p99, p99_9 and max, all latencies in seconds.
+        """
+        s = {
+            "count": self.count,
+            "min": self.min if self.count else 0.0,
+            "mean": self.mean(),
+        }
+        for p in PERCENTILES:
+            s[percentile_key(p)] = self.percentile(p)
+        s["max"] = self.max
+        return s
+
+class SizeHistogram(LatencyHistogram):
+    """
+    Records sizes in bytes (such as request bodies) in the same log-linear buckets.
+
+    Sizes up to 128 bytes are exact, larger ones within 1/128; `summary()` reports
+    the same figures in bytes.
+    """
+
+    units = 1
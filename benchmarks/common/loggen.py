@@ -0,0 +1,271 @@
+# Seedable, vectorized synthetic log generator (replaces scripts/generate_log_data.sh and generate-line-log-data.sh)
+
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from . import fastjson
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "text")
+DEFAULT_CHUNK_LINES = 65536
+DEFAULT_LEVELS = {"INFO": 60, "DEBUG": 15, "WARN": 12, "ERROR": 8, "TRACE": 5}
+DEFAULT_MESSAGES = (
+    "User logged in successfully",
+    "Configuration updated",
+    "Service started",
+    "Request processed",
+    "Database connection failed",
+    "File not found",
+    "Invalid input received",
+    "Cache cleared",
+    "Processing data chunk",
+    "System health check OK",
+    "Timeout occurred",
+    "Memory usage high",
+    "Attempting to read file \"config.json\"",
+)
+_ALPHANUMERIC = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789", dtype=np.uint8)
+REQUEST_ID_LENGTH = 12
+
+def zipf_cdf(cardinality, exponent):
+    """Cumulative distribution of a Zipf law over ranks 1..cardinality (exponent 0 is uniform)."""
+    weights = 1.0 / np.arange(1, cardinality + 1, dtype=np.float64) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+def _object_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+class LogGenerator:
+    """
+    Generates synthetic log lines at several hundred thousand lines per second.
+
+    Every field is drawn from a vocabulary with NumPy: levels by weight, messages
+    uniformly, user IDs and client IPs from bounded Zipf distributions (a few hot
+    users and IPs, a long tail). Vocabulary entries are pre-encoded as bytes with the
+    JSON punctuation that follows them, so a chunk of lines is assembled with
+    one fancy-indexing step per field and a single `bytes.join`; nothing is
+    formatted per line. Timestamps advance by 1/rate seconds per line; each second's
+    prefix is formatted once per chunk.
+
+    The same seed always produces the same lines (for a fixed `start`).
+
+    NDJSON lines have the fields of generate_log_data.sh (timestamp, level, message,
+    user_id, source_ip); text lines the layout of generate-line-log-data.sh
+    (`2024-01-01 12:00:00.000 [INFO] client=IP request_id=ID : message`).
+    """
+
+    def __init__(self, seed=None, fmt="ndjson", levels=None, messages=None, users=1000, user_zipf=1.0,
+                 ips=10000, ip_zipf=1.0, start=None, rate=1000.0, chunk_lines=DEFAULT_CHUNK_LINES):
+        """
+        Args:
+            seed: Seed for the random generator (None: different data every run).
+            fmt: "ndjson" or "text".
+            levels: Mapping of level name to relative weight (default: DEFAULT_LEVELS).
+            messages: Message vocabulary, drawn uniformly (default: DEFAULT_MESSAGES).
+            users: Number of distinct user IDs (usr-1 ... usr-N).
+            user_zipf: Zipf exponent of the user ID popularity (0: uniform).
+            ips: Number of distinct client IPs.
+            ip_zipf: Zipf exponent of the client IP popularity (0: uniform).
+            start: Epoch seconds of the first timestamp (None: now).
+            rate: Lines per second of simulated time, i.e. the timestamp spacing.
+            chunk_lines: Lines generated per vectorized chunk.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+        levels = levels or DEFAULT_LEVELS
+        messages = list(messages or DEFAULT_MESSAGES)
+        if users < 1 or ips < 1 or not messages:
+            raise ValueError("users, ips and the message vocabulary must not be empty.")
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0.")
+        self.fmt = fmt
+        self.rate = rate
+        self.start = time.time() if start is None else start
+        self.chunk_lines = chunk_lines
+        self.rng = np.random.default_rng(seed)
+        self._generated = 0
+        self._stats = {"docs": 0, "bytes": 0, "generate_time": 0.0}
+
+        weights = np.array(list(levels.values()), dtype=np.float64)
+        self._level_cdf = np.cumsum(weights) / weights.sum()
+        self._user_cdf = zipf_cdf(users, user_zipf)
+        self._ip_cdf = zipf_cdf(ips, ip_zipf)
+        # Popularity rank -> value, so the hottest user is not always usr-1
+        user_ids = self.rng.permutation(users) + 1
+        ip_values = self.rng.integers(0, 2 ** 32, size=ips, dtype=np.uint64)
+        ip_strings = [f"{v >> 24}.{(v >> 16) & 255}.{(v >> 8) & 255}.{v & 255}" for v in ip_values.tolist()]
+
+        if fmt == "ndjson":
+            # Each entry carries the JSON punctuation up to the next field's value
+            self._ms = _object_array([f'.{ms:03d}Z","level":"'.encode() for ms in range(1000)])
+            self._levels = _object_array([json.dumps(name)[1:-1].encode() + b'","message":"' for name in levels])
+            self._messages = _object_array([json.dumps(m)[1:-1].encode() + b'","user_id":"' for m in messages])
+            self._users = _object_array([f'usr-{u}","source_ip":"'.encode() for u in user_ids.tolist()])
+            self._ips = _object_array([f'{ip}"}}\n'.encode() for ip in ip_strings])
+        else:
+            self._ms = _object_array([f'.{ms:03d} ['.encode() for ms in range(1000)])
+            self._levels = _object_array([f'{name}] client='.encode() for name in levels])
+            self._messages = _object_array([f' : {m}\n'.encode() for m in messages])
+            self._ips = _object_array([f'{ip} request_id='.encode() for ip in ip_strings])
+
+    def _second_prefixes(self, seconds):
+        fmt = '{"timestamp":"%Y-%m-%dT%H:%M:%S' if self.fmt == "ndjson" else '%Y-%m-%d %H:%M:%S'
+        return _object_array([datetime.fromtimestamp(s, timezone.utc).strftime(fmt).encode() for s in seconds.tolist()])
+
+    def _chunk(self, n):
+        """Generates the next n lines as one bytes object."""
+        rng = self.rng
+        index = np.arange(self._generated, self._generated + n, dtype=np.float64)
+        epoch_ms = np.floor(self.start * 1000 + index * (1000.0 / self.rate)).astype(np.int64)
+        seconds, second_index = np.unique(epoch_ms // 1000, return_inverse=True)
+        levels = np.searchsorted(self._level_cdf, rng.random(n), side="right")
+        messages = rng.integers(0, len(self._messages), size=n)
+        ips = np.searchsorted(self._ip_cdf, rng.random(n), side="right")
+
+        if self.fmt == "ndjson":
+            users = np.searchsorted(self._user_cdf, rng.random(n), side="right")
+            columns = (self._second_prefixes(seconds)[second_index], self._ms[epoch_ms % 1000], self._levels[levels],
+                       self._messages[messages], self._users[users], self._ips[ips])
+        else:
+            request_ids = _ALPHANUMERIC[rng.integers(0, len(_ALPHANUMERIC), size=(n, REQUEST_ID_LENGTH))]
+            columns = (self._second_prefixes(seconds)[second_index], self._ms[epoch_ms % 1000], self._levels[levels],
+                       self._ips[ips], request_ids.view(f"S{REQUEST_ID_LENGTH}").ravel().astype(object),
+                       self._messages[messages])
+        pieces = np.empty((n, len(columns)), dtype=object)
+        for i, column in enumerate(columns):
+            pieces[:, i] = column
+        self._generated += n
+        return b"".join(pieces.ravel().tolist())
+
+    def chunks(self, count=None):
+        """Yields bytes chunks of complete lines, `count` lines in total (None: forever)."""
+        remaining = count
+        while remaining is None or remaining > 0:
+            n = self.chunk_lines if remaining is None else min(self.chunk_lines, remaining)
+            chunk_start = time.perf_counter()
+            chunk = self._chunk(n)
+            self._stats["generate_time"] += time.perf_counter() - chunk_start
+            self._stats["docs"] += n
+            self._stats["bytes"] += len(chunk)
+            if remaining is not None:
+                remaining -= n
+            yield chunk
+
+    def lines(self, count=None):
+        """Yields raw lines (bytes, without the newline), like ShardedNDJSONReader(raw=True)."""
+        for chunk in self.chunks(count):
+            yield from chunk.split(b"\n")[:-1]
+
+    def docs(self, count=None):
+        """Yields decoded documents (NDJSON format only), like ShardedNDJSONReader."""
+        if self.fmt != "ndjson":
+            raise ValueError("Decoded documents are only available for the ndjson format.")
+        loads = fastjson.loads
+        for chunk in self.chunks(count):
+            yield from map(loads, chunk.split(b"\n")[:-1])
+
+    def write(self, output, count):
+        """Writes `count` lines to a binary file object."""
+        for chunk in self.chunks(count):
+            output.write(chunk)
+
+    def time_range(self, count):
+        """Returns the (first, last) epoch seconds of the next `count` lines."""
+        first = self.start + self._generated / self.rate
+        return first, first + (max(1, count) - 1) / self.rate
+
+    def stats(self):
+        """Returns the generator's own throughput, in the shape of the reader's stats."""
+        s = dict(self._stats)
+        s["format"] = self.fmt
+        s["generate_docs_per_sec"] = s["docs"] / s["generate_time"] if s["generate_time"] > 0 else 0
+        s["generate_mb_per_sec"] = s["bytes"] / (1024 * 1024) / s["generate_time"] if s["generate_time"] > 0 else 0
+        return s
+
+def load_config(path):
+    """Reads LogGenerator keyword arguments from a JSON file (e.g. {"seed": 1, "users": 100000, "user_zipf": 1.2})."""
+    with open(path) as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path}: the generator config must be a JSON object.")
+    return config
+
+def build_generator(count, config=None, **overrides):
+    """
+    Creates a LogGenerator for `count` lines from a config mapping (see load_config).
+
+    Unless the config sets `start`, the timestamps end now, so the data is recent
+    enough for backends that reject old entries. `start` may be epoch seconds or
+    an ISO 8601 string.
+    """
+    options = dict(config or {})
+    if "format" in options:
+        options["fmt"] = options.pop("format")
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    start = options.get("start")
+    if start is None:
+        options["start"] = time.time() - count / options.get("rate", 1000.0)
+    elif isinstance(start, str):
+        options["start"] = datetime.fromisoformat(start.replace("Z", "+00:00")).timestamp()
+    return LogGenerator(**options)
+
+def _parse_levels(value):
+    """argparse type for --levels: INFO=60,WARN=10,..."""
+    levels = {}
+    try:
+        for item in value.split(","):
+            name, weight = item.split("=")
+            levels[name.strip()] = float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid levels '{value}'. Use NAME=WEIGHT pairs, e.g. INFO=70,WARN=20,ERROR=10.")
+    return levels
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic log data (NDJSON or plain text) for the benchmark tools.")
+    parser.add_argument("-n", "--lines", type=int, default=1000, help="Number of lines to generate (default: 1000).")
+    parser.add_argument("-o", "--output", help="Output file (default: standard output).")
+    parser.add_argument("--format", choices=FORMATS, help="ndjson (fields of generate_log_data.sh) or text (layout of generate-line-log-data.sh) (default: ndjson).")
+    parser.add_argument("--seed", type=int, help="Random seed; the same seed and --start give the same data (default: random).")
+    parser.add_argument("--config", help="JSON file with generator settings (seed, format, levels, messages, users, user_zipf, ips, ip_zipf, start, rate); flags override it.")
+    parser.add_argument("--levels", type=_parse_levels, help=f"Level weights as NAME=WEIGHT pairs (default: {','.join(f'{k}={v}' for k, v in DEFAULT_LEVELS.items())}).")
+    parser.add_argument("--messages-file", help="File with the message vocabulary, one message per line (default: built-in messages).")
+    parser.add_argument("--users", type=int, help="Number of distinct user IDs (default: 1000).")
+    parser.add_argument("--user-zipf", type=float, help="Zipf exponent of user ID popularity; 0 is uniform (default: 1.0).")
+    parser.add_argument("--ips", type=int, help="Number of distinct client IPs (default: 10000).")
+    parser.add_argument("--ip-zipf", type=float, help="Zipf exponent of client IP popularity; 0 is uniform (default: 1.0).")
+    parser.add_argument("--start", help="ISO 8601 time of the first line (default: --lines / --rate seconds before now, so the data ends now).")
+    parser.add_argument("--rate", type=float, help="Lines per second of simulated time (default: 1000).")
+    args = parser.parse_args(argv)
+    if args.lines < 1:
+        parser.error("--lines must be at least 1.")
+
+    overrides = {key: getattr(args, key) for key in ("seed", "levels", "users", "user_zipf", "ips", "ip_zipf", "rate", "start")}
+    if args.messages_file:
+        with open(args.messages_file) as f:
+            overrides["messages"] = [line.rstrip("\n") for line in f if line.strip()]
+    try:
+        generator = build_generator(args.lines, load_config(args.config) if args.config else None, fmt=args.format, **overrides)
+    except (TypeError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.output:
+        with open(args.output, "wb") as f:
+            generator.write(f, args.lines)
+    else:
+        generator.write(sys.stdout.buffer, args.lines)
+    s = generator.stats()
+    print(f"Generated {s['docs']} {s['format']} lines ({s['bytes'] / (1024 * 1024):.1f} MB) in {s['generate_time']:.2f}s: "
+          f"{s['generate_docs_per_sec']:,.0f} lines/sec, {s['generate_mb_per_sec']:.1f} MB/sec", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Mixed workload: ingestion and queries running at the same time
+
+import logging
+import threading
+import time
+
+from .timeseries import INGEST_COUNTERS, INGEST_GAUGES, INGEST_LATENCIES, Progress, TimeSeriesSampler
+
+logger = logging.getLogger(__name__)
+
+# Live counters and latency streams reported by the engines in a mixed run
+MIXED_COUNTERS = (*INGEST_COUNTERS, "queries", "query_errors")
+MIXED_LATENCIES = (*INGEST_LATENCIES, "query")
+
+def run_mixed_workload(ingest, query, duration=None, interval=1.0, monitor=None):
+    """
+    Runs an ingestion engine and a query engine concurrently and samples both.
+
+    The run ends when ingestion finishes (data file exhausted or its document limit
+    reached) or when `duration` seconds have passed, whichever comes first. The
+    query engine keeps cycling through its queries until then.
+
+    Args:
+        ingest: Callable(progress, stop_event) running the ingestion benchmark and
+            returning its results dict. It must stop early once stop_event is set and
+            report "ingested_docs"/"ingest_errors" and "ingest_request" latencies to progress.
+        query: Callable(progress, stop_event) running the query benchmark until
+            stop_event is set and returning its results dict.
+        duration: Maximum run time in seconds (None: until ingestion finishes).
+        interval: Seconds between time-series samples.
+        monitor: Optional common.resources.ResourceMonitor sampled into the same series.
+
+    Returns:
+        A dictionary with mode, total_time, ingestion and queries (each engine's own
+        results) and series, the time-aligned samples of both engines (plus resources
+        with a monitor).
+    """
+    progress = Progress(counters=MIXED_COUNTERS, latencies=MIXED_LATENCIES, gauges=INGEST_GAUGES)
+    stop_event = threading.Event()
+    results = {}
+
+    def run(name, engine):
+        try:
+            results[name] = engine(progress, stop_event)
+        except Exception as e:
+            logger.error(f"Mixed workload {name} engine failed: {e}")
+            results[name] = {"errors": 1, "error_details": [f"Unexpected {name} error: {e}"]}
+        finally:
+            if name == "ingestion":
+                stop_event.set()  # Queries stop once there is nothing more to ingest
+
+    logger.info(f"Starting mixed workload ({f'{duration:g}s' if duration else 'until ingestion completes'}, sampling every {interval:g}s)")
+    sampler = TimeSeriesSampler(progress, interval, sources=[monitor] if monitor is not None else ()).start()
+    start_time = time.perf_counter()
+    ingest_thread = threading.Thread(target=run, args=("ingestion", ingest), name="mixed-ingest", daemon=True)
+    query_thread = threading.Thread(target=run, args=("queries", query), name="mixed-query", daemon=True)
+    ingest_thread.start()
+    query_thread.start()
+
+    stop_event.wait(duration)
+    stop_event.set()
+    ingest_thread.join()
+    query_thread.join()
+    total_time = time.perf_counter() - start_time
+    series = sampler.stop()
+
+    logger.info(f"Mixed workload finished after {total_time:.2f}s with {len(series)} samples")
+    mixed = {
+        "mode": "mixed",
+        "total_time": total_time,
+        "ingestion": results.get("ingestion", {}),
+        "queries": results.get("queries", {}),
+    }
+    if monitor is not None:
+        mixed["resources"] = monitor.summary(series)
+        monitor.log_summary(mixed["resources"])
+    mixed["series"] = series
+    return mixed
@@ -0,0 +1,278 @@
+# Sharded, memory-mapped NDJSON reader shared by the benchmark tools
+
+import logging
+import mmap
+import multiprocessing
+import os
+import queue
+import time
+from collections import deque
+
+from . import fastjson
+
+logger = logging.getLogger(__name__)
+
+# Decoded documents take several times the bytes of their lines, so the workers hand back
+# small shards and the bytes outstanding are capped, whatever the number of workers
+DEFAULT_SHARD_BYTES = 4 * 1024 * 1024  # Upper bound on the bytes decoded per shard task
+DEFAULT_WINDOW_BYTES = 16 * 1024 * 1024  # Bytes of the shards submitted but not yet consumed
+MIN_SHARD_BYTES = 256 * 1024  # Below this, handing shards between processes costs more than decoding them
+READ_CHUNK_BYTES = 64 * 1024  # Lines read at a time when decoding in-process
+MAX_INVALID_EXAMPLES = 5
+# Spawned (not forked) decoders, as the callers may already be running sender threads
+_MP_CONTEXT = multiprocessing.get_context('spawn')
+
+# --- Shard planning ---
+def find_shard_offsets(file_path, num_shards=None, shard_bytes=DEFAULT_SHARD_BYTES):
+    """
+    Splits a file into byte ranges that start and end on newline boundaries.
+
+    Args:
+        file_path: Path to the NDJSON file.
+        num_shards: Desired number of shards. If None it is derived from shard_bytes.
+        shard_bytes: Target shard size in bytes when num_shards is not given.
+
+    Returns:
+        A list of (start, end) byte offsets covering the whole file.
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+    if not num_shards:
+        num_shards = max(1, -(-size // shard_bytes))  # Ceiling division
+    num_shards = max(1, min(num_shards, size))
+
+    offsets = []
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        for i in range(1, num_shards):
+            boundary = max(start, size * i // num_shards)
+            newline = mm.find(b'\n', boundary)
+            if newline == -1:
+                break
+            end = newline + 1
+            if end > start:
+                offsets.append((start, end))
+                start = end
+        if start < size:
+            offsets.append((start, size))
+    return offsets
+
+# --- Shard decoding (runs in worker processes) ---
+def _decode_lines(lines, raw, docs, invalid_examples):
+    """Decodes lines into `docs` (or keeps the stripped line bytes when raw=True). Returns the number of invalid lines."""
+    invalid = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if raw:
+            docs.append(line)
+            continue
+        try:
+            docs.append(fastjson.loads(line))
+        except fastjson.JSONDecodeError as e:
+            invalid += 1
+            if len(invalid_examples) < MAX_INVALID_EXAMPLES:
+                invalid_examples.append(f"{line[:200]!r} - Error: {e}")
+    return invalid
+
+def _decode_shard(file_path, start, end, raw):
+    """
+    Decodes one byte range of the file.
+
+    Returns:
+        A tuple (docs, stats) where docs is a list of decoded documents (or raw
+        line bytes when raw=True) and stats describes the work done for this shard:
+        decode_time is all of it, read_time the part spent reading and splitting lines.
+    """
+    decode_start = time.perf_counter()
+    docs = []
+    invalid_examples = []
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[start:end]
+    lines = data.split(b'\n')
+    read_time = time.perf_counter() - decode_start
+    invalid = _decode_lines(lines, raw, docs, invalid_examples)
+    stats = {
+        "bytes": end - start,
+        "docs": len(docs),
+        "invalid": invalid,
+        "invalid_examples": invalid_examples,
+        "decode_time": time.perf_counter() - decode_start,
+        "read_time": read_time,
+    }
+    return docs, stats
+
+def _decode_shard_task(args):
+    return _decode_shard(*args)
+
+# --- Reader ---
+class ShardedNDJSONReader:
+    """
+    Reads an NDJSON file as memory-mapped byte-range shards.
+
+    With workers > 1 every shard is decoded in a worker process and handed back as
+    one batch of documents, either in file order (ordered=True) or as soon as it is
+    ready. Shards are at most `shard_bytes` and are shrunk so that `workers * prefetch`
+    of them fit in `window_bytes`; no more than `window_bytes` of shards are
+    outstanding, so memory stays bounded when the consumer is slower than the
+    decoders and does not grow with the number of workers. With workers <= 1 the
+    file is streamed in-process a few lines at a time.
+
+    The reader keeps its own statistics (see `stats()`) so the load generator's
+    read/decode throughput can be compared with the backend's ingest rate.
+    """
+
+    def __init__(self, file_path, workers=1, ordered=True, shard_bytes=DEFAULT_SHARD_BYTES, prefetch=2, raw=False,
+                 window_bytes=DEFAULT_WINDOW_BYTES):
+        """
+        Args:
+            file_path: Path to the NDJSON file.
+            workers: Number of decoder processes (<= 1 decodes in the calling process).
+            ordered: Yield shards in file order; otherwise yield them as they complete.
+            shard_bytes: Upper bound on the shard size in bytes.
+            prefetch: Shards queued per worker ahead of the consumer.
+            raw: Yield stripped line bytes instead of decoded JSON objects.
+            window_bytes: Bytes of the shards outstanding at once (submitted to the workers and not yet consumed).
+        """
+        self.file_path = str(file_path)
+        self.workers = max(1, workers)
+        self.ordered = ordered
+        self.prefetch = max(1, prefetch)
+        self.window_bytes = window_bytes
+        self.shard_bytes = max(MIN_SHARD_BYTES, min(shard_bytes, window_bytes // (self.workers * self.prefetch)))
+        self.raw = raw
+        self._stats = {
+            "shards": 0, "bytes": 0, "docs": 0, "invalid": 0,
+            "decode_time": 0.0, "read_time": 0.0, "wait_time": 0.0, "elapsed": 0.0,
+        }
+
+    def _record(self, shard_stats):
+        self._stats["shards"] += 1
+        self._stats["bytes"] += shard_stats["bytes"]
+        self._stats["docs"] += shard_stats["docs"]
+        self._stats["invalid"] += shard_stats["invalid"]
+        self._stats["decode_time"] += shard_stats["decode_time"]
+        self._stats["read_time"] += shard_stats["read_time"]
+        for example in shard_stats["invalid_examples"]:
+            logger.warning(f"Skipping invalid JSON line: {example}")
+
+    def _check_file(self):
+        if not os.path.isfile(self.file_path):
+            logger.error(f"Data file not found: {self.file_path}")
+            raise FileNotFoundError(self.file_path)
+
+    def iter_batches(self):
+        """Yields one list of documents per shard (with one worker, per chunk of lines read)."""
+        self._check_file()
+        start_time = time.perf_counter()
+        try:
+            if self.workers <= 1:
+                yield from self._iter_chunks()
+                return
+            offsets = find_shard_offsets(self.file_path, shard_bytes=self.shard_bytes)
+            # Make sure every worker gets something to do on smaller files
+            if len(offsets) < self.workers * self.prefetch:
+                offsets = find_shard_offsets(self.file_path, num_shards=self.workers * self.prefetch)
+            tasks = [(self.file_path, start, end, self.raw) for start, end in offsets]
+            if self.ordered:
+                yield from self._iter_pool_ordered(tasks)
+            else:
+                yield from self._iter_pool_unordered(tasks)
+        finally:
+            self._stats["elapsed"] = time.perf_counter() - start_time
+
+    def _iter_chunks(self):
+        """Streams the file in-process, READ_CHUNK_BYTES of lines at a time, like a line-by-line reader."""
+        with open(self.file_path, 'rb') as f:
+            while True:
+                chunk_start = time.perf_counter()
+                lines = f.readlines(READ_CHUNK_BYTES)
+                if not lines:
+                    break
+                read_time = time.perf_counter() - chunk_start
+                docs = []
+                invalid_examples = []
+                invalid = _decode_lines(lines, self.raw, docs, invalid_examples)
+                decode_time = time.perf_counter() - chunk_start
+                self._stats["wait_time"] += decode_time  # The consumer waits for every decode
+                self._record({"bytes": sum(map(len, lines)), "docs": len(docs), "invalid": invalid,
+                              "invalid_examples": invalid_examples, "decode_time": decode_time, "read_time": read_time})
+                yield docs
+
+    def _submit_window(self, tasks, pending_bytes, submit):
+        """
+        Submits tasks off the front of the `tasks` deque while their bytes fit in the
+        window (always one when none is pending). Returns the bytes now pending.
+        """
+        while tasks:
+            size = tasks[0][2] - tasks[0][1]
+            if pending_bytes and pending_bytes + size > self.window_bytes:
+                break
+            submit(tasks.popleft())
+            pending_bytes += size
+        return pending_bytes
+
+    def _iter_pool_ordered(self, tasks):
+        tasks = deque(tasks)
+        with _MP_CONTEXT.Pool(self.workers) as pool:
+            pending = deque()
+            submit = lambda task: pending.append((pool.apply_async(_decode_shard_task, (task,)), task[2] - task[1]))
+            pending_bytes = self._submit_window(tasks, 0, submit)
+            while pending:
+                wait_start = time.perf_counter()
+                result, size = pending.popleft()
+                docs, shard_stats = result.get()
+                self._stats["wait_time"] += time.perf_counter() - wait_start
+                pending_bytes = self._submit_window(tasks, pending_bytes - size, submit)
+                self._record(shard_stats)
+                yield docs
+
+    def _iter_pool_unordered(self, tasks):
+        tasks = deque(tasks)
+        done = queue.Queue()
+        with _MP_CONTEXT.Pool(self.workers) as pool:
+            outstanding = [0]
+
+            def submit(task):
+                pool.apply_async(_decode_shard_task, (task,), callback=done.put,
+                                 error_callback=lambda e: done.put(e))
+                outstanding[0] += 1
+
+            pending_bytes = self._submit_window(tasks, 0, submit)
+            while outstanding[0]:
+                wait_start = time.perf_counter()
+                result = done.get()
+                self._stats["wait_time"] += time.perf_counter() - wait_start
+                outstanding[0] -= 1
+                if isinstance(result, BaseException):
+                    raise result
+                docs, shard_stats = result
+                pending_bytes = self._submit_window(tasks, pending_bytes - shard_stats["bytes"], submit)
+                self._record(shard_stats)
+                yield docs
+
+    def __iter__(self):
+        """Yields documents one at a time."""
+        for batch in self.iter_batches():
+            yield from batch
+
+    def stats(self):
+        """
+        Returns the reader's own throughput figures.
+
+        `decode_docs_per_sec` and `decode_mb_per_sec` are what the decoders can deliver
+        on their own; `read_time` is the part of `decode_time` spent reading the shards
+        and splitting them into lines. `wait_time` is how long the consumer blocked waiting for the
+        reader; when `wait_fraction` approaches 1 the load generator, not the backend,
+        is the bottleneck.
+        """
+        s = dict(self._stats)
+        capacity_time = s["decode_time"] / self.workers
+        s["workers"] = self.workers
+        s["ordered"] = self.ordered
+        s["decode_docs_per_sec"] = s["docs"] / capacity_time if capacity_time > 0 else 0
+        s["decode_mb_per_sec"] = s["bytes"] / (1024 * 1024) / capacity_time if capacity_time > 0 else 0
+        s["wait_fraction"] = s["wait_time"] / s["elapsed"] if s["elapsed"] > 0 else 0
+        return s
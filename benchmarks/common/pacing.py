@@ -0,0 +1,137 @@
+# Rate pacing and timestamp replay for load generators
+
+import logging
+import time
+
+from .histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+class RatePacer:
+    """
+    Holds a producer to a target rate of units (documents, requests) per second.
+
+    Call `wait(units)` before sending each batch: it sleeps until the batch is due,
+    i.e. until start + units_sent_so_far / rate, then counts the batch as sent. A
+    producer that falls behind is not made to sleep, so the schedule never drifts
+    because of short stalls. With rate None (or 0) `wait` returns immediately.
+
+    If a `stop_event` is given the sleep ends as soon as it is set.
+    """
+
+    def __init__(self, rate=None, stop_event=None):
+        self.rate = rate
+        self.stop_event = stop_event
+        self.sent = 0
+        self.start = None
+        self.waited = 0.0  # Seconds slept in total
+
+    def wait(self, units=1):
+        """Sleeps until the next `units` are due and returns the seconds slept."""
+        if not self.rate:
+            return 0.0
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        delay = self.start + self.sent / self.rate - now
+        self.sent += units
+        if delay > 0:
+            if self.stop_event is not None:
+                self.stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+            self.waited += delay
+            return delay
+        return 0.0
+
+REPLAY_LAG_WARNING = 1.0  # Seconds behind schedule at which a replay reports that it cannot keep up
+
+class ReplayPacer:
+    """
+    Releases documents on the schedule they were originally logged at, `speed` times faster.
+
+    The first document with a timestamp anchors the schedule: a document logged t
+    seconds after it is due t / speed seconds after the replay started, so bursts,
+    lulls and diurnal curves in the data are reproduced at their original shape.
+    Timestamps that go backwards do not move the schedule back, and a document
+    without a timestamp is due with the one before it.
+
+    `wait_until(due)` sleeps until a batch is due. A batch released after its due
+    time records the difference as lag: the client (reading, encoding) or the
+    backend (through the bounded send queue) did not keep up with the recorded
+    rate. Lag is kept in a histogram, recorded as the `replay_lag` latency stream
+    of `progress` for the time series, and logged once it exceeds
+    REPLAY_LAG_WARNING seconds.
+    """
+
+    def __init__(self, speed=1.0, stop_event=None, progress=None):
+        self.speed = speed
+        self.stop_event = stop_event
+        self.progress = progress
+        self.start = None
+        self.first_event = None
+        self.last_event = None
+        self.untimed_docs = 0
+        self.batches = 0
+        self.late_batches = 0
+        self.lag = LatencyHistogram()
+        self.waited = 0.0  # Seconds slept in total
+        self._last_lag = 0.0
+        self._behind = False
+
+    def due(self, event_time):
+        """Returns the time.perf_counter() time at which a document logged at `event_time` (epoch seconds or None) is due."""
+        if event_time is None:
+            self.untimed_docs += 1
+            if self.start is None:
+                return time.perf_counter()
+        elif self.start is None:
+            self.start = time.perf_counter()
+            self.first_event = self.last_event = event_time
+        elif event_time > self.last_event:
+            self.last_event = event_time
+        return self.start + (self.last_event - self.first_event) / self.speed
+
+    def wait_until(self, due):
+        """Sleeps until `due` (a time.perf_counter() time) and returns the seconds the batch was released late."""
+        self.batches += 1
+        delay = due - time.perf_counter()
+        if delay > 0:
+            if self.stop_event is not None:
+                self.stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+            self.waited += delay
+            lag = 0.0
+        else:
+            lag = -delay
+        self.lag.record(lag)
+        self._last_lag = lag
+        if self.progress is not None:
+            self.progress.record("replay_lag", lag)
+        if lag >= REPLAY_LAG_WARNING:
+            self.late_batches += 1
+            if not self._behind:
+                self._behind = True
+                logger.warning(f"Replay is {lag:.1f}s behind the recorded schedule at {self.speed:g}x: "
+                               f"the client or the backend cannot keep up.")
+        elif self._behind and lag < REPLAY_LAG_WARNING / 2:
+            self._behind = False
+            logger.info("Replay caught up with the recorded schedule.")
+        return lag
+
+    def stats(self):
+        """Replay figures for the run results: the recorded span, how fast it was actually replayed and the lag."""
+        span = (self.last_event - self.first_event) if self.start is not None else 0.0
+        elapsed = time.perf_counter() - self.start if self.start is not None else 0.0
+        return {
+            "speed": self.speed,
+            "recorded_span": span,
+            "replay_time": elapsed,
+            "effective_speed": span / elapsed if elapsed > 0 else 0,
+            "batches": self.batches,
+            "late_batches": self.late_batches,
+            "final_lag": self._last_lag,
+            "lag": self.lag.summary(),
+            "untimed_docs": self.untimed_docs,
+        }
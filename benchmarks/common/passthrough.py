@@ -0,0 +1,81 @@
+# Helpers for building request bodies straight from raw NDJSON line bytes
+
+import re
+from functools import lru_cache
+
+from . import fastjson
+
+@lru_cache(maxsize=None)
+def _field_pattern(key):
+    """
+    Matches a top-level-looking "key": value pair with a string or number value.
+
+    The scan does not track nesting, so a nested field with the same name can match
+    when the top-level field is missing.
+    """
+    return re.compile(rb'"' + re.escape(key.encode()) + rb'"\s*:\s*(?:"((?:[^"\\]|\\.)*)"|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?))')
+
+# The timestamp fields the tools understand, in order of preference
+_TIMESTAMP_PATTERNS = [(key, _field_pattern(key)) for key in ('@timestamp', 'timestamp', 'time')]
+
+def splice_field(line, key, value):
+    """
+    Adds "key": value as the first member of a raw JSON object line.
+
+    The line is only decoded (with the fast codec) when it already contains the key
+    or does not look like a JSON object, since a duplicate key would be rejected by
+    the backend.
+
+    Args:
+        line: The raw JSON object as bytes.
+        key: The field name to add.
+        value: The field value (any JSON-serializable object).
+
+    Returns:
+        The new JSON object as bytes.
+    """
+    quoted_key = b'"' + key.encode() + b'"'
+    if line[:1] == b'{' and quoted_key not in line:
+        rest = line[1:].lstrip()
+        member = quoted_key + b':' + fastjson.dumps(value)
+        if rest[:1] == b'}':
+            return b'{' + member + rest
+        return b'{' + member + b',' + rest
+    doc = fastjson.loads(line)
+    doc[key] = value
+    return fastjson.dumps(doc)
+
+def extract_timestamp(line):
+    """
+    Finds the @timestamp/timestamp/time value of a raw JSON line without decoding it.
+
+    Returns:
+        The string or numeric value of the first field found, or None.
+    """
+    for key, pattern in _TIMESTAMP_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            return _match_value(match)
+    return None
+
+def extract_field(line, key):
+    """
+    Finds the string or numeric value of `key` in a raw JSON line without decoding it.
+
+    String values are returned as they appear in the line, escape sequences included.
+
+    Returns:
+        The value, or None if the field is missing or not a string or number.
+    """
+    match = _field_pattern(key).search(line)
+    return _match_value(match) if match else None
+
+def _match_value(match):
+    if match.group(1) is not None:
+        return match.group(1).decode('utf-8')
+    number = match.group(2)
+    return float(number) if (b'.' in number or b'e' in number or b'E' in number) else int(number)
+
+def json_string(line):
+    """Returns the raw line encoded as a JSON string literal (bytes)."""
+    return fastjson.dumps(line.decode('utf-8'))
@@ -0,0 +1,161 @@
+# Hot-path profiling: per-stage time accounting and a sampling profiler for the load generator
+
+import collections
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples of --profile
+TOP_FUNCTIONS = 15  # Functions logged at the end of a profiled run
+
+# --- Stage times ---
+class StageTimes:
+    """
+    Accumulates the seconds the ingestion pipeline spends in each of its stages.
+
+    Stages are timed once per batch or request, never per document, so the
+    accounting costs two clock reads and a lock per request and is always on.
+    The reading thread (reading, decoding, timestamps, serialization, pacing,
+    handing batches to the senders) and the senders (compression, the HTTP
+    request, response parsing) add to it from their own threads; `breakdown`
+    turns the totals into each stage's share of the time of the thread it ran on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = collections.Counter()
+
+    def add(self, stage, seconds):
+        """Adds `seconds` to `stage`. Thread-safe."""
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    def get(self, stage):
+        with self._lock:
+            return self.seconds[stage]
+
+def breakdown(reader, sender, wall_time, request_time, senders):
+    """
+    Builds the stage breakdown for the run results.
+
+    Args:
+        reader: Stage -> seconds on the reading thread; what they leave of `wall_time` is reported as "other".
+        sender: Stage -> seconds within the senders' requests; what they leave of `request_time` is "send".
+        wall_time: Seconds the reading thread ran (the ingestion's total time).
+        request_time: Seconds of all requests, summed over the senders.
+        senders: Number of requests kept in flight.
+
+    Returns:
+        {"wall_time", "reader": {stage: {"seconds", "share"}}, "sender": {...}, "senders", "sender_busy"},
+        each share being the stage's fraction of the reading thread's wall time or of the request time.
+    """
+    reader = {stage: seconds for stage, seconds in reader.items() if seconds > 0}
+    reader["other"] = max(0.0, wall_time - sum(reader.values()))
+    sender = {stage: seconds for stage, seconds in sender.items() if seconds > 0}
+    sender = {"send": max(0.0, request_time - sum(sender.values())), **sender}
+    share = lambda stages, total: {stage: {"seconds": seconds, "share": seconds / total if total > 0 else 0}
+                                   for stage, seconds in stages.items()}
+    return {
+        "wall_time": wall_time,
+        "reader": share(reader, wall_time),
+        "sender": share(sender, request_time),
+        "senders": senders,
+        "sender_busy": request_time / (wall_time * senders) if wall_time > 0 else 0,
+    }
+
+def log_breakdown(stages):
+    """Logs where the reading thread and the senders spent their time."""
+    format_stages = lambda group: ", ".join(f"{stage} {value['share']:.0%}" for stage, value in
+                                            sorted(group.items(), key=lambda item: -item[1]["seconds"]))
+    logger.info(f"Reading thread: {format_stages(stages['reader'])}")
+    logger.info(f"Senders ({stages['senders']}, {stages['sender_busy']:.0%} busy): {format_stages(stages['sender'])}")
+
+# --- Sampling profiler ---
+def _label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+class StackSampler:
+    """
+    A sampling profiler over every thread of the process, for --profile.
+
+    A daemon thread takes the stack of every other thread each `interval` seconds
+    (sys._current_frames), so sender threads and Loki's encoding thread show up
+    alongside the main thread, which cProfile would not see. Each sample counts
+    once for the function on top of the stack (self) and once for every function
+    on it (cumulative). `write` saves the samples as collapsed stacks
+    ("thread;outer;...;inner count" lines, the input of flamegraph.pl and
+    speedscope); the reader's worker processes are not sampled.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def top(self, limit=TOP_FUNCTIONS):
+        """Returns [(function, self share, cumulative share)] of the functions most often on top of a thread's stack."""
+        own = collections.Counter()
+        cumulative = collections.Counter()
+        for stack, count in self._stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                cumulative[label] += count
+        total = sum(self._stacks.values())
+        return [(label, count / total, cumulative[label] / total) for label, count in own.most_common(limit)]
+
+    def write(self, path):
+        """Writes the samples as collapsed stacks."""
+        with open(path, "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+def run_profiled(func, path, interval=PROFILE_INTERVAL):
+    """Runs `func()` under a StackSampler, writes the collapsed stacks to `path`, logs the hottest functions and returns func's result."""
+    sampler = StackSampler(interval)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        return func()
+    finally:
+        sampler.stop()
+        elapsed = time.perf_counter() - start
+        try:
+            sampler.write(path)
+            logger.info(f"Wrote {sampler.samples} stack samples ({elapsed:.1f}s every {interval * 1000:g}ms) to {path}")
+        except OSError as e:
+            logger.error(f"Failed to write profile {path}: {e}")
+        top = sampler.top()
+        if top:
+            logger.info("Hottest functions (self / cumulative share of thread samples):")
+            for label, own, cumulative in top:
+                logger.info(f"  {own:6.1%} {cumulative:6.1%}  {label}")
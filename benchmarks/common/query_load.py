@@ -0,0 +1,413 @@
+# Query load generation shared by the benchmark tools (closed and open loop)
+
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .histogram import LatencyHistogram, PERCENTILES, percentile_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_OUTSTANDING = 64  # Threads available to the open-loop dispatcher
+QUERY_ORDERS = ("round-robin", "shuffled")
+
+def latency_results(histogram):
+    """
+    Flattens a latency histogram into the result keys used by `run_queries`:
+    avg_latency, min_latency, max_latency and p50_latency ... p99_9_latency.
+    """
+    summary = histogram.summary()
+    results = {
+        "avg_latency": summary["mean"],
+        "min_latency": summary["min"],
+        "max_latency": summary["max"],
+    }
+    for p in PERCENTILES:
+        results[f"{percentile_key(p)}_latency"] = summary[percentile_key(p)]
+    return results
+
+def client_order(queries, client, clients, order="round-robin", seed=None):
+    """
+    Returns the order in which one client works through the query list.
+
+    round-robin: every client walks the list in file order, starting at an offset of
+        client * len(queries) / clients, so concurrent clients run different queries.
+    shuffled: every client gets its own random permutation (reproducible with `seed`).
+    """
+    if order not in QUERY_ORDERS:
+        raise ValueError(f"Unsupported query order '{order}'. Use one of: {', '.join(QUERY_ORDERS)}")
+    if order == "shuffled":
+        ordered = list(queries)
+        random.Random(None if seed is None else seed + client).shuffle(ordered)
+        return ordered
+    offset = client * len(queries) // max(1, clients)
+    return list(queries[offset:]) + list(queries[:offset])
+
+def _run_one(execute, query, index):
+    """Runs one query; returns True on success. Failures are logged, never raised."""
+    try:
+        if execute(query):
+            return True
+        logger.error(f"Query {index + 1} failed.")
+    except Exception as e:
+        logger.error(f"Query {index + 1} failed: {e}")
+    return False
+
+# --- Closed loop ---
+def _record(progress, ok, latency):
+    """Reports one finished query to the live progress counters, if any."""
+    if progress is None:
+        return
+    if ok:
+        progress.add("queries")
+        progress.record("query", latency)
+    else:
+        progress.add("query_errors")
+
+def _closed_loop_client(queries, execute, deadline, stats, stop_event=None, progress=None):
+    """Runs one client's queries back to back until the list is exhausted, the deadline passes or stop_event is set."""
+    cycle = deadline is not None or stop_event is not None
+    sequence = itertools.cycle(queries) if cycle else iter(queries)
+    for i, query in enumerate(sequence):
+        query_start = time.perf_counter()
+        if deadline is not None and query_start >= deadline:
+            break
+        if stop_event is not None and stop_event.is_set():
+            break
+        ok = _run_one(execute, query, i)
+        latency = time.perf_counter() - query_start
+        if ok:
+            stats["latency"].record(latency)
+        else:
+            stats["errors"] += 1
+        _record(progress, ok, latency)
+    stats["elapsed"] = time.perf_counter() - stats["start"]
+
+def run_closed_loop(queries, make_execute, clients=1, order="round-robin", duration=None, seed=None,
+                    stop_event=None, progress=None):
+    """
+    Runs `clients` concurrent closed-loop clients: each sends its next query when the
+    previous one returns.
+
+    Args:
+        queries: List of backend-specific query objects.
+        make_execute: Called once per client with the client index; returns the callable
+            that runs one query for that client (on its own connection) and returns True
+            on success (it may also raise).
+        clients: Number of concurrent clients.
+        order: "round-robin" or "shuffled", see `client_order`.
+        duration: Seconds each client keeps cycling through its queries. If None every
+            client runs its list once.
+        seed: Seed for the shuffled order.
+        stop_event: Optional threading.Event; when given, clients cycle through their
+            queries until it is set (or the duration passes).
+        progress: Optional common.timeseries.Progress receiving live query counts and latencies.
+
+    Returns:
+        A dictionary with successful_queries, errors, total_time, achieved_qps,
+        latency (the merged LatencyHistogram of the successful queries) and per_client.
+    """
+    clients = max(1, clients)
+    client_stats = [{"client": c, "errors": 0, "latency": LatencyHistogram(), "start": 0.0, "elapsed": 0.0}
+                    for c in range(clients)]
+    executors = [make_execute(c) for c in range(clients)]
+    start_time = time.perf_counter()
+    deadline = start_time + duration if duration is not None else None
+    for stats in client_stats:
+        stats["start"] = start_time
+
+    if clients == 1:
+        _closed_loop_client(client_order(queries, 0, 1, order, seed), executors[0], deadline, client_stats[0],
+                            stop_event, progress)
+    else:
+        logger.info(f"Running {clients} concurrent query clients ({order} order)")
+        threads = [
+            threading.Thread(target=_closed_loop_client,
+                             args=(client_order(queries, c, clients, order, seed), executors[c], deadline, client_stats[c],
+                                   stop_event, progress),
+                             name=f"query-client-{c}", daemon=True)
+            for c in range(clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    total_time = time.perf_counter() - start_time
+
+    latencies = LatencyHistogram.merged(s["latency"] for s in client_stats)
+    errors = sum(s["errors"] for s in client_stats)
+    per_client = []
+    for s in client_stats:
+        completed = s["latency"].count + s["errors"]
+        per_client.append({
+            "client": s["client"],
+            "queries": completed,
+            "errors": s["errors"],
+            "qps": completed / s["elapsed"] if s["elapsed"] > 0 else 0,
+            "p50_latency": s["latency"].percentile(50),
+            "p99_latency": s["latency"].percentile(99),
+        })
+    return {
+        "successful_queries": latencies.count,
+        "errors": errors,
+        "total_time": total_time,
+        "achieved_qps": (latencies.count + errors) / total_time if total_time > 0 else 0,
+        "latency": latencies,
+        "per_client": per_client,
+    }
+
+# --- Open loop ---
+def run_open_loop(queries, make_execute, target_qps, duration=None, max_outstanding=DEFAULT_MAX_OUTSTANDING,
+                  stop_event=None, progress=None):
+    """
+    Sends queries on a fixed schedule, independent of how fast the backend answers.
+
+    Query i is due at `start + i / target_qps`. A dispatcher thread hands each query to
+    a pool of `max_outstanding` sender threads at its due time. When the backend slows
+    down, queries queue up instead of being sent later, so the schedule is never stretched.
+    Latency is measured from the intended send time (correcting for coordinated
+    omission): it includes any time a query spent waiting for a free sender, as a real
+    user's request would. The time from actual send to response is reported separately
+    as service_time.
+
+    Args:
+        queries: List of backend-specific query objects, in schedule order.
+        make_execute: Called once per sender thread with its index; returns the callable
+            that runs one query on that sender's connection and returns True on success
+            (it may also raise).
+        target_qps: Queries per second to schedule.
+        duration: Seconds to keep sending, cycling through the query list. If None every
+            query is sent once.
+        max_outstanding: Number of sender threads, i.e. queries that can be in flight at once.
+        stop_event: Optional threading.Event; when given, queries are scheduled (cycling
+            through the list) until it is set or the duration passes.
+        progress: Optional common.timeseries.Progress receiving live query counts and latencies.
+
+    Returns:
+        A dictionary with target_qps, scheduled_queries, successful_queries, errors,
+        total_time, achieved_qps, max_send_delay, latency and service_time (LatencyHistograms).
+    """
+    if duration is None and stop_event is None:
+        schedule = enumerate(queries)
+    elif duration is None:
+        schedule = enumerate(itertools.cycle(queries))
+    else:
+        total = max(1, int(duration * target_qps))
+        schedule = zip(range(total), itertools.cycle(queries))
+    interval = 1.0 / target_qps
+    latencies = LatencyHistogram()
+    service_times = LatencyHistogram()
+    lock = threading.Lock()
+    counters = {"errors": 0, "max_send_delay": 0.0, "senders": 0, "scheduled": 0}
+    local = threading.local()
+
+    def sender_execute():
+        execute = getattr(local, "execute", None)
+        if execute is None:
+            with lock:
+                sender = counters["senders"]
+                counters["senders"] += 1
+            execute = local.execute = make_execute(sender)
+        return execute
+
+    def send(index, query, intended):
+        execute = sender_execute()
+        sent = time.perf_counter()
+        ok = _run_one(execute, query, index)
+        done = time.perf_counter()
+        with lock:
+            counters["max_send_delay"] = max(counters["max_send_delay"], sent - intended)
+            if ok:
+                latencies.record(done - intended)
+                service_times.record(done - sent)
+            else:
+                counters["errors"] += 1
+        _record(progress, ok, done - intended)
+
+    logger.info(f"Open-loop query load at {target_qps:g} qps with up to {max_outstanding} in flight")
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_outstanding, thread_name_prefix="query-sender") as executor:
+        for index, query in schedule:
+            intended = start_time + index * interval
+            delay = intended - time.perf_counter()
+            if stop_event is not None:
+                if stop_event.wait(max(0.0, delay)):
+                    break
+            elif delay > 0:
+                time.sleep(delay)
+            executor.submit(send, index, query, intended)
+            counters["scheduled"] += 1
+    total_time = time.perf_counter() - start_time
+
+    completed = latencies.count + counters["errors"]
+    achieved_qps = completed / total_time if total_time > 0 else 0
+    if achieved_qps < 0.95 * target_qps:
+        logger.warning(f"Achieved {achieved_qps:.2f} qps against a target of {target_qps:g} qps: "
+                       f"the backend (or the {max_outstanding} sender threads) could not keep up.")
+    return {
+        "target_qps": target_qps,
+        "scheduled_queries": counters["scheduled"],
+        "successful_queries": latencies.count,
+        "errors": counters["errors"],
+        "total_time": total_time,
+        "achieved_qps": achieved_qps,
+        "max_send_delay": counters["max_send_delay"],
+        "latency": latencies,
+        "service_time": service_times,
+    }
+
+# --- Cache passes ---
+def run_cache_passes(queries, make_execute, passes=2, clients=1, before_pass=None):
+    """
+    Runs every query once per pass, `passes` times, and reports the first pass apart from the others.
+
+    The first execution of a query finds the backend's caches empty (or as `before_pass`
+    left them), the later ones find whatever the earlier passes cached, so the first pass
+    measures the uncached path and the repeat passes the cached one. Within a pass each
+    query runs exactly once, spread over `clients` threads, so no query is repeated
+    before its pass is over.
+
+    Args:
+        queries: List of backend-specific query objects, run in this order in every pass.
+        make_execute: Called once per client thread with its index; returns the callable
+            that runs one query on that client's connection (see run_closed_loop).
+        passes: Number of passes (at least 2: one first and one repeat pass).
+        clients: Number of threads running a pass's queries concurrently.
+        before_pass: Optional callable(pass_index) run before each pass (0 is the first),
+            e.g. to clear the caches; returns True if it did something.
+
+    Returns:
+        A dictionary with successful_queries, errors, total_time, achieved_qps,
+        latency (LatencyHistogram of all passes), first and repeat (LatencyHistograms)
+        and per_pass.
+    """
+    clients = max(1, clients)
+    lock = threading.Lock()
+    local = threading.local()
+    counters = {"clients": 0}
+
+    def client_execute():
+        execute = getattr(local, "execute", None)
+        if execute is None:
+            with lock:
+                client = counters["clients"]
+                counters["clients"] += 1
+            execute = local.execute = make_execute(client)
+        return execute
+
+    def run(histogram, errors, index, query):
+        query_start = time.perf_counter()
+        ok = _run_one(client_execute(), query, index)
+        latency = time.perf_counter() - query_start
+        with lock:
+            if ok:
+                histogram.record(latency)
+            else:
+                errors[0] += 1
+
+    per_pass = []
+    histograms = []
+    total_errors = 0
+    query_time = 0.0
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients, thread_name_prefix="query-client") as executor:
+        for pass_index in range(passes):
+            cleared = bool(before_pass(pass_index)) if before_pass is not None else False
+            histogram = LatencyHistogram()
+            errors = [0]
+            pass_start = time.perf_counter()
+            list(executor.map(lambda item: run(histogram, errors, *item), enumerate(queries)))
+            pass_time = time.perf_counter() - pass_start
+            query_time += pass_time
+            histograms.append(histogram)
+            total_errors += errors[0]
+            per_pass.append({"pass": pass_index + 1, "cleared": cleared, "queries": histogram.count, "errors": errors[0],
+                             "time": pass_time, **latency_results(histogram)})
+            logger.info(f"Query pass {pass_index + 1}/{passes}{' (caches cleared)' if cleared else ''}: "
+                        f"p50 {histogram.percentile(50):.4f}s, p99 {histogram.percentile(99):.4f}s, {errors[0]} errors")
+    latencies = LatencyHistogram.merged(histograms)
+    return {
+        "successful_queries": latencies.count,
+        "errors": total_errors,
+        "total_time": time.perf_counter() - start_time,
+        "achieved_qps": (latencies.count + total_errors) / query_time if query_time > 0 else 0,
+        "latency": latencies,
+        "first": histograms[0],
+        "repeat": LatencyHistogram.merged(histograms[1:]),
+        "per_pass": per_pass,
+    }
+
+def cache_savings(first, repeat):
+    """What the repeat passes saved over the first one: the differences and ratios of mean, p50 and p99 latency."""
+    savings = {}
+    for key in ("avg_latency", "p50_latency", "p99_latency"):
+        name = key[:-len("_latency")]
+        savings[f"{name}_saved"] = first[key] - repeat[key]
+        savings[f"{name}_speedup"] = first[key] / repeat[key] if repeat[key] > 0 else 0
+    return savings
+
+def run_query_load(queries, make_execute, target_qps=None, duration=None, clients=1, order="round-robin", seed=None,
+                   stop_event=None, progress=None, passes=None, before_pass=None):
+    """
+    Runs the query load and returns the results dict reported by both tools' `run_queries`.
+
+    Closed loop by default, with `clients` concurrent clients. With target_qps set the
+    load is open loop instead, and `clients` is the number of sender threads (use
+    DEFAULT_MAX_OUTSTANDING unless told otherwise) so enough queries can be in flight to
+    hold the rate. With `passes` every query is run once per pass instead (see
+    run_cache_passes), and the first pass is reported apart from the repeat passes.
+
+    In a mixed workload `stop_event` and `progress` are passed through: the queries
+    cycle until the event is set and report live counts for the time series.
+    """
+    if passes:
+        schedule = client_order(queries, 0, 1, order, seed)
+        stats = run_cache_passes(schedule, make_execute, passes, clients=clients, before_pass=before_pass)
+        total_queries = stats["successful_queries"] + stats["errors"]
+    elif target_qps:
+        schedule = client_order(queries, 0, 1, order, seed)
+        stats = run_open_loop(schedule, make_execute, target_qps, duration=duration, max_outstanding=clients,
+                              stop_event=stop_event, progress=progress)
+        total_queries = stats["scheduled_queries"]
+    else:
+        stats = run_closed_loop(queries, make_execute, clients=clients, order=order, duration=duration, seed=seed,
+                                stop_event=stop_event, progress=progress)
+        total_queries = stats["successful_queries"] + stats["errors"]
+
+    results = {
+        "mode": "cache_passes" if passes else "open_loop" if target_qps else "closed_loop",
+        "query_clients": clients,
+        "total_queries": total_queries,
+        "successful_queries": stats["successful_queries"],
+    }
+    results.update(latency_results(stats["latency"]))
+    if target_qps:
+        results["target_qps"] = target_qps
+    results["achieved_qps"] = stats["achieved_qps"]
+    results["total_time"] = stats["total_time"]
+    if passes:
+        results["passes"] = passes
+        results["first_execution"] = {"queries": stats["first"].count, **latency_results(stats["first"])}
+        results["repeated_execution"] = {"queries": stats["repeat"].count, **latency_results(stats["repeat"])}
+        results["cache_savings"] = cache_savings(results["first_execution"], results["repeated_execution"])
+        results["per_pass"] = stats["per_pass"]
+    elif target_qps:
+        results["max_send_delay"] = stats["max_send_delay"]
+        results["service_time"] = stats["service_time"].summary()
+    elif clients > 1:
+        results["per_client"] = stats["per_client"]
+    results["errors"] = stats["errors"]
+
+    logger.info(f"Query benchmark finished ({results['mode']}, {clients} client(s)). Total Queries: {total_queries}, "
+                f"Successful: {results['successful_queries']}, Errors: {results['errors']}, Rate: {results['achieved_qps']:.2f} qps")
+    logger.info(f"Avg Latency: {results['avg_latency']:.4f}s, Min: {results['min_latency']:.4f}s, Max: {results['max_latency']:.4f}s")
+    logger.info("Percentiles: " + ", ".join(f"p{p:g} {results[percentile_key(p) + '_latency']:.4f}s" for p in PERCENTILES))
+    if passes:
+        first, repeated, savings = results["first_execution"], results["repeated_execution"], results["cache_savings"]
+        logger.info(f"First execution: p50 {first['p50_latency']:.4f}s, p99 {first['p99_latency']:.4f}s; "
+                    f"repeated ({passes - 1} more {'pass' if passes == 2 else 'passes'}): p50 {repeated['p50_latency']:.4f}s, p99 {repeated['p99_latency']:.4f}s "
+                    f"({savings['p50_speedup']:.2f}x faster at p50, {savings['avg_saved']:.4f}s saved per query on average)")
+    return results
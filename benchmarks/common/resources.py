@@ -0,0 +1,193 @@
+# Client and server resource sampling on the benchmark's time series
+
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+_PROC = "/proc"
+_PROMETHEUS_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{[^}]*\})?\s+(\S+)')
+
+# --- Client process (Linux /proc) ---
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+def _stat_fields(pid):
+    """The fields of /proc/<pid>/stat after the command name (state is field 0)."""
+    stat = _read(f"{_PROC}/{pid}/stat")
+    return stat[stat.rindex(")") + 2:].split()
+
+def _children(pid):
+    """Process ids of the direct children of `pid` (e.g. reader worker processes)."""
+    children = []
+    try:
+        for tid in os.listdir(f"{_PROC}/{pid}/task"):
+            children.extend(int(child) for child in _read(f"{_PROC}/{pid}/task/{tid}/children").split())
+    except OSError:
+        pass
+    return children
+
+class ClientResources:
+    """
+    Reads the load generator's own resource use from /proc.
+
+    CPU seconds (user + system) and resident memory cover this process and its
+    direct children (the reader worker processes); children that have already
+    exited are included through the process's cumulative child times. Network
+    bytes come from /proc/self/net/dev, which counts every interface (loopback
+    included, so traffic to a local stand-in shows) of the process's network
+    namespace, not this process alone. On systems without /proc nothing is sampled.
+    """
+
+    def __init__(self):
+        self.available = os.path.exists(f"{_PROC}/self/stat")
+        if not self.available:
+            logger.warning("/proc is not available; client resources are not sampled.")
+        self._ticks = os.sysconf("SC_CLK_TCK") if self.available else 100
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if self.available else 4096
+        self.pid = os.getpid()
+
+    def sample(self):
+        """Returns (counters, gauges): client_cpu_seconds, client_net_recv_bytes, client_net_sent_bytes and client_rss_bytes."""
+        if not self.available:
+            return {}, {}
+        fields = _stat_fields(self.pid)
+        ticks = sum(int(value) for value in fields[11:15])  # utime, stime, cutime, cstime
+        rss_pages = int(fields[21])
+        for child in _children(self.pid):
+            try:
+                child_fields = _stat_fields(child)
+            except (OSError, ValueError):
+                continue  # Exited since it was listed
+            ticks += int(child_fields[11]) + int(child_fields[12])
+            rss_pages += int(child_fields[21])
+        recv = sent = 0
+        for line in _read(f"{_PROC}/self/net/dev").splitlines()[2:]:
+            values = line.split(":", 1)[1].split()
+            recv += int(values[0])
+            sent += int(values[8])
+        counters = {"client_cpu_seconds": ticks / self._ticks, "client_net_recv_bytes": recv,
+                    "client_net_sent_bytes": sent}
+        return counters, {"client_rss_bytes": rss_pages * self._page_size}
+
+# --- Server stats ---
+def parse_prometheus(text):
+    """Sums the samples of each metric in a Prometheus text exposition across all of its label sets."""
+    totals = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _PROMETHEUS_SAMPLE.match(line)
+        if match:
+            try:
+                value = float(match.group(2))
+            except ValueError:
+                continue
+            totals[match.group(1)] = totals.get(match.group(1), 0.0) + value
+    return totals
+
+def pick_stats(values, counters, gauges):
+    """
+    Picks server metrics out of a flat mapping of source keys to numbers.
+
+    Args:
+        values: Source key -> number (e.g. parse_prometheus output).
+        counters: (column, source key, scale) of cumulative metrics.
+        gauges: (column, source key, scale) of current values.
+
+    Returns:
+        (counters, gauges) dicts of the metrics present, keyed by column.
+    """
+    pick = lambda spec: {column: values[key] * scale for column, key, scale in spec if key in values}
+    return pick(counters), pick(gauges)
+
+class ResourceMonitor:
+    """
+    A time-series source (see TimeSeriesSampler) sampling client and server resources.
+
+    Every sample reads the client process from /proc (ClientResources) and the
+    backend's own statistics through the driver's `server_stats` hook, such as
+    Elasticsearch's `_nodes/stats` or Loki's `/metrics`. Counters (CPU seconds,
+    bytes, indexed documents, rejections) get a `<name>_per_sec` rate in each row
+    and gauges (memory, queue lengths) are reported as-is, on the same rows and
+    timeline as the benchmark's throughput and latency. A failed server scrape
+    leaves its columns out of that row; the first failure is logged.
+    """
+
+    def __init__(self, driver=None):
+        """
+        Args:
+            driver: The BackendDriver whose `server_stats` are scraped (None: client only).
+        """
+        self.client = ClientResources()
+        self.driver = driver
+        self.server_errors = 0
+        self._first = {}  # First value of every counter
+
+    def sample(self):
+        """Returns (counters, gauges) of one sample of the client and the server."""
+        counters, gauges = self.client.sample()
+        if self.driver is not None:
+            try:
+                server = self.driver.server_stats()
+            except Exception as e:
+                server = None
+                self.server_errors += 1
+                if self.server_errors == 1:
+                    logger.warning(f"Could not read {self.driver.name} server stats: {e}")
+            if server is not None:
+                counters.update(server[0])
+                gauges.update(server[1])
+        for name, value in counters.items():
+            self._first.setdefault(name, value)
+        return counters, gauges
+
+    def summary(self, rows):
+        """
+        Summarizes the sampled series for the run results: the client's CPU (in cores),
+        peak memory and network bytes, and for every server counter its increase over
+        the run and for every server gauge its peak.
+        """
+        first = self._first
+        last = {}
+        peaks = {}
+        for row in rows:
+            for name, value in row.items():
+                if name.startswith(("client_", "server_")) and not name.endswith("_per_sec"):
+                    last[name] = value
+                    peaks[name] = max(peaks.get(name, value), value)
+        cores = [row["client_cpu_seconds_per_sec"] for row in rows[:-1] or rows if "client_cpu_seconds_per_sec" in row]
+        summary = {"client": {}, "server": {}}
+        if cores:
+            summary["client"] = {
+                "cpu_seconds": last["client_cpu_seconds"] - first.get("client_cpu_seconds", 0),
+                "cpu_cores_mean": sum(cores) / len(cores),
+                "cpu_cores_max": max(cores),
+                "cpu_count": os.cpu_count(),
+                "rss_max_bytes": peaks.get("client_rss_bytes"),
+                "net_recv_bytes": last["client_net_recv_bytes"] - first.get("client_net_recv_bytes", 0),
+                "net_sent_bytes": last["client_net_sent_bytes"] - first.get("client_net_sent_bytes", 0),
+            }
+        for name, value in last.items():
+            if name.startswith("server_"):
+                key = name[len("server_"):]
+                if name in first:
+                    summary["server"][key] = value - first[name]
+                else:
+                    summary["server"][f"{key}_max"] = peaks[name]
+        if self.server_errors:
+            summary["server_errors"] = self.server_errors
+        return summary
+
+    def log_summary(self, summary):
+        """Logs the client's CPU and the server's rejections, to tell a client-bound run from a server-bound one."""
+        client = summary["client"]
+        if client:
+            logger.info(f"Client CPU: {client['cpu_cores_mean']:.2f} cores mean, {client['cpu_cores_max']:.2f} max "
+                        f"(of {client['cpu_count']}), RSS max {client['rss_max_bytes'] / 1e6:.1f} MB")
+        server = summary["server"]
+        if server:
+            logger.info("Server: " + ", ".join(f"{key} {value:.0f}" if value == int(value) else f"{key} {value:.2f}"
+                                               for key, value in server.items()))
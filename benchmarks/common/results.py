@@ -0,0 +1,233 @@
+# Versioned result files and the cross-run regression comparison (`compare`)
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import socket
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+
+from . import fastjson
+from .trials import lookup
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+SECRET_PARAMETERS = ("password", "api_key")  # Never written to result files
+_PACKAGES = ("elasticsearch", "requests", "aiohttp", "orjson", "zstandard")
+
+# --- Result files ---
+def environment(backend=None):
+    """
+    Describes where a run happened: client host, Python, library versions and the
+    backend (server version etc., as reported by the tool).
+    """
+    packages = {}
+    for name in _PACKAGES:
+        try:
+            packages[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            continue
+    return {
+        "hostname": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "json_codec": fastjson.CODEC,
+        "packages": packages,
+        "backend": backend or {},
+    }
+
+def cli_parameters(args, **extra):
+    """Returns the parsed CLI arguments as a JSON-ready dict, without credentials."""
+    parameters = {key: str(value) if isinstance(value, Path) else value
+                  for key, value in vars(args).items() if key not in SECRET_PARAMETERS}
+    parameters.update(extra)
+    return parameters
+
+def build_result(tool, parameters, results, backend=None):
+    """
+    Wraps one run's results in the versioned result document.
+
+    Args:
+        tool: Name of the benchmark tool (e.g. "elasticsearch").
+        parameters: Every parameter of the run (see cli_parameters).
+        results: Dict with the run's "ingestion", "queries" and/or "mixed" results,
+            as returned by the tool's benchmark functions.
+        backend: Optional description of the backend (e.g. its version).
+
+    Returns:
+        A dictionary with schema_version, tool, created_at, parameters, environment and results.
+    """
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "tool": tool,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parameters": parameters,
+        "environment": environment(backend),
+        "results": results,
+    }
+
+def write_result(document, path):
+    """Writes a result document as indented JSON."""
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, default=str)
+        f.write("\n")
+    logger.info(f"Wrote results to {path}")
+
+def load_result(path):
+    """Reads a result document, checking that its schema version is supported."""
+    with open(path) as f:
+        document = json.load(f)
+    version = document.get("schema_version")
+    if version is None or version > SCHEMA_VERSION:
+        raise ValueError(f"{path}: unsupported result schema version {version!r} (this tool reads up to {SCHEMA_VERSION}).")
+    return document
+
+# --- Comparison ---
+# (metric path under "results", higher is better, time-series column holding per-interval samples)
+METRICS = (
+    ("ingestion.steady_state.docs_per_sec", True, "ingested_docs_per_sec"),
+    ("ingestion.docs_per_sec", True, "ingested_docs_per_sec"),
+    ("ingestion.bulk_latency.p99", False, "ingest_request_p99"),
+    ("ingestion.push_latency.p99", False, "ingest_request_p99"),
+    ("ingestion.visibility_latency.p99", False, "visibility_p99"),
+    ("ingestion.errors", False, None),
+    ("queries.achieved_qps", True, "queries_per_sec"),
+    ("queries.p50_latency", False, "query_p50"),
+    ("queries.p99_latency", False, "query_p99"),
+    ("queries.p99_9_latency", False, None),
+    ("queries.errors", False, None),
+)
+
+def _samples(results, path, column):
+    """Per-interval samples of a metric from the run's time series (the final partial interval is dropped)."""
+    if column is None:
+        return []
+    section = path.split(".", 1)[0]
+    series = results.get(section, {}).get("series") or results.get("mixed", {}).get("series") or []
+    stream = column.rsplit("_", 1)[0] if column.endswith(("_p50", "_p99")) else None
+    samples = []
+    for row in series[:-1] or series:
+        if column not in row or (stream and not row.get(f"{stream}_count")):
+            continue  # No requests completed in this interval
+        samples.append(row[column])
+    return samples
+
+def _metric(results, path, column):
+    """
+    Returns (value, samples) for a metric. For a run with several trials (--trials)
+    these are the trials' mean and per-trial values, otherwise the single value and
+    its per-interval samples.
+    """
+    trials = results.get("trials")
+    if trials:
+        values = [lookup(trial, path) for trial in trials]
+        if any(v is None for v in values):
+            return None, []
+        return sum(values) / len(values), values
+    return lookup(results, path), _samples(results, path, column)
+
+def permutation_p_value(a, b, rounds=2000, seed=0):
+    """
+    Two-sided permutation test on the difference of means of two sample lists.
+
+    Returns the share of random relabelings whose mean difference is at least as
+    large as the observed one. Needs no distributional assumptions (or SciPy).
+    """
+    observed = abs(sum(a) / len(a) - sum(b) / len(b))
+    pooled = list(a) + list(b)
+    rng = random.Random(seed)
+    extreme = 0
+    for _ in range(rounds):
+        rng.shuffle(pooled)
+        left, right = pooled[:len(a)], pooled[len(a):]
+        if abs(sum(left) / len(left) - sum(right) / len(right)) >= observed - 1e-12:
+            extreme += 1
+    return (extreme + 1) / (rounds + 1)
+
+def compare_results(baseline, candidate, threshold=5.0, alpha=0.05, min_samples=3):
+    """
+    Compares one candidate result document against a baseline.
+
+    A metric is a regression when it is worse than the baseline by more than
+    `threshold` percent and, if both runs have at least `min_samples` samples of
+    it (trials, or else per-interval samples), the difference is significant at
+    `alpha` (permutation test). Without samples the threshold alone decides.
+
+    Returns:
+        A list of dicts with metric, baseline, candidate, change_pct, p_value and
+        status ("regression", "improved", "ok" or "not significant").
+    """
+    rows = []
+    for path, higher_is_better, column in METRICS:
+        base, a = _metric(baseline["results"], path, column)
+        value, b = _metric(candidate["results"], path, column)
+        if base is None or value is None:
+            continue
+        if base:
+            change = (value - base) / abs(base) * 100
+        else:
+            change = 0.0 if value == base else math.inf
+        worse = -change if higher_is_better else change
+        p_value = permutation_p_value(a, b) if len(a) >= min_samples and len(b) >= min_samples else None
+        significant = p_value is None or p_value < alpha
+        if abs(change) <= threshold:
+            status = "ok"
+        elif not significant:
+            status = "not significant"
+        else:
+            status = "regression" if worse > 0 else "improved"
+        rows.append({"metric": path, "baseline": base, "candidate": value, "change_pct": change,
+                     "p_value": p_value, "status": status})
+    return rows
+
+def format_comparison(rows):
+    """Formats comparison rows as a fixed-width text table."""
+    if not rows:
+        return "  (no metrics in common)"
+    header = ("metric", "baseline", "candidate", "change", "p", "status")
+    cells = [(r["metric"], f"{r['baseline']:.4g}", f"{r['candidate']:.4g}", f"{r['change_pct']:+.1f}%",
+              "-" if r["p_value"] is None else f"{r['p_value']:.3f}", r["status"]) for r in rows]
+    widths = [max(len(h), *(len(c[i]) for c in cells)) for i, h in enumerate(header)]
+    lines = ["  " + "  ".join(h.ljust(w) for h, w in zip(header, widths)).rstrip()]
+    for c in cells:
+        lines.append("  " + "  ".join(cell.ljust(w) for cell, w in zip(c, widths)).rstrip())
+    return "\n".join(lines)
+
+def compare_main(argv, prog=None):
+    """
+    Entry point of the `compare` subcommand: compares every result file against the
+    first one and returns the exit status (1 if any metric regressed).
+    """
+    parser = argparse.ArgumentParser(prog=prog, description="Compare benchmark result files against a baseline and flag regressions.")
+    parser.add_argument("files", nargs="+", type=Path, help="Result files written with --results-file; the first one is the baseline.")
+    parser.add_argument("--threshold", type=float, default=5.0, help="Percent change beyond which a worse metric counts as a regression (default: 5).")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level for metrics with per-interval samples (default: 0.05).")
+    args = parser.parse_args(argv)
+    if len(args.files) < 2:
+        parser.error("compare needs a baseline and at least one other result file.")
+
+    try:
+        documents = [load_result(path) for path in args.files]
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read result file: {e}")
+        return 2
+
+    baseline = documents[0]
+    regressions = 0
+    for path, document in zip(args.files[1:], documents[1:]):
+        if document.get("tool") != baseline.get("tool"):
+            logger.warning(f"{path} was written by the {document.get('tool')} tool, the baseline by {baseline.get('tool')}.")
+        rows = compare_results(baseline, document, threshold=args.threshold, alpha=args.alpha)
+        regressions += sum(1 for r in rows if r["status"] == "regression")
+        print(f"\n{path} vs. {args.files[0]}:")
+        print(format_comparison(rows))
+
+    print(f"\n{regressions} regression(s) beyond {args.threshold:g}%.")
+    return 1 if regressions else 0
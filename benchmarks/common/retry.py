@@ -0,0 +1,82 @@
+# Retries of throttled requests: jittered exponential backoff under a retry budget
+
+import random
+import threading
+
+MAX_BACKOFF = 10.0  # Seconds; upper bound of a single backoff delay
+_BUDGET_RESERVE = 10  # Retries allowed before any request has been counted
+
+class RetryPolicy:
+    """
+    Decides whether and when a throttled request (HTTP 429, or items rejected by a
+    full write queue) is sent again.
+
+    The delay before retry n (n = 0, 1, ...) is drawn uniformly from
+    [0, min(MAX_BACKOFF, base_delay * 2**n)] ("full jitter"), so workers that were
+    throttled together do not come back together. A request is given up after
+    `max_retries` retries.
+
+    The retry budget keeps retries from multiplying the load on a backend that is
+    already overloaded: every first attempt earns `budget` retries (0.2: one retry
+    per five requests, plus a small reserve), and once they are spent, throttled
+    requests fail without being retried until more first attempts have been made.
+    Failures are then counted as permanent, so an overloaded run shows up as
+    failures instead of as an ever-growing retry queue.
+
+    One policy is shared by all workers of a run; its methods are thread-safe.
+    """
+
+    def __init__(self, max_retries=5, base_delay=0.1, budget=0.2, seed=None):
+        """
+        Args:
+            max_retries: Retries per request (0 disables retrying).
+            base_delay: Seconds of the first backoff; it doubles with every retry.
+            budget: Retries allowed per first attempt, across the run (None: unlimited).
+            seed: Optional seed for the jitter.
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.budget = budget
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.max_retries_reached = 0
+        self.backoff_time = 0.0
+
+    def request(self):
+        """Counts a first attempt, which earns `budget` retries."""
+        with self._lock:
+            self.requests += 1
+
+    def backoff(self, retry):
+        """
+        Returns the seconds to wait before retry number `retry` (0 for the first retry),
+        or None if the request should not be retried (retries or budget exhausted).
+        """
+        with self._lock:
+            if retry >= self.max_retries:
+                if self.max_retries:
+                    self.max_retries_reached += 1
+                return None
+            if self.budget is not None and self.retries >= self.budget * self.requests + _BUDGET_RESERVE:
+                self.budget_exhausted += 1
+                return None
+            self.retries += 1
+            delay = self._random.uniform(0, min(MAX_BACKOFF, self.base_delay * 2 ** retry))
+            self.backoff_time += delay
+            return delay
+
+    def stats(self):
+        """Retry counts for the run results."""
+        with self._lock:
+            return {
+                "max_retries": self.max_retries,
+                "base_delay": self.base_delay,
+                "budget": self.budget,
+                "retries": self.retries,
+                "max_retries_reached": self.max_retries_reached,
+                "budget_exhausted": self.budget_exhausted,
+                "backoff_time": self.backoff_time,
+            }
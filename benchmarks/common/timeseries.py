@@ -0,0 +1,180 @@
+# Live progress counters and the sampler that turns them into time-aligned series
+
+import csv
+import json
+import logging
+import math
+import threading
+import time
+
+from .histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Live counters, gauges and latency streams reported by the ingestion engines
+INGEST_COUNTERS = ("ingested_docs", "ingested_bytes", "ingest_errors")
+INGEST_GAUGES = ("requests_in_flight",)
+INGEST_LATENCIES = ("ingest_request",)
+
+class Progress:
+    """
+    Thread-safe live counters and per-interval latency histograms.
+
+    Engines call `add` and `record` as work completes; a TimeSeriesSampler
+    periodically collects them. Declaring the counter and latency names up front
+    keeps every sample row's columns the same from the first interval on.
+
+    Gauges are counters that go up and down (e.g. requests in flight, via
+    `add(name, 1)` and `add(name, -1)`); they are sampled as-is, without a rate.
+    Each call takes one short lock, so engines report once per request, never per document.
+    """
+
+    def __init__(self, counters=(), latencies=(), gauges=()):
+        self._lock = threading.Lock()
+        self._counters = {name: 0 for name in (*counters, *gauges)}
+        self.gauges = frozenset(gauges)
+        self._latency_names = list(latencies)
+        self._latencies = {name: LatencyHistogram() for name in latencies}
+
+    def add(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self._latencies.get(name)
+            if histogram is None:
+                self._latency_names.append(name)
+                histogram = self._latencies[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def collect(self):
+        """Returns (counters, latencies): cumulative counter values and the histograms recorded since the last call."""
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = self._latencies
+            self._latencies = {name: LatencyHistogram() for name in self._latency_names}
+        return counters, latencies
+
+class TimeSeriesSampler:
+    """
+    Samples a Progress object every `interval` seconds on a background thread.
+
+    Each row holds `t` (seconds since start), every counter's cumulative value and
+    its `<name>_per_sec` rate over the interval, every gauge's current value, and
+    for every latency stream the interval's `<name>_count`, `<name>_p50`,
+    `<name>_p99` and `<name>_max`.
+
+    `sources` are further objects sampled into the same rows (such as the
+    ResourceMonitor in common/resources.py): their `sample()` returns (counters,
+    gauges), and their counters get rates like the Progress counters.
+    """
+
+    def __init__(self, progress, interval=1.0, sources=()):
+        self.progress = progress
+        self.interval = interval
+        self.sources = list(sources)
+        self.rows = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+        self._last_time = None
+        self._last_counters = {}
+
+    def start(self):
+        for source in self.sources:
+            self._last_counters.update(source.sample()[0])  # Baseline of the first interval's rates
+        self._start = self._last_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="timeseries-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        now = time.perf_counter()
+        counters, latencies = self.progress.collect()
+        elapsed = now - self._last_time
+        row = {"t": round(now - self._start, 3)}
+        for name, value in counters.items():
+            row[name] = value
+            if name not in self.progress.gauges:
+                row[f"{name}_per_sec"] = (value - self._last_counters.get(name, 0)) / elapsed if elapsed > 0 else 0
+        for name, histogram in latencies.items():
+            row[f"{name}_count"] = histogram.count
+            row[f"{name}_p50"] = histogram.percentile(50)
+            row[f"{name}_p99"] = histogram.percentile(99)
+            row[f"{name}_max"] = histogram.max
+        for source in self.sources:
+            source_counters, source_gauges = source.sample()
+            for name, value in source_counters.items():
+                row[name] = value
+                previous = self._last_counters.get(name, value)
+                row[f"{name}_per_sec"] = (value - previous) / elapsed if elapsed > 0 else 0
+            row.update(source_gauges)
+            counters.update(source_counters)
+        self._last_time = now
+        self._last_counters = counters
+        self.rows.append(row)
+        return row
+
+    def stop(self):
+        """Stops sampling, records the final partial interval and returns all rows."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if time.perf_counter() - self._last_time > self.interval / 10:
+            self._sample()
+        return self.rows
+
+def rate_summary(rows, column):
+    """
+    Summarizes how a per-interval rate varied over a run: min, mean, max, stddev and
+    the number of intervals in which it dropped to zero (stalls), ignoring the final
+    partial interval.
+    """
+    values = [row[column] for row in rows[:-1] or rows if column in row]
+    if not values:
+        return {"intervals": 0, "min": 0, "mean": 0, "max": 0, "stddev": 0, "stalled_intervals": 0}
+    mean = sum(values) / len(values)
+    return {
+        "intervals": len(values),
+        "min": min(values),
+        "mean": mean,
+        "max": max(values),
+        "stddev": math.sqrt(sum((v - mean) ** 2 for v in values) / len(values)),
+        "stalled_intervals": sum(1 for v in values if v == 0),
+    }
+
+def write_series(rows, path):
+    """Writes sample rows to `path`: CSV if it ends in .csv, NDJSON (one row per line) otherwise."""
+    path = str(path)
+    with open(path, "w", newline="") as f:
+        if path.endswith(".csv"):
+            columns = list(dict.fromkeys(column for row in rows for column in row))  # Streams may appear mid-run
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+    logger.info(f"Wrote {len(rows)} time-series samples to {path}")
+
+def format_series(rows, columns=None):
+    """Formats sample rows as a fixed-width text table (all columns unless `columns` is given)."""
+    if not rows:
+        return "  (no samples)"
+    columns = columns or list(rows[0].keys())
+    cells = [[_format_cell(row.get(column, "")) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(r[i]) for r in cells)) for i, column in enumerate(columns)]
+    lines = ["  " + "  ".join(column.rjust(width) for column, width in zip(columns, widths))]
+    for r in cells:
+        lines.append("  " + "  ".join(cell.rjust(width) for cell, width in zip(r, widths)))
+    return "\n".join(lines)
+
+def _format_cell(value):
+    if isinstance(value, float):
+        return f"{value:.4f}" if value < 10 else f"{value:.1f}"
+    return str(value)
@@ -0,0 +1,156 @@
+# Repeated trials: warmup exclusion, steady-state detection and confidence intervals
+
+import argparse
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Two-sided 95% Student t critical values by degrees of freedom (1-30); 1.96 beyond
+_T95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+
+# Metrics summarized across trials (paths into one trial's results)
+TRIAL_METRICS = (
+    "ingestion.steady_state.docs_per_sec",
+    "ingestion.docs_per_sec",
+    "ingestion.bulk_latency.p99",
+    "ingestion.push_latency.p99",
+    "ingestion.visibility_latency.p99",
+    "queries.achieved_qps",
+    "queries.p50_latency",
+    "queries.p90_latency",
+    "queries.p99_latency",
+    "queries.p99_9_latency",
+)
+
+def parse_warmup(value):
+    """
+    argparse type for --warmup: "2" means two discarded warmup trials, "30s" means
+    the first 30 seconds of every trial are excluded. Returns (trials, seconds).
+    """
+    try:
+        if value.endswith("s"):
+            seconds = float(value[:-1])
+            if seconds < 0:
+                raise ValueError
+            return 0, seconds
+        trials = int(value)
+        if trials < 0:
+            raise ValueError
+        return trials, 0.0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid warmup '{value}'. Use a number of trials (e.g. 2) or seconds (e.g. 30s).")
+
+def lookup(results, path):
+    """Returns the number at a dotted path in a results dict, or None."""
+    value = results
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def steady_state(rows, column, warmup_seconds=0.0, window=5, tolerance=0.1):
+    """
+    Finds where a per-interval rate settles and averages it from there on.
+
+    Rows up to `warmup_seconds` are dropped first. Steady state starts at the first
+    interval from which `window` consecutive samples have a coefficient of variation
+    (stddev / mean) of at most `tolerance`. The final, partial interval is ignored.
+
+    Returns:
+        A dictionary with detected (False if the rate never settled, in which case
+        every row after the warmup is used), start (seconds into the run),
+        intervals and the mean rate as docs_per_sec.
+    """
+    rows = [row for row in (rows[:-1] or rows) if row["t"] > warmup_seconds and column in row]
+    values = [row[column] for row in rows]
+    start = None
+    for i in range(len(values) - window + 1):
+        sample = values[i:i + window]
+        mean = sum(sample) / window
+        if mean > 0 and math.sqrt(sum((v - mean) ** 2 for v in sample) / window) / mean <= tolerance:
+            start = i
+            break
+    detected = start is not None
+    if not detected:
+        logger.warning(f"No steady state found in {len(values)} intervals (window {window}, tolerance {tolerance:.0%}); "
+                       "averaging every interval after the warmup. Run longer or use a shorter --series-interval.")
+    steady = values[start:] if detected else values
+    return {
+        "detected": detected,
+        "start": rows[start]["t"] if detected else (rows[0]["t"] if rows else 0.0),
+        "intervals": len(steady),
+        "docs_per_sec": sum(steady) / len(steady) if steady else 0.0,
+    }
+
+def confidence_interval(values):
+    """Returns mean, stddev and the 95% confidence interval of the mean (Student t) of a sample."""
+    n = len(values)
+    mean = sum(values) / n if n else 0.0
+    if n < 2:
+        return {"mean": mean, "stddev": 0.0, "ci95_low": mean, "ci95_high": mean}
+    stddev = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+    t = _T95[n - 2] if n - 1 <= len(_T95) else 1.96
+    half_width = t * stddev / math.sqrt(n)
+    return {"mean": mean, "stddev": stddev, "ci95_low": mean - half_width, "ci95_high": mean + half_width}
+
+def summarize_trials(trials, metrics=TRIAL_METRICS):
+    """
+    Summarizes the recorded trials' results metric by metric.
+
+    Returns:
+        A dictionary mapping each metric path present in every trial to its mean,
+        stddev, 95% confidence interval, relative CI half-width (ci95_pct) and the
+        per-trial values.
+    """
+    summary = {}
+    for path in metrics:
+        values = [lookup(trial, path) for trial in trials]
+        if not values or any(v is None for v in values):
+            continue
+        s = confidence_interval(values)
+        s["ci95_pct"] = (s["ci95_high"] - s["mean"]) / s["mean"] * 100 if s["mean"] else 0.0
+        s["values"] = values
+        summary[path] = s
+    return summary
+
+def run_trials(run_once, trials=1, warmup_trials=0):
+    """
+    Runs `warmup_trials` discarded trials followed by `trials` recorded ones.
+
+    Args:
+        run_once: Callable(trial, warmup) running one full trial and returning its results.
+        trials: Number of recorded trials.
+        warmup_trials: Number of trials run first and discarded.
+
+    Returns:
+        The list of recorded trials' results.
+    """
+    for i in range(warmup_trials):
+        logger.info(f"=== Warmup trial {i + 1}/{warmup_trials} (discarded) ===")
+        run_once(i, True)
+    recorded = []
+    for i in range(trials):
+        if trials > 1:
+            logger.info(f"=== Trial {i + 1}/{trials} ===")
+        recorded.append(run_once(i, False))
+    return recorded
+
+def trial_path(path, trial, trials):
+    """Output path for one trial's file: `series.csv` becomes `series-trial2.csv` when there are several trials."""
+    if path is None or trials <= 1:
+        return path
+    return path.with_name(f"{path.stem}-trial{trial + 1}{path.suffix}")
+
+def format_trial_summary(summary):
+    """Formats summarize_trials output, one metric per line: mean ± CI half-width (low .. high)."""
+    if not summary:
+        return "  (no metrics recorded in every trial)"
+    lines = []
+    for path, s in summary.items():
+        lines.append(f"  {path}: {s['mean']:.4f} ± {s['ci95_high'] - s['mean']:.4f} ({s['ci95_pct']:.1f}%), "
+                     f"95% CI {s['ci95_low']:.4f} .. {s['ci95_high']:.4f}, stddev {s['stddev']:.4f}")
+    return "\n".join(lines)
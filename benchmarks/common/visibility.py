@@ -0,0 +1,130 @@
+# Time-to-searchable probe: how long after a request is acknowledged its documents can be found
+
+import itertools
+import logging
+import os
+import threading
+import time
+
+from .histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+MARKER_FIELD = "benchmark_marker"  # Field added to the sampled documents
+
+class VisibilityProbe:
+    """
+    Measures the ack-to-searchable latency of sampled documents during ingestion.
+
+    Every `every`-th document gets a unique marker (`tag`, called on the reading
+    thread). When the request carrying it is acknowledged (`acked`), the marker is
+    queued for a background thread that polls the backend (the driver's
+    `find_marker`) every `poll_interval` seconds until the marker is found or
+    `timeout` seconds have passed. The latency is taken from the acknowledgement to
+    the start of the first poll that finds the marker, so it is accurate to one
+    poll interval. Polling runs on its own driver clone, so it adds a light,
+    steady query load of at most one query per outstanding marker per interval.
+    """
+
+    def __init__(self, driver, every=10000, poll_interval=0.1, timeout=60.0, progress=None):
+        self.driver = driver
+        self.every = max(1, every)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.progress = progress
+        self.latency = LatencyHistogram()
+        self._run_id = f"{os.getpid():x}{int(time.time()) & 0xffffff:x}"
+        self._docs = 0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._batches = {}  # id(body) -> (body, [(marker, doc), ...]) for requests not yet acknowledged
+        self._pending = []  # (marker, doc, ack_time) waiting to become visible
+        self._counts = {"sampled": 0, "acked": 0, "visible": 0, "timed_out": 0, "failed_requests": 0}
+        self._finish = threading.Event()
+        self._thread = None
+
+    # --- Reading thread ---
+    def tag(self, doc, batch_markers):
+        """Marks every `every`-th document; the marker is appended to `batch_markers`. Returns the (possibly new) document."""
+        self._docs += 1
+        if self._docs % self.every:
+            return doc
+        marker = f"probe{self._run_id}n{next(self._sequence)}"  # One token for every analyzer
+        doc = self.driver.tag(doc, marker)
+        batch_markers.append((marker, doc))
+        return doc
+
+    def register(self, body, batch_markers):
+        """Associates the markers of one batch with its request body."""
+        if batch_markers:
+            with self._lock:
+                self._batches[id(body)] = (body, batch_markers)
+                self._counts["sampled"] += len(batch_markers)
+
+    # --- Sending threads ---
+    def acked(self, body, ok=True):
+        """Called once the request for `body` has completed; starts polling for its markers if it succeeded."""
+        if not self._batches:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            entry = self._batches.pop(id(body), None)
+            if entry is None:
+                return
+            if not ok:
+                self._counts["failed_requests"] += 1
+                return
+            self._counts["acked"] += len(entry[1])
+            self._pending.extend((marker, doc, now) for marker, doc in entry[1])
+
+    # --- Polling thread ---
+    def start(self):
+        self._thread = threading.Thread(target=self._run, args=(self.driver.clone(),), name="visibility-probe", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, driver):
+        while True:
+            finishing = self._finish.is_set()
+            with self._lock:
+                pending, self._pending = self._pending, []
+            still_pending = []
+            for marker, doc, ack_time in pending:
+                poll_start = time.perf_counter()
+                try:
+                    found = driver.find_marker(marker, doc)
+                except Exception as e:
+                    logger.warning(f"Visibility poll for {marker} failed: {e}")
+                    found = False
+                if found:
+                    latency = max(0.0, poll_start - ack_time)
+                    self.latency.record(latency)
+                    self._counts["visible"] += 1
+                    if self.progress is not None:
+                        self.progress.record("visibility", latency)
+                elif poll_start - ack_time >= self.timeout:
+                    self._counts["timed_out"] += 1
+                    logger.warning(f"Marker {marker} not searchable {self.timeout:g}s after its request was acknowledged.")
+                else:
+                    still_pending.append((marker, doc, ack_time))
+            with self._lock:
+                self._pending = still_pending + self._pending
+                if finishing and not self._pending:
+                    return
+            time.sleep(self.poll_interval)
+
+    def stop(self):
+        """Waits until every acknowledged marker was found or timed out and returns the results."""
+        if self._thread is not None:
+            self._finish.set()
+            self._thread.join()
+        counts = dict(self._counts)
+        counts["every"] = self.every
+        counts["poll_interval"] = self.poll_interval
+        latency = self.latency.summary()
+        if counts["visible"]:
+            logger.info(f"Time to searchable: p50 {latency['p50']:.4f}s, p99 {latency['p99']:.4f}s, max {latency['max']:.4f}s "
+                        f"({counts['visible']}/{counts['acked']} markers found, {counts['timed_out']} timed out)")
+        else:
+            logger.warning(f"No sampled document became searchable ({counts['acked']} acknowledged, {counts['timed_out']} timed out).")
+        return counts, latency
@@ -0,0 +1,8 @@
+# Makes the shared benchmark modules in benchmarks/common importable as `common`
+# when the tool is run with `python -m src.cli` from its own directory.
+import os
+import sys
+
+_BENCHMARKS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if _BENCHMARKS_DIR not in sys.path:
+    sys.path.insert(0, _BENCHMARKS_DIR)
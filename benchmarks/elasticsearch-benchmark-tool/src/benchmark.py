@@ -1,267 +1,189 @@
 # Core benchmarking logic (indexing, searching)
 
 import time
-import json
 import logging
-from datetime import datetime, timezone  # Import datetime and timezone
+import threading
 from elasticsearch import Elasticsearch, helpers, exceptions
+from common import core
+from common.mixed import run_mixed_workload
+from common.ndjson_reader import ShardedNDJSONReader
+from common.resources import ResourceMonitor
+from common.timestamps import build_timestamp_mapper
+from .driver import ElasticsearchDriver
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # --- Helper function to read NDJSON data ---
-def read_ndjson(file_path):
-    """Reads an NDJSON file line by line and yields JSON objects."""
-    try:
-        with open(file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    try:
-                        yield json.loads(line)
-                    except json.JSONDecodeError as e:
-                        logger.warning(f"Skipping invalid JSON line: {line} - Error: {e}")
-    except FileNotFoundError:
-        logger.error(f"Data file not found: {file_path}")
-        raise
+def read_ndjson(file_path, workers=1, ordered=True):
+    """Reads an NDJSON file with the shared sharded reader and yields JSON objects."""
+    yield from ShardedNDJSONReader(file_path, workers=workers, ordered=ordered)
 
 # --- Ingestion Benchmark Function ---
-def run_ingestion(client: Elasticsearch, index_name: str, data_file: str, batch_size: int = 1000):
+def run_ingestion(client: Elasticsearch, index_name: str, data_file: str, batch_size: int = 1000, workers: int = 1,
+                  reader_workers: int = 1, reader_ordered: bool = True, passthrough: bool = False,
+                  compression: str = "none", compression_level: int = None, max_docs: int = None,
+                  ingest_rate: float = None, stop_event: threading.Event = None, progress=None,
+                  series_interval: float = None, visibility_every: int = None, visibility_poll_interval: float = 0.1,
+                  visibility_timeout: float = 60.0, generator=None, timestamp_mode: str = "now",
+                  timestamp_span: float = None, replay_speed: float = None, auto_batch: bool = False,
+                  max_retries: int = 0, retry_backoff: float = 0.1, retry_budget: float = 0.2,
+                  batch_bytes: int = None, monitor_resources: bool = False, reset: bool = False):
     """
     Runs the bulk ingestion benchmark, adding a @timestamp field to each document.
 
+    @timestamp is the time of ingestion by default. The other timestamp modes keep
+    each document's own timestamp, or shift the dataset's timeline to end now,
+    optionally compressed into `timestamp_span` seconds (see common/timestamps.py).
+
+    The load itself is generated by the shared core (common/core.py): batches are
+    read and encoded on the calling thread and handed to `workers` bulk worker
+    threads, so up to `workers` bulk requests are in flight at any time. This
+    function only configures the ElasticsearchDriver, which also creates the index
+    (see driver.py for passthrough and compression).
+
     Args:
         client: An initialized Elasticsearch client instance.
         index_name: The name of the index to ingest into.
         data_file: Path to the NDJSON data file.
         batch_size: Number of documents per bulk request.
+        workers: Number of concurrent bulk requests to keep in flight.
+        reader_workers: Number of processes decoding the data file (see common/ndjson_reader.py).
+        reader_ordered: Whether decoded shards are consumed in file order.
+        passthrough: Build bulk bodies from the raw line bytes instead of decoded documents.
+        compression: Request-body compression, "none", "gzip" or "zstd".
+        compression_level: Compression level (None for the algorithm's default).
+        max_docs: Stop after this many documents (None: the whole file).
+        ingest_rate: Target documents per second (None: as fast as possible).
+        stop_event: Optional threading.Event that stops the producer at the next batch.
+        progress: Optional common.timeseries.Progress receiving live counts and latencies.
+        series_interval: Seconds between throughput samples (None: no time series).
+        visibility_every: Tag every Nth document and measure its time to searchable (None: off).
+        visibility_poll_interval: Seconds between searches for each outstanding marker.
+        visibility_timeout: Seconds after which a marker that never showed up counts as timed out.
+        generator: Optional common.loggen.LogGenerator streamed instead of reading data_file (requires max_docs).
+        timestamp_mode: How @timestamp is set: "now", "original", "rebase" or "compress".
+        timestamp_span: Seconds the dataset is compressed into (compress mode).
+        replay_speed: Send the documents on the schedule of their own timestamps, this many times
+            faster (None: as fast as ingest_rate allows). Lag behind the schedule is reported under `replay`.
+        auto_batch: Tune the documents and bytes per request from the measured throughput, latency
+            and 413/429 rejections, starting from batch_size (see common/autobatch.py).
+        max_retries: Retries per throttled request (429 or rejected bulk items); 0 disables retrying.
+        retry_backoff: Seconds of the first retry's backoff, doubling with every retry (jittered).
+        retry_budget: Retries allowed per request across the run (None: unlimited).
+        batch_bytes: Bytes per encoded bulk request, enforced while batches are assembled (None: no
+            byte limit; with batch_size 0 batches are bounded by bytes only).
+        monitor_resources: Sample client resources and the nodes' _nodes/stats into the time series
+            (needs series_interval; see common/resources.py).
+        reset: Delete the index first, so the run starts from an empty index (one per trial).
 
     Returns:
-        A dictionary containing benchmark results (e.g., total_docs, total_time, docs_per_sec, errors).
+        A dictionary containing benchmark results (e.g., total_docs, total_time, docs_per_sec, errors),
+        including a per-worker breakdown and the reader's own throughput.
     """
-    logger.info(f"Starting ingestion benchmark for index '{index_name}' from file '{data_file}' with batch size {batch_size}")
-
-    # --- FIX: Remove explicit exists check, rely on create with ignore=400 ---
-    try:
-        # Attempt to create the index, ignore error if it already exists
-        logger.info(f"Ensuring index '{index_name}' exists (create if not present)...")
-        create_response = client.indices.create(index=index_name, ignore=400)
-        if create_response.get('acknowledged', False):
-            logger.info(f"Index '{index_name}' created or already existed.")
-        elif create_response.get('status') == 400 and 'resource_already_exists_exception' in str(create_response):
-            logger.info(f"Index '{index_name}' already exists.")
-        else:
-            # Log unexpected non-400 errors from create
-            logger.warning(f"Index creation check returned unexpected response: {create_response}")
-
-    # --- FIX: Catch specific exceptions related to index creation/check ---
-    except exceptions.AuthenticationException as e:
-        logger.error(f"Authentication error during index check/create for '{index_name}': {e}")
-        return {"total_docs_attempted": 0, "successful_docs": 0, "total_time": 0, "docs_per_sec": 0, "errors": 1, "error_details": [f"Authentication Error: {e}"]}
-    except exceptions.ConnectionError as e:
-        logger.error(f"Connection error during index check/create for '{index_name}': {e}")
-        return {"total_docs_attempted": 0, "successful_docs": 0, "total_time": 0, "docs_per_sec": 0, "errors": 1, "error_details": [f"Connection Error: {e}"]}
-    except exceptions.RequestError as e:
-        logger.error(f"Error ensuring index '{index_name}' exists: {e}")
-        return {"total_docs_attempted": 0, "successful_docs": 0, "total_time": 0, "docs_per_sec": 0, "errors": 1, "error_details": [str(e)]}
-    except Exception as e:
-        logger.error(f"Unexpected error during index setup for '{index_name}': {e}")
-        return {"total_docs_attempted": 0, "successful_docs": 0, "total_time": 0, "docs_per_sec": 0, "errors": 1, "error_details": [f"Unexpected Setup Error: {e}"]}
-
-    actions = []
-    total_docs = 0
-    successful_docs = 0
-    errors = 0
-    error_details = []
-    start_time_total = time.perf_counter()
-
+    source = "the synthetic log generator" if generator is not None else f"file '{data_file}'"
+    logger.info(f"Starting ingestion benchmark for index '{index_name}' from {source} with batch size {batch_size} and {workers} worker(s)")
     try:
-        for doc in read_ndjson(data_file):
-            # --- FIX: Add @timestamp field ---
-            # Get current time in UTC and format as ISO 8601 string with 'Z' for UTC
-            now_utc = datetime.now(timezone.utc)
-            timestamp_str = now_utc.strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:-3] + 'Z'  # Format with milliseconds and Z
-            doc['@timestamp'] = timestamp_str
-
-            actions.append({"_index": index_name, "_source": doc})
-            total_docs += 1
-
-            if len(actions) >= batch_size:
-                try:
-                    success_count, failed_items = helpers.bulk(
-                        client,
-                        actions,
-                        chunk_size=batch_size,
-                        raise_on_error=False,    # Don't raise on individual doc errors
-                        raise_on_exception=True, # Raise on transport errors (like connection/4xx/5xx)
-                        stats_only=False         # Get detailed results to see errors
-                    )
-                    num_success = success_count
-                    num_failed = len(failed_items)  # helpers.bulk returns list of failed actions
-                    chunk_errors = []
-                    if num_failed > 0:
-                        # Extract reasons from failed items
-                        for item_result in failed_items:
-                            # Structure might be {'index': {'_index': '...', 'status': 400, 'error': {...}}}
-                            action_type = list(item_result.keys())[0]  # e.g., 'index'
-                            error_info = item_result.get(action_type, {}).get('error', {})
-                            reason = error_info.get('reason', 'Unknown bulk error')
-                            chunk_errors.append(f"{action_type.upper()}: {reason}")  # Add action type
-
-                    successful_docs += num_success
-                    errors += num_failed
-                    if chunk_errors:
-                        error_details.extend(chunk_errors)
-                        logger.warning(f"Bulk chunk finished with {num_failed} errors. Examples: {chunk_errors[:3]}")
-
-                except exceptions.TransportError as e:
-                    # This includes connection errors, timeouts, and non-2xx responses if raise_on_exception=True
-                    logger.error(f"Bulk request transport error: {getattr(e, 'info', e)} - Status: {getattr(e, 'status_code', 'N/A')}")
-                    # Add specific error info if available
-                    error_info_str = str(getattr(e, 'info', e))
-                    errors += len(actions)  # Assume all failed if transport error occurs
-                    error_details.append(f"TransportError ({getattr(e, 'status_code', 'N/A')}): {error_info_str}")
-                except Exception as e:  # Catch other potential bulk errors
-                    logger.error(f"Unexpected error during bulk processing: {e}", exc_info=True)  # Log traceback
-                    errors += len(actions)
-                    error_details.append(f"Unexpected Bulk Error: {e}")
-
-                actions = []  # Clear actions after processing batch
-                if errors == 0:
-                    logger.info(f"Processed batch: {successful_docs} successful docs so far.")
-                else:
-                    logger.info(f"Processed batch: {successful_docs} successful, {errors} errors so far.")
-
-        # Ingest remaining actions
-        if actions:
-            try:
-                success_count, failed_items = helpers.bulk(
-                    client,
-                    actions,
-                    chunk_size=len(actions),  # Process remaining
-                    raise_on_error=False,
-                    raise_on_exception=True,
-                    stats_only=False
-                )
-                num_success = success_count
-                num_failed = len(failed_items)
-                chunk_errors = []
-                if num_failed > 0:
-                    for item_result in failed_items:
-                        action_type = list(item_result.keys())[0]
-                        error_info = item_result.get(action_type, {}).get('error', {})
-                        reason = error_info.get('reason', 'Unknown bulk error')
-                        chunk_errors.append(f"{action_type.upper()}: {reason}")
-
-                    successful_docs += num_success
-                    errors += num_failed
-                    if chunk_errors:
-                        error_details.extend(chunk_errors)
-                        logger.warning(f"Final bulk chunk finished with {num_failed} errors. Examples: {chunk_errors[:3]}")
-
-            except exceptions.TransportError as e:
-                logger.error(f"Final bulk request transport error: {getattr(e, 'info', e)} - Status: {getattr(e, 'status_code', 'N/A')}")
-                error_info_str = str(getattr(e, 'info', e))
-                errors += len(actions)
-                error_details.append(f"TransportError ({getattr(e, 'status_code', 'N/A')}): {error_info_str}")
-            except Exception as e:  # Catch other potential bulk errors
-                logger.error(f"Unexpected error during final bulk processing: {e}", exc_info=True)
-                errors += len(actions)
-                error_details.append(f"Unexpected Bulk Error: {e}")
-
-    except FileNotFoundError:
-        return {"total_docs_attempted": 0, "successful_docs": 0, "total_time": 0, "docs_per_sec": 0, "errors": 1, "error_details": [f"Data file not found: {data_file}"]}
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during ingestion loop: {e}")
-        errors += len(actions)
-        error_details.append(f"Unexpected Ingestion Loop Error: {e}")
-
-    end_time_total = time.perf_counter()
-    total_time = end_time_total - start_time_total
-    docs_per_sec = successful_docs / total_time if total_time > 0 else 0
-
-    logger.info(f"Ingestion finished. Total Docs Attempted: {total_docs}, Successful: {successful_docs}, Errors: {errors}")
-    logger.info(f"Total Time: {total_time:.4f} seconds, Rate: {docs_per_sec:.2f} docs/sec")
-
-    return {
-        "total_docs_attempted": total_docs,
-        "successful_docs": successful_docs,
-        "total_time": total_time,
-        "docs_per_sec": docs_per_sec,
-        "errors": errors,
-        "error_details": error_details[:10] if len(error_details) > 10 else error_details
-    }
+        timestamps = build_timestamp_mapper(timestamp_mode, timestamp_span, data_file=data_file, generator=generator,
+                                            count=max_docs)
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot set up the '{timestamp_mode}' timestamps: {e}")
+        return {"total_docs_attempted": 0, "successful_docs": 0, "total_time": 0, "docs_per_sec": 0, "errors": 1,
+                "error_details": [f"Timestamp Setup Error: {e}"]}
+    driver = ElasticsearchDriver(client, index_name, passthrough=passthrough, compression=compression,
+                                 compression_level=compression_level, timestamps=timestamps)
+    return core.run_ingestion(driver, data_file, batch_size=batch_size, concurrency=workers, reader_workers=reader_workers,
+                              reader_ordered=reader_ordered, max_docs=max_docs, ingest_rate=ingest_rate,
+                              stop_event=stop_event, progress=progress, series_interval=series_interval,
+                              visibility_every=visibility_every, visibility_poll_interval=visibility_poll_interval,
+                              visibility_timeout=visibility_timeout,
+                              generator=generator, replay_speed=replay_speed, auto_batch=auto_batch,
+                              max_retries=max_retries, retry_backoff=retry_backoff, retry_budget=retry_budget,
+                              batch_bytes=batch_bytes, monitor_resources=monitor_resources, reset=reset)
 
 # --- Query Benchmark Function ---
-def run_queries(client: Elasticsearch, index_name: str, queries_file: str):
+def run_queries(client: Elasticsearch, index_name: str, queries_file: str, target_qps: float = None,
+                duration: float = None, clients: int = 1, order: str = "round-robin",
+                stop_event: threading.Event = None, progress=None, passes: int = None, clear_cache: str = None,
+                request_cache: bool = None):
     """
-    Runs the search query benchmark.
+    Runs the search query benchmark; each line of the queries file is a `query_string` query.
+
+    By default `clients` concurrent clients each run the queries back to back (closed
+    loop). With target_qps set they are sent on a fixed schedule instead (open loop,
+    see common/query_load.py), and latency is measured from each query's intended
+    send time. Every client draws its own pooled connection from the client's
+    transport, so the pool must hold at least `clients` connections per node.
+
+    With `passes` every query runs once per pass, and the first executions (cold
+    caches) are reported apart from the repeated ones (warm caches).
 
     Args:
         client: An initialized Elasticsearch client instance.
         index_name: The name of the index to search against.
         queries_file: Path to the file containing queries (one per line).
+        target_qps: Queries per second for the open-loop mode (None for closed loop).
+        duration: Run time in seconds, cycling through the queries (None for one pass).
+        clients: Concurrent query clients (open loop: sender threads).
+        order: Order in which each client runs the queries, "round-robin" or "shuffled".
+        stop_event: Optional threading.Event; when given, queries cycle until it is set (mixed workload).
+        progress: Optional common.timeseries.Progress receiving live counts and latencies.
+        passes: Run every query this many times, one pass after the other (None: see above).
+        clear_cache: Clear the index's caches before the "first" pass or before "every" pass (None: never).
+        request_cache: Turn the shard request cache on or off for every search (None: the index setting).
 
     Returns:
-        A dictionary containing benchmark results (e.g., total_queries, avg_latency, errors).
+        A dictionary containing benchmark results (e.g., total_queries, avg_latency,
+        p50_latency ... p99_9_latency, achieved_qps, per_client, errors; with passes,
+        first_execution, repeated_execution, cache_savings and per_pass).
     """
     logger.info(f"Starting query benchmark for index '{index_name}' using queries from '{queries_file}'")
+    driver = ElasticsearchDriver(client, index_name, request_cache=request_cache)
+    return core.run_queries(driver, queries_file, target_qps=target_qps, duration=duration, clients=clients,
+                            order=order, stop_event=stop_event, progress=progress, passes=passes, clear_cache=clear_cache)
 
-    queries = []
-    try:
-        with open(queries_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    queries.append({
-                        "query": {
-                            "query_string": {
-                                "query": line
-                            }
-                        }
-                    })
-    except FileNotFoundError:
-        logger.error(f"Queries file not found: {queries_file}")
-        return {"total_queries": 0, "avg_latency": 0, "errors": 1}
-
-    if not queries:
-        logger.warning("No queries found in the queries file.")
-        return {"total_queries": 0, "avg_latency": 0, "errors": 0}
+# --- Mixed Workload Function ---
+def run_mixed(client: Elasticsearch, index_name: str, data_file: str, queries_file: str, duration: float = None,
+              interval: float = 1.0, ingest_options: dict = None, query_options: dict = None):
+    """
+    Runs the ingestion and query benchmarks at the same time (see common/mixed.py).
 
-    total_queries = len(queries)
-    latencies = []
-    errors = 0
+    Both engines are configured independently, so the ingest rate (ingest_rate,
+    workers) and the query rate (target_qps or query clients) can be set separately.
 
-    for i, query_body in enumerate(queries):
-        start_time = time.perf_counter()
-        try:
-            response = client.search(index=index_name, body=query_body, size=10)
-            end_time = time.perf_counter()
-            latency = end_time - start_time
-            latencies.append(latency)
-        except exceptions.TransportError as e:
-            logger.error(f"Query {i+1} failed: {e}")
-            errors += 1
-        except Exception as e:
-            logger.error(f"An unexpected error occurred during query {i+1}: {e}")
-            errors += 1
-
-    avg_latency = sum(latencies) / len(latencies) if latencies else 0
-    min_latency = min(latencies) if latencies else 0
-    max_latency = max(latencies) if latencies else 0
+    Args:
+        client: An initialized Elasticsearch client instance.
+        index_name: The name of the index to ingest into and search.
+        data_file: Path to the NDJSON data file.
+        queries_file: Path to the file containing queries (one per line).
+        duration: Maximum run time in seconds (None: until ingestion finishes).
+        interval: Seconds between time-series samples.
+        ingest_options: Keyword arguments for run_ingestion (batch_size, workers, ingest_rate, max_docs, ...);
+            with monitor_resources, client and server resources are sampled into the series; with
+            reset, the index is recreated empty before either engine starts.
+        query_options: Keyword arguments for run_queries (target_qps, clients, order, request_cache).
 
-    logger.info(f"Query benchmark finished. Total Queries: {total_queries}, Successful: {len(latencies)}, Errors: {errors}")
-    logger.info(f"Avg Latency: {avg_latency:.4f}s, Min: {min_latency:.4f}s, Max: {max_latency:.4f}s")
+    Returns:
+        A dictionary with the ingestion and query results and the time-aligned series
+        (and resources when monitored).
+    """
+    ingest_options = dict(ingest_options or {})
+    query_options = query_options or {}
+    if ingest_options.pop("reset", False):
+        # Before either engine starts, so the queries never find the index missing
+        driver = ElasticsearchDriver(client, index_name)
+        reset_error = driver.reset() or driver.setup()
+        if reset_error:
+            logger.error(f"Could not recreate index '{index_name}' before the mixed run: {reset_error}")
+    monitor = ResourceMonitor(ElasticsearchDriver(client, index_name)) if ingest_options.get("monitor_resources") else None
+    return run_mixed_workload(
+        lambda progress, stop_event: run_ingestion(client, index_name, data_file, stop_event=stop_event,
+                                                   progress=progress, **ingest_options),
+        lambda progress, stop_event: run_queries(client, index_name, queries_file, stop_event=stop_event,
+                                                 progress=progress, **query_options),
+        duration=duration, interval=interval, monitor=monitor)
 
-    return {
-        "total_queries": total_queries,
-        "successful_queries": len(latencies),
-        "avg_latency": avg_latency,
-        "min_latency": min_latency,
-        "max_latency": max_latency,
-        "errors": errors
-    }
 
 
 class BenchmarkTool:
@@ -0,0 +1,270 @@
+# Elasticsearch driver for the shared benchmark core (common/core.py)
+
+import logging
+import time
+from elasticsearch import Elasticsearch, exceptions
+from common import fastjson
+from common.compression import Compressor
+from common.core import BackendDriver
+from common.passthrough import splice_field
+from common.resources import pick_stats
+from common.timestamps import TimestampMapper
+from common.visibility import MARKER_FIELD
+
+logger = logging.getLogger(__name__)
+
+# --- Bulk response helper ---
+def _bulk_item_errors(failed_items):
+    """Extracts readable reasons from failed bulk response items."""
+    chunk_errors = []
+    for item_result in failed_items:
+        # Structure might be {'index': {'_index': '...', 'status': 400, 'error': {...}}}
+        action_type = list(item_result.keys())[0]  # e.g., 'index'
+        error_info = item_result.get(action_type, {}).get('error', {})
+        reason = error_info.get('reason', 'Unknown bulk error')
+        status = item_result.get(action_type, {}).get('status', 'N/A')  # 429: rejected by a full write queue
+        chunk_errors.append(f"{action_type.upper()} ({status}): {reason}")  # Add action type
+    return chunk_errors
+
+def _bulk_subset(body, positions):
+    """Returns the `_bulk` body holding only the documents at `positions` (each document is an action line and a source line)."""
+    lines = body.split(b'\n')
+    return b''.join(b'%s\n%s\n' % (lines[2 * i], lines[2 * i + 1]) for i in positions)
+
+# --- Server statistics for the resource monitor ---
+# (column, path in a node's _nodes/stats entry, scale), summed over all nodes
+_NODE_COUNTERS = (
+    ("server_indexed_docs", "indices.indexing.index_total", 1),
+    ("server_indexing_seconds", "indices.indexing.index_time_in_millis", 0.001),
+    ("server_merge_seconds", "indices.merges.total_time_in_millis", 0.001),
+    ("server_refresh_seconds", "indices.refresh.total_time_in_millis", 0.001),
+    ("server_write_rejected", "thread_pool.write.rejected", 1),
+    ("server_search_rejected", "thread_pool.search.rejected", 1),
+    ("server_cpu_seconds", "process.cpu.total_in_millis", 0.001),
+)
+_NODE_GAUGES = (
+    ("server_indexing_current", "indices.indexing.index_current", 1),
+    ("server_merges_current", "indices.merges.current", 1),
+    ("server_write_queue", "thread_pool.write.queue", 1),
+    ("server_write_active", "thread_pool.write.active", 1),
+    ("server_search_queue", "thread_pool.search.queue", 1),
+    ("server_heap_used_bytes", "jvm.mem.heap_used_in_bytes", 1),
+)
+SERVER_STATS_TIMEOUT = 5  # Seconds; a slow _nodes/stats must not hold up the sampler for long
+
+def _node_values(nodes_stats):
+    """Sums the values at the paths in _NODE_COUNTERS and _NODE_GAUGES over the nodes of a _nodes/stats response."""
+    values = {}
+    for node in nodes_stats.get("nodes", {}).values():
+        for _, path, _ in _NODE_COUNTERS + _NODE_GAUGES:
+            value = node
+            for key in path.split("."):
+                value = value.get(key) if isinstance(value, dict) else None
+            if isinstance(value, (int, float)):
+                values[path] = values.get(path, 0) + value
+    return values
+
+_COMPRESSED_BULK_HEADERS = {
+    "accept": "application/vnd.elasticsearch+json; compatible-with=8",
+    "content-type": "application/vnd.elasticsearch+json; compatible-with=8",
+}
+
+class ElasticsearchDriver(BackendDriver):
+    """
+    Ingests into one index with `_bulk` and searches it with `query_string` queries.
+
+    Bulk bodies are built as NDJSON bytes on the reading thread: in passthrough mode
+    straight from the raw line bytes (the action line is encoded once and @timestamp
+    is spliced into each line), otherwise from the decoded documents. @timestamp
+    comes from the TimestampMapper (see common/timestamps.py): the current time by
+    default, or the document's own timestamp, kept or shifted; in original mode a
+    document that already has an @timestamp is sent unchanged. With compression
+    enabled the bodies are compressed on the worker threads.
+
+    Searches use the index's request cache setting unless `request_cache` turns the
+    shard request cache on or off per request (on also caches searches that return
+    hits, which Elasticsearch does not cache by default). `clear_cache` empties the
+    index's request, query and fielddata caches. `reset` deletes the index before
+    each trial of a repeated run, so `setup` recreates it empty.
+
+    The Elasticsearch client is thread-safe (every request draws a pooled
+    connection), so all workers and query clients share this driver.
+    """
+
+    name = "Elasticsearch"
+    request_name = "bulk"
+
+    def __init__(self, client: Elasticsearch, index_name: str, passthrough: bool = False,
+                 compression: str = "none", compression_level: int = None, timestamps: TimestampMapper = None,
+                 request_cache: bool = None):
+        self.client = client
+        self.index_name = index_name
+        self.raw = passthrough
+        self.compressor = Compressor(compression, compression_level)
+        self.timestamps = timestamps or TimestampMapper("now")
+        self._search_options = {} if request_cache is None else {"request_cache": request_cache}
+        self._action_line = fastjson.dumps({"index": {"_index": index_name}}) + b'\n'
+
+    def setup(self):
+        """Creates the index if it does not exist yet. Returns an error detail or None."""
+        # --- FIX: Remove explicit exists check, rely on create with ignore=400 ---
+        try:
+            # Attempt to create the index, ignore error if it already exists
+            logger.info(f"Ensuring index '{self.index_name}' exists (create if not present)...")
+            create_response = self.client.indices.create(index=self.index_name, ignore=400)
+            if create_response.get('acknowledged', False):
+                logger.info(f"Index '{self.index_name}' created or already existed.")
+            elif create_response.get('status') == 400 and 'resource_already_exists_exception' in str(create_response):
+                logger.info(f"Index '{self.index_name}' already exists.")
+            else:
+                # Log unexpected non-400 errors from create
+                logger.warning(f"Index creation check returned unexpected response: {create_response}")
+
+        # --- FIX: Catch specific exceptions related to index creation/check ---
+        except exceptions.AuthenticationException as e:
+            logger.error(f"Authentication error during index check/create for '{self.index_name}': {e}")
+            return f"Authentication Error: {e}"
+        except exceptions.ConnectionError as e:
+            logger.error(f"Connection error during index check/create for '{self.index_name}': {e}")
+            return f"Connection Error: {e}"
+        except exceptions.RequestError as e:
+            logger.error(f"Error ensuring index '{self.index_name}' exists: {e}")
+            return str(e)
+        except Exception as e:
+            logger.error(f"Unexpected error during index setup for '{self.index_name}': {e}")
+            return f"Unexpected Setup Error: {e}"
+        return None
+
+    def reset(self):
+        """Deletes the index (if it exists), so `setup` creates it empty. Returns an error detail or None."""
+        try:
+            logger.info(f"Deleting index '{self.index_name}' to start the trial from an empty index...")
+            self.client.indices.delete(index=self.index_name, ignore_unavailable=True)
+        except Exception as e:
+            logger.error(f"Failed to delete index '{self.index_name}': {e}")
+            return f"Index Reset Error: {e}"
+        return None
+
+    def encode_batch(self, docs):
+        # Timestamps first and serialization second, so the two are timed as separate stages
+        stamps_start = time.perf_counter()
+        stamps = self._stamps(docs)
+        if self.stages is not None:
+            self.stages.add("timestamps", time.perf_counter() - stamps_start)
+        parts = []
+        for item, stamp in zip(docs, stamps):
+            if self.raw:
+                source = item if stamp is None else splice_field(item, '@timestamp', stamp)
+            else:
+                if stamp is not None:
+                    item['@timestamp'] = stamp
+                source = fastjson.dumps(item)
+            parts.append(self._action_line)
+            parts.append(source)
+            parts.append(b'\n')
+        return b''.join(parts)
+
+    def _stamps(self, docs):
+        """The @timestamp value of every document of a batch, None where a document keeps its own."""
+        timestamps = self.timestamps
+        keep_own = timestamps.mode == "original"
+        if self.raw:
+            return [None if keep_own and b'"@timestamp"' in line else timestamps.iso_value(timestamps.line_value(line))
+                    for line in docs]
+        return [None if keep_own and '@timestamp' in doc else timestamps.iso_value(timestamps.doc_value(doc))
+                for doc in docs]
+
+    def doc_size(self, doc):
+        # Source line (before @timestamp is added) plus the action line
+        return (len(doc) if self.raw else len(fastjson.dumps(doc))) + len(self._action_line) + 1
+
+    def send_batch(self, body, doc_count):
+        return self.send_attempt(body, doc_count)[:3]
+
+    def send_attempt(self, body, doc_count):
+        """
+        Sends one NDJSON `_bulk` body.
+
+        Compressed bodies bypass `client.bulk`, whose NDJSON serializer appends a newline to
+        any body that does not end with one (which would corrupt the gzip stream). They are
+        sent with a JSON content type instead, which the client forwards byte-for-byte and
+        Elasticsearch accepts on `_bulk`.
+
+        Items rejected with status 429 (es_rejected_execution_exception: the write
+        thread pool's queue was full) are returned as the payload to retry, so only
+        they are sent again; a whole request rejected with 429 is retried as a whole.
+
+        Returns:
+            A tuple (num_success, num_failed, error_details, retry) for this request only.
+        """
+        compressor = self.compressor
+        try:
+            payload = compressor.compress(body)  # Passes the body through uncompressed, counting its size
+            if compressor.enabled:
+                headers = {**_COMPRESSED_BULK_HEADERS, "content-encoding": compressor.content_encoding}
+                response = self.client.perform_request("POST", "/_bulk", body=payload, headers=headers)
+            else:
+                response = self.client.bulk(operations=payload)
+        except exceptions.ApiError as e:
+            # HTTP error responses, e.g. 413 (body larger than http.max_content_length) or 429
+            logger.error(f"Bulk request rejected: {e.status_code} {e.message}")
+            retry = (body, doc_count) if e.status_code == 429 else None
+            return 0, doc_count, [f"ApiError ({e.status_code}): {e.message}"], retry
+        except exceptions.TransportError as e:
+            logger.error(f"Bulk request transport error: {getattr(e, 'info', e)} - Status: {getattr(e, 'status_code', 'N/A')}")
+            error_info_str = str(getattr(e, 'info', e))
+            return 0, doc_count, [f"TransportError ({getattr(e, 'status_code', 'N/A')}): {error_info_str}"], None
+        except Exception as e:
+            logger.error(f"Unexpected error during bulk processing: {e}", exc_info=True)
+            return 0, doc_count, [f"Unexpected Bulk Error: {e}"], None
+
+        response_start = time.perf_counter()
+        outcome = self._bulk_outcome(body, response)
+        if self.stages is not None:
+            self.stages.add("response", time.perf_counter() - response_start)
+        return outcome
+
+    def _bulk_outcome(self, body, response):
+        """Reads the per-item results of a `_bulk` response; see `send_attempt`."""
+        items = response.get('items', [])
+        if not response.get('errors'):
+            return len(items), 0, [], None
+        statuses = [next(iter(item.values())).get('status', 500) for item in items]
+        failed_items = [item for item, status in zip(items, statuses) if status >= 300]
+        chunk_errors = _bulk_item_errors(failed_items)
+        logger.warning(f"Bulk chunk finished with {len(failed_items)} errors. Examples: {chunk_errors[:3]}")
+        rejected = [i for i, status in enumerate(statuses) if status == 429]
+        retry = (_bulk_subset(body, rejected), len(rejected)) if rejected else None
+        return len(items) - len(failed_items), len(failed_items), chunk_errors, retry
+
+    def parse_query(self, line):
+        return {"query": {"query_string": {"query": line}}}
+
+    def run_query(self, query):
+        # Passed as keyword arguments: the client merges `size` into a `body` dict in place,
+        # which breaks the next run of the same query when the list is cycled
+        self.client.search(index=self.index_name, size=10, **self._search_options, **query)
+        return True  # Failures raise TransportError
+
+    def clear_cache(self):
+        self.client.indices.clear_cache(index=self.index_name)
+
+    def health(self):
+        return self.client.ping()
+
+    def find_marker(self, marker, doc):
+        response = self.client.search(index=self.index_name, size=0, track_total_hits=True,
+                                      query={"match": {MARKER_FIELD: marker}})
+        return response["hits"]["total"]["value"] > 0
+
+    def describe(self):
+        return {"passthrough": self.raw, "timestamps": self.timestamps.describe()}
+
+    def stats(self, total_time):
+        return {"compression": self.compressor.stats(total_time)}
+
+    def server_stats(self):
+        # Indexing, merges, refreshes, write/search thread pools, process CPU and heap of every node
+        response = self.client.options(request_timeout=SERVER_STATS_TIMEOUT).nodes.stats(
+            metric=["indices", "thread_pool", "process", "jvm"])
+        return pick_stats(_node_values(response.body), _NODE_COUNTERS, _NODE_GAUGES)
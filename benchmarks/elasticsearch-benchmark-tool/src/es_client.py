@@ -5,8 +5,11 @@ from elastic_transport import SecurityWarning
 
 logger = logging.getLogger(__name__)
 
+# Request-body compression Elasticsearch accepts (Content-Encoding on _bulk)
+REQUEST_COMPRESSION = ("none", "gzip")
+
 class ElasticsearchClient:
-    def __init__(self, host='localhost', port=9200, user=None, password=None, api_key=None, scheme='http', verify_certs=True, timeout=30):
+    def __init__(self, host='localhost', port=9200, user=None, password=None, api_key=None, scheme='http', verify_certs=True, timeout=30, connections_per_node=10):
         """Initializes the Elasticsearch client."""
         self.host = host
         self.port = port
@@ -16,6 +19,7 @@ class ElasticsearchClient:
         self.scheme = scheme
         self.verify_certs = verify_certs
         self.timeout = timeout
+        self.connections_per_node = connections_per_node
         self.client = self._connect()
 
     def _connect(self):
@@ -43,7 +47,10 @@ class ElasticsearchClient:
                 hosts=hosts_config,
                 **auth_params,
                 **ssl_params,
-                request_timeout=self.timeout
+                request_timeout=self.timeout,
+                connections_per_node=self.connections_per_node,
+                # 429 is left to the benchmark's own retries (backoff and budget, see common/retry.py)
+                retry_on_status=(502, 503, 504)
             )
             logger.info(f"Successfully created Elasticsearch client for {self.scheme}://{self.host}:{self.port}")
             return client
@@ -0,0 +1,229 @@
+# asyncio-based push engine for Grafana Loki ingestion
+
+import asyncio
+import logging
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urljoin
+from .loki_client import encode_json_push
+from common.histogram import LatencyHistogram
+
+try:
+    import aiohttp
+except ImportError:  # Only required when the async engine is used
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+PUSH_ENDPOINT = "loki/api/v1/push"
+
+class AsyncPushEngine:
+    """
+    Pushes batches to Loki with up to `concurrency` requests outstanding.
+
+    Batches are pulled from a (blocking) iterator and serialized (and compressed,
+    if a compressor is set) on a dedicated executor thread, so reading and encoding
+    the next payload overlaps with the network I/O of the pushes already in flight
+    on the event loop.
+    """
+
+    def __init__(self, push_url, session=None, concurrency=8, timeout=30, encode=None, content_type="application/json",
+                 compressor=None):
+        """
+        Args:
+            push_url: Full URL of the Loki push endpoint.
+            session: Optional requests.Session whose headers, auth and TLS verification
+                     settings are mirrored on the aiohttp session.
+            concurrency: Maximum number of push requests in flight.
+            timeout: Per-request timeout in seconds.
+            encode: Callable turning a list of stream objects into a request body
+                    (defaults to the JSON push format).
+            content_type: Content-Type of the bodies produced by `encode`.
+            compressor: Optional common.compression.Compressor applied to every body.
+        """
+        if aiohttp is None:
+            raise RuntimeError("The async push engine requires the 'aiohttp' package (pip install aiohttp).")
+        self.push_url = push_url
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.encode = encode or encode_json_push
+        self.content_type = content_type
+        self.compressor = compressor
+        self.headers = {}
+        self.auth = None
+        self.ssl = None  # aiohttp default: verify certificates
+        if session is not None:
+            self._mirror_session(session)
+
+    @classmethod
+    def from_client(cls, loki_client, concurrency=8):
+        """Builds an engine that reuses the auth and TLS options of a LokiClient."""
+        push_url = urljoin(loki_client.loki_url, PUSH_ENDPOINT)
+        return cls(push_url, session=loki_client.session, concurrency=concurrency, timeout=loki_client.timeout,
+                   encode=loki_client.encode_push, content_type=loki_client.push_content_type,
+                   compressor=loki_client.compressor)
+
+    def _mirror_session(self, session):
+        """Copies headers, basic auth and certificate verification from a requests.Session."""
+        self.headers = {k: v for k, v in session.headers.items() if k.lower() not in ('connection', 'accept-encoding')}
+        if isinstance(session.auth, tuple) and len(session.auth) == 2:
+            self.auth = aiohttp.BasicAuth(session.auth[0], session.auth[1])
+        if session.verify is False:
+            self.ssl = False
+        elif isinstance(session.verify, str):
+            self.ssl = ssl.create_default_context(cafile=session.verify)
+
+    def _headers(self):
+        headers = {**self.headers, 'Content-Type': self.content_type}
+        if self.compressor is not None and self.compressor.enabled:
+            headers['Content-Encoding'] = self.compressor.content_encoding
+        return headers
+
+    def _next_payload(self, batch_iter, stats):
+        """
+        Runs on the executor thread: fetches the next batch, encodes and compresses it.
+
+        Returns (body, doc_count, payload, payload_bytes), payload being the body
+        before compression and payload_bytes its size, or None once the iterator is exhausted.
+        """
+        streams = next(batch_iter, None)
+        if streams is None:
+            return None
+        if isinstance(streams, tuple):
+            body, doc_count = streams  # Already encoded
+        else:
+            doc_count = sum(len(s["values"]) for s in streams)
+            body = self.encode(streams)
+        payload = body
+        if self.compressor is not None:
+            compress_start = time.perf_counter()
+            body = self.compressor.compress(body)
+            stats["compress_time"] += time.perf_counter() - compress_start
+        return body, doc_count, payload, len(payload)
+
+    async def _push(self, session, body, doc_count, window, stats, progress=None, payload_bytes=0, on_ack=None,
+                    retry=None):
+        """
+        Sends one push request and accounts for its outcome, then calls `on_ack` (see `run`).
+
+        A push rejected with 429 is sent again after the backoff of the `retry`
+        policy; the request keeps its slot in the window while it waits, so
+        throttling lowers the number of new pushes.
+        """
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        if progress is not None:
+            progress.add("requests_in_flight", 1)
+        if retry is not None:
+            retry.request()
+        request_start = time.perf_counter()
+        success = False
+        attempt = 0
+        error_details = []
+        throttled_errors = []
+        try:
+            while True:
+                push_start = time.perf_counter()
+                status = None
+                try:
+                    async with session.post(self.push_url, data=body, ssl=self.ssl) as response:
+                        status = response.status
+                        if status in (200, 204):
+                            success = True
+                        else:
+                            text = await response.text()
+                            logger.error(f"Loki push request failed: {status} {response.reason} - Body: {text[:200]}")
+                            error_details = [f"HTTP {status}: {text[:200]}"]
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.error(f"Loki push request failed: {e!r}")
+                    error_details = [f"RequestError: {e!r}"]
+                except Exception as e:
+                    logger.error(f"Unexpected error during Loki push: {e}")
+                    error_details = [f"Unexpected Push Error: {e}"]
+                attempt_latency = time.perf_counter() - push_start
+                stats["latency"].record(attempt_latency)
+                stats["request_time"] += attempt_latency
+                stats["requests"] += 1
+                if progress is not None:
+                    progress.record("ingest_request", attempt_latency)
+                delay = retry.backoff(attempt) if status == 429 and retry is not None else None
+                if delay is None:
+                    break
+                throttled_errors.extend(error_details)
+                await asyncio.sleep(delay)
+                attempt += 1
+        finally:
+            if success:
+                stats["successful_docs"] += doc_count
+                stats["first_attempt_docs" if attempt == 0 else "retried_docs"] += doc_count
+            else:
+                stats["errors"] += doc_count
+                stats["error_details"].extend(error_details)
+            if on_ack is not None:
+                on_ack(doc_count, doc_count if success else 0, time.perf_counter() - request_start,
+                       throttled_errors + error_details)
+            if progress is not None:
+                progress.add("requests_in_flight", -1)
+                progress.add("ingested_docs" if success else "ingest_errors", doc_count)
+                progress.add("ingested_bytes", payload_bytes)
+            stats["in_flight"] -= 1
+            window.release()
+            if stats["requests"] % 100 == 0:
+                logger.info(f"Pushed {stats['requests']} batches: {stats['successful_docs']} successful, {stats['errors']} errors so far.")
+
+    async def _run(self, batch_iter, stats, progress=None, on_ack=None, retry=None):
+        loop = asyncio.get_running_loop()
+        window = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+        tasks = set()
+        # A single thread keeps the batch iterator (a generator) from being driven concurrently
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="loki-encode") as executor:
+            async with aiohttp.ClientSession(headers=self._headers(), auth=self.auth, connector=connector, timeout=client_timeout) as session:
+                while True:
+                    acquire_start = time.perf_counter()
+                    await window.acquire()
+                    stats["handoff_time"] += time.perf_counter() - acquire_start
+                    item = await loop.run_in_executor(executor, self._next_payload, batch_iter, stats)
+                    if item is None:
+                        window.release()
+                        break
+                    body, doc_count, payload, payload_bytes = item
+                    ack = partial(on_ack, payload) if on_ack is not None else None
+                    task = asyncio.create_task(self._push(session, body, doc_count, window, stats, progress, payload_bytes, ack,
+                                                          retry))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if tasks:
+                    await asyncio.gather(*tasks)
+
+    def run(self, batch_iter, progress=None, on_ack=None, retry=None):
+        """
+        Pushes every batch produced by `batch_iter`.
+
+        Args:
+            batch_iter: An iterator yielding lists of Loki stream objects, or pre-encoded
+                        (body, doc_count) tuples, one item per push request.
+            progress: Optional common.timeseries.Progress receiving live counts and latencies.
+            on_ack: Optional callable(payload, doc_count, num_success, latency, error_details)
+                    called once each push (with its retries) has completed, with the item's body
+                    before compression.
+            retry: Optional common.retry.RetryPolicy for pushes rejected with 429.
+
+        Returns:
+            A dictionary with successful_docs (first_attempt_docs plus retried_docs), errors,
+            error_details, requests (attempts), max_in_flight, latency (a LatencyHistogram of
+            the push requests), total_time, and the seconds of all push attempts (request_time),
+            spent compressing (compress_time) and waiting for a free slot before the next
+            batch was fetched (handoff_time).
+        """
+        stats = {"successful_docs": 0, "first_attempt_docs": 0, "retried_docs": 0, "errors": 0, "error_details": [],
+                 "requests": 0, "in_flight": 0, "max_in_flight": 0, "latency": LatencyHistogram(),
+                 "request_time": 0.0, "compress_time": 0.0, "handoff_time": 0.0}
+        start_time = time.perf_counter()
+        asyncio.run(self._run(iter(batch_iter), stats, progress, on_ack, retry))
+        stats["total_time"] = time.perf_counter() - start_time
+        del stats["in_flight"]
+        return stats
@@ -6,226 +6,257 @@ import logging
 from datetime import datetime, timezone, timedelta
 import requests  # Import requests for HTTP calls
 import os
+import itertools
+import threading
+from .loki_client import LokiClient, encode_json_push
+from . import loki_proto
+from .async_push import AsyncPushEngine
+from .driver import LokiDriver, _to_loki_entry
+from .streams import StreamMapper
+from common import core
+from common.mixed import run_mixed_workload
+from common.ndjson_reader import ShardedNDJSONReader
+from common.resources import ResourceMonitor
+from common.timestamps import build_timestamp_mapper
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # --- Helper function to read NDJSON data ---
-def read_ndjson(file_path):
-    """Reads an NDJSON file line by line and yields JSON objects."""
-    try:
-        with open(file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    try:
-                        yield json.loads(line)
-                    except json.JSONDecodeError as e:
-                        logger.warning(f"Skipping invalid JSON line: {line} - Error: {e}")
-    except FileNotFoundError:
-        logger.error(f"Data file not found: {file_path}")
-        raise
+def read_ndjson(file_path, workers=1, ordered=True):
+    """Reads an NDJSON file with the shared sharded reader and yields JSON objects."""
+    yield from ShardedNDJSONReader(file_path, workers=workers, ordered=ordered)
+
+# --- Helper to group documents into push batches ---
+def _iter_push_batches(docs, mapper, batch_size, counters):
+    """
+    Groups documents into push batches and yields each one as a list of Loki streams.
+
+    Args:
+        docs: An iterable of log documents (dictionaries).
+        mapper: The StreamMapper deciding each document's stream (see streams.py).
+        batch_size: Number of log entries per push request, across all of its streams.
+        counters: A dict whose 'total_docs' entry is incremented for every document read.
+    """
+    batch = []
+    for doc in docs:
+        counters["total_docs"] += 1
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield mapper.group(batch, _to_loki_entry)
+            batch = []
+    if batch:
+        yield mapper.group(batch, _to_loki_entry)
 
 # --- Ingestion Benchmark Function for Loki ---
-def run_ingestion(loki_url: str, data_file: str, batch_size: int = 1000, labels: dict = None):
+def run_ingestion(loki_client: LokiClient, labels: dict, data_file: str, batch_size: int = 1000, concurrency: int = 1,
+                  reader_workers: int = 1, reader_ordered: bool = True, passthrough: bool = False, max_docs: int = None,
+                  ingest_rate: float = None, stop_event: threading.Event = None, progress=None,
+                  series_interval: float = None, visibility_every: int = None, visibility_poll_interval: float = 0.1,
+                  visibility_timeout: float = 60.0, generator=None, label_fields: list = None, max_streams: int = 1000,
+                  batch_wait: float = None, timestamp_mode: str = "original", timestamp_span: float = None,
+                  replay_speed: float = None, auto_batch: bool = False,
+                  max_retries: int = 0, retry_backoff: float = 0.1, retry_budget: float = 0.2,
+                  batch_bytes: int = None, monitor_resources: bool = False):
     """
     Runs the bulk ingestion benchmark for Grafana Loki.
 
+    The load itself is generated by the shared core (common/core.py); this function
+    only configures the LokiDriver (see driver.py). With concurrency > 1 batches are
+    pushed by the asyncio engine (see async_push.py), keeping up to `concurrency`
+    push requests outstanding; otherwise a single worker thread pushes them.
+
+    Request-body compression and the push encoding are configured on the client
+    (see LokiClient); the results report what compression cost in client CPU and
+    what it saved on the wire.
+
     Args:
-        loki_url: The base URL of the Loki instance (e.g., http://localhost:3100).
-        data_file: Path to the NDJSON data file. Each line should be a JSON log record.
-        batch_size: Number of log entries per push request.
+        loki_client: An initialized LokiClient instance (provides URL, auth, TLS and compression options).
         labels: A dictionary of labels to apply to all log streams (e.g., {"job": "benchmark"}).
+        data_file: Path to the NDJSON data file. Each line should be a JSON log record.
+        batch_size: Number of log entries per push request, across all of its streams.
+        concurrency: Maximum number of push requests in flight.
+        reader_workers: Number of processes decoding the data file (see common/ndjson_reader.py).
+        reader_ordered: Whether decoded shards are consumed in file order.
+        passthrough: Build push payloads from the raw line bytes instead of decoded documents.
+        max_docs: Stop after this many documents (None: the whole file).
+        ingest_rate: Target documents per second (None: as fast as possible).
+        stop_event: Optional threading.Event that stops the run at the next batch.
+        progress: Optional common.timeseries.Progress receiving live counts and latencies.
+        series_interval: Seconds between throughput samples (None: no time series).
+        visibility_every: Tag every Nth document and measure its time to searchable (None: off).
+        visibility_poll_interval: Seconds between searches for each outstanding marker.
+        visibility_timeout: Seconds after which a marker that never showed up counts as timed out.
+        generator: Optional common.loggen.LogGenerator streamed instead of reading data_file (requires max_docs).
+        label_fields: Document fields promoted to stream labels (None: every entry goes to one stream).
+        max_streams: Cap on the number of distinct streams; further label combinations share an overflow stream.
+        batch_wait: Also push a batch once it is this many seconds old (None: only when full).
+        timestamp_mode: Entry timestamps: "original" (each document's own, now if missing), "now",
+            "rebase" (the dataset shifted to end now) or "compress" (also squeezed into timestamp_span seconds).
+        timestamp_span: Seconds the dataset is compressed into (compress mode).
+        replay_speed: Push the entries on the schedule of their own timestamps, this many times
+            faster (None: as fast as ingest_rate allows). Lag behind the schedule is reported under `replay`.
+        auto_batch: Tune the documents and bytes per request from the measured throughput, latency
+            and 413/429 rejections, starting from batch_size (see common/autobatch.py).
+        max_retries: Retries per throttled request (429 or rejected bulk items); 0 disables retrying.
+        retry_backoff: Seconds of the first retry's backoff, doubling with every retry (jittered).
+        retry_budget: Retries allowed per request across the run (None: unlimited).
+        batch_bytes: Bytes per encoded push request, enforced while batches are assembled (None: no
+            byte limit; with batch_size 0 batches are bounded by bytes only).
+        monitor_resources: Sample client resources and Loki's /metrics into the time series
+            (needs series_interval; see common/resources.py).
 
     Returns:
-        A dictionary containing benchmark results.
+        A dictionary containing benchmark results, with stream counts under `streams`.
+    """
+    source = "the synthetic log generator" if generator is not None else f"file '{data_file}'"
+    logger.info(f"Starting Loki ingestion benchmark to '{loki_client.loki_url}' from {source} with batch size {batch_size} and concurrency {concurrency}")
+    try:
+        timestamps = build_timestamp_mapper(timestamp_mode, timestamp_span, data_file=data_file, generator=generator,
+                                            count=max_docs)
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot set up the '{timestamp_mode}' timestamps: {e}")
+        return {"total_docs_attempted": 0, "successful_docs": 0, "total_time": 0, "docs_per_sec": 0, "errors": 1,
+                "error_details": [f"Timestamp Setup Error: {e}"]}
+    driver = LokiDriver(loki_client, labels, passthrough=passthrough, label_fields=label_fields, max_streams=max_streams,
+                        timestamps=timestamps)
+    return core.run_ingestion(driver, data_file, batch_size=batch_size, concurrency=concurrency,
+                              reader_workers=reader_workers, reader_ordered=reader_ordered, max_docs=max_docs,
+                              ingest_rate=ingest_rate, stop_event=stop_event, progress=progress,
+                              series_interval=series_interval, visibility_every=visibility_every,
+                              visibility_poll_interval=visibility_poll_interval, visibility_timeout=visibility_timeout,
+                              generator=generator, batch_wait=batch_wait, replay_speed=replay_speed,
+                              auto_batch=auto_batch,
+                              max_retries=max_retries, retry_backoff=retry_backoff, retry_budget=retry_budget,
+                              batch_bytes=batch_bytes, monitor_resources=monitor_resources)
+
+# --- Push Encoding Comparison ---
+def compare_push_encodings(data_file: str, labels: dict, batch_size: int = 1000, max_docs: int = 100000,
+                           label_fields: list = None, max_streams: int = 1000):
     """
-    push_url = f"{loki_url}/loki/api/v1/push"
-    if labels is None:
-        labels = {"job": "benchmark_ingest"}  # Default labels
+    Compares the JSON and snappy-compressed protobuf push formats offline.
 
-    logger.info(f"Starting Loki ingestion benchmark to '{push_url}' from file '{data_file}' with batch size {batch_size}")
+    The same batches are encoded in each format, measuring client CPU seconds and
+    the bytes that would go over the wire. No Loki instance is needed.
 
-    streams = {}  # Group logs by labels
-    total_docs = 0
-    successful_docs = 0
-    errors = 0
-    error_details = []
-    start_time_total = time.perf_counter()
-    session = requests.Session()  # Use a session for potential connection reuse
+    Args:
+        data_file: Path to the NDJSON data file.
+        labels: Labels applied to every stream.
+        batch_size: Number of log entries per push request.
+        max_docs: Maximum number of documents to read from the data file.
+        label_fields: Document fields promoted to stream labels (None: a single stream).
+        max_streams: Cap on the number of distinct streams.
 
-    try:
-        for doc in read_ndjson(data_file):
-            total_docs += 1
-            ts = doc.get('@timestamp') or doc.get('timestamp') or doc.get('time')
-            if ts:
-                try:
-                    if isinstance(ts, (int, float)):
-                        dt_obj = datetime.fromtimestamp(ts, timezone.utc)
-                    else:
-                        dt_obj = datetime.fromisoformat(str(ts).replace('Z', '+00:00'))
-                    timestamp_ns = str(int(dt_obj.timestamp() * 1e9))
-                except ValueError:
-                    logger.warning(f"Could not parse timestamp '{ts}', using current time.")
-                    timestamp_ns = str(int(time.time() * 1e9))
-            else:
-                timestamp_ns = str(int(time.time() * 1e9))
-
-            log_line = json.dumps(doc)
-            label_key = tuple(sorted(labels.items()))
-
-            if label_key not in streams:
-                streams[label_key] = {"stream": labels, "values": []}
-
-            streams[label_key]["values"].append([timestamp_ns, log_line])
-
-            if len(streams[label_key]["values"]) >= batch_size:
-                payload = {"streams": [streams[label_key]]}
-                try:
-                    response = session.post(push_url, json=payload)
-                    response.raise_for_status()
-                    successful_docs += len(streams[label_key]["values"])
-                    logger.info(f"Pushed batch: {successful_docs} successful docs so far.")
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"Loki push request failed: {e}")
-                    errors += len(streams[label_key]["values"])
-                    error_details.append(f"RequestError: {e}")
-                except Exception as e:
-                    logger.error(f"Unexpected error during Loki push: {e}")
-                    errors += len(streams[label_key]["values"])
-                    error_details.append(f"Unexpected Push Error: {e}")
-
-                streams[label_key]["values"] = []
-                if errors > 0:
-                    logger.info(f"Processed batch: {successful_docs} successful, {errors} errors so far.")
-
-        final_payload_streams = [stream_data for stream_data in streams.values() if stream_data["values"]]
-        if final_payload_streams:
-            payload = {"streams": final_payload_streams}
-            try:
-                response = session.post(push_url, json=payload)
-                response.raise_for_status()
-                docs_in_final_batch = sum(len(s["values"]) for s in final_payload_streams)
-                successful_docs += docs_in_final_batch
-                logger.info(f"Pushed final batch ({docs_in_final_batch} docs).")
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Final Loki push request failed: {e}")
-                docs_in_final_batch = sum(len(s["values"]) for s in final_payload_streams)
-                errors += docs_in_final_batch
-                error_details.append(f"Final RequestError: {e}")
-            except Exception as e:
-                logger.error(f"Unexpected error during final Loki push: {e}")
-                docs_in_final_batch = sum(len(s["values"]) for s in final_payload_streams)
-                errors += docs_in_final_batch
-                error_details.append(f"Unexpected Final Push Error: {e}")
-
-    except FileNotFoundError:
-        return {"total_docs_attempted": 0, "successful_docs": 0, "total_time": 0, "docs_per_sec": 0, "errors": 1, "error_details": [f"Data file not found: {data_file}"]}
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during ingestion loop: {e}")
-        remaining_docs = sum(len(s["values"]) for s in streams.values())
-        errors += remaining_docs
-        error_details.append(f"Unexpected Ingestion Loop Error: {e}")
-    finally:
-        session.close()
-
-    end_time_total = time.perf_counter()
-    total_time = end_time_total - start_time_total
-    docs_per_sec = successful_docs / total_time if total_time > 0 else 0
-
-    logger.info(f"Loki Ingestion finished. Total Docs Attempted: {total_docs}, Successful: {successful_docs}, Errors: {errors}")
-    logger.info(f"Total Time: {total_time:.4f} seconds, Rate: {docs_per_sec:.2f} docs/sec")
-
-    return {
-        "total_docs_attempted": total_docs,
-        "successful_docs": successful_docs,
-        "total_time": total_time,
-        "docs_per_sec": docs_per_sec,
-        "errors": errors,
-        "error_details": error_details[:10] if len(error_details) > 10 else error_details
-    }
+    Returns:
+        A dictionary with per-encoding results and protobuf/json ratios.
+    """
+    logger.info(f"Comparing push encodings on up to {max_docs} docs from '{data_file}' with batch size {batch_size}")
+    counters = {"total_docs": 0}
+    docs = itertools.islice(ShardedNDJSONReader(data_file), max_docs)
+    mapper = StreamMapper(labels or {"job": "benchmark_ingest"}, label_fields, max_streams)
+    batches = list(_iter_push_batches(docs, mapper, batch_size, counters))
+    total_docs = counters["total_docs"]
+
+    results = {"docs": total_docs, "batches": len(batches), "streams": mapper.stats()}
+    for encoding, encode in (("json", encode_json_push), ("protobuf", loki_proto.encode_push_body)):
+        cpu_start = time.process_time()
+        wire_bytes = 0
+        for streams in batches:
+            wire_bytes += len(encode(streams))
+        cpu_seconds = time.process_time() - cpu_start
+        results[encoding] = {
+            "cpu_seconds": cpu_seconds,
+            "wire_bytes": wire_bytes,
+            "bytes_per_doc": wire_bytes / total_docs if total_docs else 0,
+            "docs_per_cpu_sec": total_docs / cpu_seconds if cpu_seconds > 0 else 0,
+        }
+        logger.info(f"{encoding}: {wire_bytes} bytes, {cpu_seconds:.4f} CPU seconds")
+
+    if results["json"]["wire_bytes"]:
+        results["protobuf_to_json_bytes"] = results["protobuf"]["wire_bytes"] / results["json"]["wire_bytes"]
+    if results["json"]["cpu_seconds"] > 0:
+        results["protobuf_to_json_cpu"] = results["protobuf"]["cpu_seconds"] / results["json"]["cpu_seconds"]
+    return results
 
 # --- Query Benchmark Function for Loki ---
-def run_queries(loki_url: str, queries_file: str, time_range_minutes: int = 60):
+def run_queries(loki_client: LokiClient, queries_file: str, limit: int = 1000, time_range_minutes: int = 60,
+                target_qps: float = None, duration: float = None, clients: int = 1, order: str = "round-robin",
+                stop_event: threading.Event = None, progress=None, passes: int = None, clear_cache: str = None,
+                bypass_cache: bool = False):
     """
     Runs the search query benchmark against Grafana Loki using LogQL.
 
+    By default `clients` concurrent clients each run the queries back to back (closed
+    loop). With target_qps set they are sent on a fixed schedule instead (open loop,
+    see common/query_load.py), and latency is measured from each query's intended
+    send time. Every client (or open-loop sender) uses its own session and connection.
+
+    With `passes` every query runs once per pass, and the first executions (cold
+    caches) are reported apart from the repeated ones (warm caches). Clearing the
+    caches moves the query window to a range not queried before (see LokiDriver).
+
     Args:
-        loki_url: The base URL of the Loki instance (e.g., http://localhost:3100).
+        loki_client: An initialized LokiClient instance (provides URL, auth and TLS options).
         queries_file: Path to the file containing LogQL queries (one per line).
+        limit: Maximum number of entries returned per query.
         time_range_minutes: The duration in minutes for the query range (ending now).
+        target_qps: Queries per second for the open-loop mode (None for closed loop).
+        duration: Run time in seconds, cycling through the queries (None for one pass).
+        clients: Concurrent query clients (open loop: sender threads).
+        order: Order in which each client runs the queries, "round-robin" or "shuffled".
+        stop_event: Optional threading.Event; when given, queries cycle until it is set (mixed workload).
+        progress: Optional common.timeseries.Progress receiving live counts and latencies.
+        passes: Run every query this many times, one pass after the other (None: see above).
+        clear_cache: Move the query window before the "first" pass or before "every" pass (None: never).
+        bypass_cache: Ask Loki not to answer any query from its results cache.
 
     Returns:
-        A dictionary containing benchmark results.
+        A dictionary containing benchmark results (e.g., total_queries, avg_latency,
+        p50_latency ... p99_9_latency, achieved_qps, per_client, errors; with passes,
+        first_execution, repeated_execution, cache_savings and per_pass).
     """
-    query_range_url = f"{loki_url}/loki/api/v1/query_range"
-    logger.info(f"Starting Loki query benchmark using queries from '{queries_file}' against '{query_range_url}'")
-
-    queries = []
-    try:
-        with open(queries_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    queries.append(line)
-    except FileNotFoundError:
-        logger.error(f"Queries file not found: {queries_file}")
-        return {"total_queries": 0, "successful_queries": 0, "avg_latency": 0, "errors": 1}
-
-    if not queries:
-        logger.warning("No queries found in the queries file.")
-        return {"total_queries": 0, "successful_queries": 0, "avg_latency": 0, "errors": 0}
-
-    total_queries = len(queries)
-    latencies = []
-    errors = 0
-    session = requests.Session()
-
-    end_time = datetime.now(timezone.utc)
-    start_time = end_time - timedelta(minutes=time_range_minutes)
-    params = {
-        'start': str(int(start_time.timestamp() * 1e9)),
-        'end': str(int(end_time.timestamp() * 1e9)),
-        'limit': 1000
-    }
-
-    for i, logql_query in enumerate(queries):
-        request_params = params.copy()
-        request_params['query'] = logql_query
-        query_start_time = time.perf_counter()
-        try:
-            response = session.get(query_range_url, params=request_params)
-            response.raise_for_status()
-            query_end_time = time.perf_counter()
-            latency = query_end_time - query_start_time
-            latencies.append(latency)
-        except requests.exceptions.RequestException as e:
-            query_end_time = time.perf_counter()
-            logger.error(f"Query {i+1} ('{logql_query[:50]}...') failed: {e}")
-            errors += 1
-        except Exception as e:
-            query_end_time = time.perf_counter()
-            logger.error(f"An unexpected error occurred during query {i+1} ('{logql_query[:50]}...'): {e}")
-            errors += 1
-
-    session.close()
+    logger.info(f"Starting Loki query benchmark using queries from '{queries_file}' against '{loki_client.loki_url}'")
+    driver = LokiDriver(loki_client, limit=limit, time_range_minutes=time_range_minutes,
+                        bypass_cache=bypass_cache)
+    return core.run_queries(driver, queries_file, target_qps=target_qps, duration=duration, clients=clients, order=order,
+                            stop_event=stop_event, progress=progress, passes=passes, clear_cache=clear_cache)
+
+# --- Mixed Workload Function ---
+def run_mixed(loki_client: LokiClient, labels: dict, data_file: str, queries_file: str, duration: float = None,
+              interval: float = 1.0, ingest_options: dict = None, query_options: dict = None):
+    """
+    Runs the ingestion and query benchmarks against Loki at the same time (see common/mixed.py).
 
-    avg_latency = sum(latencies) / len(latencies) if latencies else 0
-    min_latency = min(latencies) if latencies else 0
-    max_latency = max(latencies) if latencies else 0
+    Both engines are configured independently, so the ingest rate (ingest_rate,
+    concurrency) and the query rate (target_qps or query clients) can be set separately.
+    The query engine uses its own LokiClient session(s), apart from the pushes.
 
-    logger.info(f"Loki Query benchmark finished. Total Queries: {total_queries}, Successful: {len(latencies)}, Errors: {errors}")
-    logger.info(f"Avg Latency: {avg_latency:.4f}s, Min: {min_latency:.4f}s, Max: {max_latency:.4f}s")
+    Args:
+        loki_client: An initialized LokiClient instance.
+        labels: A dictionary of labels to apply to all log streams.
+        data_file: Path to the NDJSON data file.
+        queries_file: Path to the file containing LogQL queries (one per line).
+        duration: Maximum run time in seconds (None: until ingestion finishes).
+        interval: Seconds between time-series samples.
+        ingest_options: Keyword arguments for run_ingestion (batch_size, concurrency, ingest_rate, max_docs, ...);
+            with monitor_resources, client and server resources are sampled into the series.
+        query_options: Keyword arguments for run_queries (limit, target_qps, clients, order, bypass_cache).
 
-    return {
-        "total_queries": total_queries,
-        "successful_queries": len(latencies),
-        "avg_latency": avg_latency,
-        "min_latency": min_latency,
-        "max_latency": max_latency,
-        "errors": errors
-    }
+    Returns:
+        A dictionary with the ingestion and query results and the time-aligned series
+        (and resources when monitored).
+    """
+    ingest_options = ingest_options or {}
+    query_options = query_options or {}
+    query_client = loki_client.clone()
+    monitor = ResourceMonitor(LokiDriver(loki_client, labels)) if ingest_options.get("monitor_resources") else None
+    return run_mixed_workload(
+        lambda progress, stop_event: run_ingestion(loki_client, labels, data_file, stop_event=stop_event,
+                                                   progress=progress, **ingest_options),
+        lambda progress, stop_event: run_queries(query_client, queries_file, stop_event=stop_event,
+                                                 progress=progress, **query_options),
+        duration=duration, interval=interval, monitor=monitor)
 
 # --- BenchmarkTool Class adapted for Loki ---
 class BenchmarkTool:
@@ -253,7 +284,7 @@ class BenchmarkTool:
             logger.error(f"An unexpected error occurred during Loki connection check: {e}")
             raise
 
-    def bulk_ingest(self, log_data_iterable, batch_size=1000, labels=None):
+    def bulk_ingest(self, log_data_iterable, batch_size=1000, labels=None, concurrency=1):
         """
         Bulk ingest log data into Loki using an iterable.
 
@@ -261,10 +292,10 @@ class BenchmarkTool:
             log_data_iterable: An iterable yielding log documents (dictionaries).
             batch_size: Number of log entries per push request.
             labels: Specific labels for this ingestion batch, overrides default.
+            concurrency: Maximum number of push requests in flight (uses the asyncio engine when > 1).
         """
         push_url = f"{self.loki_url}/loki/api/v1/push"
         ingest_labels = labels if labels else self.default_labels
-        label_key = tuple(sorted(ingest_labels.items()))
 
         logger.info(f"Starting class-based Loki bulk ingest to '{push_url}'")
 
@@ -274,45 +305,53 @@ class BenchmarkTool:
         start_time_total = time.perf_counter()
 
         try:
-            for doc in log_data_iterable:
-                ts = doc.get('@timestamp') or doc.get('timestamp') or doc.get('time')
-                if ts:
-                    try:
-                        if isinstance(ts, (int, float)):
-                            dt_obj = datetime.fromtimestamp(ts, timezone.utc)
-                        else:
-                            dt_obj = datetime.fromisoformat(str(ts).replace('Z', '+00:00'))
-                        timestamp_ns = str(int(dt_obj.timestamp() * 1e9))
-                    except ValueError:
+            if concurrency > 1:
+                # Keep up to `concurrency` pushes outstanding, reusing this tool's session settings
+                engine = AsyncPushEngine(push_url, session=self.session, concurrency=concurrency)
+                counters = {"total_docs": 0}
+                engine_stats = engine.run(_iter_push_batches(log_data_iterable, StreamMapper(ingest_labels), batch_size, counters))
+                successful_docs = engine_stats["successful_docs"]
+                fail_count = engine_stats["errors"]
+            else:
+                for doc in log_data_iterable:
+                    ts = doc.get('@timestamp') or doc.get('timestamp') or doc.get('time')
+                    if ts:
+                        try:
+                            if isinstance(ts, (int, float)):
+                                dt_obj = datetime.fromtimestamp(ts, timezone.utc)
+                            else:
+                                dt_obj = datetime.fromisoformat(str(ts).replace('Z', '+00:00'))
+                            timestamp_ns = str(int(dt_obj.timestamp() * 1e9))
+                        except ValueError:
+                            timestamp_ns = str(int(time.time() * 1e9))
+                    else:
                         timestamp_ns = str(int(time.time() * 1e9))
-                else:
-                    timestamp_ns = str(int(time.time() * 1e9))
-
-                log_line = json.dumps(doc)
-                current_batch["values"].append([timestamp_ns, log_line])
 
-                if len(current_batch["values"]) >= batch_size:
+                    log_line = json.dumps(doc)
+                    current_batch["values"].append([timestamp_ns, log_line])
+
+                    if len(current_batch["values"]) >= batch_size:
+                        payload = {"streams": [current_batch]}
+                        try:
+                            response = self.session.post(push_url, json=payload)
+                            response.raise_for_status()
+                            successful_docs += len(current_batch["values"])
+                        except requests.exceptions.RequestException as e:
+                            logger.error(f"Loki push request failed during batch: {e}")
+                            fail_count += len(current_batch["values"])
+                        current_batch["values"] = []
+                        if (successful_docs + fail_count) % (batch_size * 10) == 0:
+                            logger.info(f"Processed batch: {successful_docs} successful, {fail_count} errors so far.")
+
+                if current_batch["values"]:
                     payload = {"streams": [current_batch]}
                     try:
                         response = self.session.post(push_url, json=payload)
                         response.raise_for_status()
                         successful_docs += len(current_batch["values"])
                     except requests.exceptions.RequestException as e:
-                        logger.error(f"Loki push request failed during batch: {e}")
+                        logger.error(f"Final Loki push request failed: {e}")
                         fail_count += len(current_batch["values"])
-                    current_batch["values"] = []
-                    if (successful_docs + fail_count) % (batch_size * 10) == 0:
-                        logger.info(f"Processed batch: {successful_docs} successful, {fail_count} errors so far.")
-
-            if current_batch["values"]:
-                payload = {"streams": [current_batch]}
-                try:
-                    response = self.session.post(push_url, json=payload)
-                    response.raise_for_status()
-                    successful_docs += len(current_batch["values"])
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"Final Loki push request failed: {e}")
-                    fail_count += len(current_batch["values"])
 
         except Exception as e:
             logger.error(f"An unexpected error occurred during class-based ingestion: {e}", exc_info=True)
@@ -1,19 +1,32 @@
 import argparse
 import os
+import sys
 from pathlib import Path
 import logging
 import warnings
 import json # For parsing labels
 
 # Ensure benchmark functions are correctly imported
-from .benchmark import run_ingestion, run_queries
+from .benchmark import run_ingestion, run_queries, run_mixed, compare_push_encodings
 # Ensure the Loki client class is correctly imported
-from .loki_client import LokiClient
+from .loki_client import LokiClient, PUSH_ENCODINGS, REQUEST_COMPRESSION
+from .streams import label_name, parse_label_fields
+from common.batching import parse_size
+from common.loggen import build_generator, load_config
+from common.profiling import run_profiled
+from common.query_load import DEFAULT_MAX_OUTSTANDING, QUERY_ORDERS
+from common.results import build_result, cli_parameters, compare_main, write_result
+from common.timeseries import format_series, write_series
+from common.timestamps import TIMESTAMP_MODES
+from common.trials import (format_trial_summary, parse_warmup, run_trials, steady_state, summarize_trials,
+                           trial_path)
 
 # Configure basic logging for the CLI
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+TOOL = "loki"
+
 def parse_labels(label_string):
     """Parses a comma-separated key=value string into a dictionary."""
     labels = {}
@@ -27,7 +40,64 @@ def parse_labels(label_string):
         raise argparse.ArgumentTypeError(f"Invalid label format: '{label_string}'. Use comma-separated key=value pairs.")
     return labels
 
+# Columns shown for the time series of a mixed run
+SERIES_COLUMNS = ("t", "ingested_docs_per_sec", "ingest_request_p99", "queries_per_sec", "query_p50", "query_p99",
+                  "query_errors")
+
+def print_results(title, results):
+    """Prints one results dictionary, one key per line."""
+    print(f"\n{title}:")
+    if not isinstance(results, dict):
+        print("  Benchmark did not return expected results.")
+        return
+    for key, value in results.items():
+        # Truncate long error lists
+        if key == 'error_details' and isinstance(value, list) and len(value) > 5:
+            print(f"  {key}: {len(value)} errors (details truncated: {value[:5]}...)")
+        elif key == 'per_worker' and isinstance(value, list):
+            print(f"  {key}:")
+            for worker in value:
+                print(f"    worker {worker['worker']}: {worker['successful_docs']} docs, {worker['docs_per_sec']:.2f} docs/sec, "
+                      f"{worker['requests']} requests, {worker['errors']} errors, busy {worker['busy_time']:.4f}s, "
+                      f"p99 {worker['p99_latency']:.4f}s")
+        elif key == 'series' and isinstance(value, list):
+            print(f"  {key}: {len(value)} samples")
+        elif key == 'stages' and isinstance(value, dict):
+            print(f"  {key}:")
+            print("    reading thread: " + ", ".join(f"{stage} {v['seconds']:.3f}s ({v['share']:.0%})" for stage, v in value['reader'].items()))
+            print(f"    senders ({value['senders']}, {value['sender_busy']:.0%} busy): "
+                  + ", ".join(f"{stage} {v['seconds']:.3f}s ({v['share']:.0%})" for stage, v in value['sender'].items()))
+        elif key == 'per_pass' and isinstance(value, list):
+            print(f"  {key}:")
+            for query_pass in value:
+                print(f"    pass {query_pass['pass']}{' (caches cleared)' if query_pass['cleared'] else ''}: "
+                      f"{query_pass['queries']} queries, {query_pass['errors']} errors, p50 {query_pass['p50_latency']:.4f}s, "
+                      f"p99 {query_pass['p99_latency']:.4f}s")
+        elif key == 'per_client' and isinstance(value, list):
+            print(f"  {key}:")
+            for client in value:
+                print(f"    client {client['client']}: {client['queries']} queries, {client['qps']:.2f} qps, "
+                      f"{client['errors']} errors, p50 {client['p50_latency']:.4f}s, p99 {client['p99_latency']:.4f}s")
+        elif isinstance(value, dict):
+            print(f"  {key}:")
+            for sub_key, sub_value in value.items():
+                print(f"    {sub_key}: {sub_value}")
+        else:
+            print(f"  {key}: {value}")
+
+def save_results(args, results, backend=None, **parameters):
+    """Writes the run's results as a versioned result document (see common/results.py) if --results-file is set."""
+    if not args.results_file:
+        return
+    try:
+        write_result(build_result(TOOL, cli_parameters(args, **parameters), results, backend), args.results_file)
+    except OSError as e:
+        logger.error(f"Failed to write results file {args.results_file}: {e}")
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        sys.exit(compare_main(sys.argv[2:], prog="python -m src.cli compare"))
+
     parser = argparse.ArgumentParser(description="Grafana Loki Benchmark Tool")
 
     # Connection Arguments for Loki
@@ -41,11 +111,54 @@ def main():
     # Benchmark Arguments
     parser.add_argument("--labels", type=parse_labels, default="job=benchmark_tool",
                         help="Comma-separated key=value labels to apply to ingested logs (default: job=benchmark_tool). Example: 'app=myapp,env=prod'")
-    parser.add_argument("--data-file", type=Path, help="Path to the NDJSON log file for ingestion (required unless --query-only). Each line should be a JSON object.")
+    parser.add_argument("--label-fields", type=parse_label_fields, default=[], help="Comma-separated document fields promoted to stream labels, e.g. 'level,service': one stream per distinct combination of their values (default: none, a single stream).")
+    parser.add_argument("--max-streams", type=int, default=1000, help="Cap on the number of distinct streams created by --label-fields; entries with further combinations go to one overflow stream labelled '_other' (default: 1000).")
+    parser.add_argument("--batch-wait", type=float, help="Also push a batch once it is this many seconds old, like a log shipper's batch timer; with --ingest-rate this caps the batch at rate x wait entries (default: push only full batches; 1 with --replay).")
+    parser.add_argument("--data-file", type=Path, help="Path to the NDJSON log file for ingestion (required unless --query-only or --generate). Each line should be a JSON object.")
+    parser.add_argument("--timestamps", choices=TIMESTAMP_MODES, default="original", help="Entry timestamps: original (the document's @timestamp/timestamp/time, now if missing), now (push time), rebase (shift the dataset's timeline to end now, keeping the gaps) or compress (rebase, squeezed into --timestamp-span minutes) (default: original).")
+    parser.add_argument("--timestamp-span", type=float, metavar="MINUTES", help="Minutes the whole dataset is compressed into with --timestamps compress, e.g. 30 to replay a day of logs as the last 30 minutes.")
+    parser.add_argument("--generate", type=int, metavar="N", help="Stream N synthetic log lines from the built-in generator (common/loggen.py) instead of reading --data-file.")
+    parser.add_argument("--generate-config", type=Path, help="JSON file of generator settings for --generate: seed, format (text needs --passthrough), levels, messages, users, user_zipf, ips, ip_zipf, start, rate (see common/loggen.py).")
     parser.add_argument("--queries-file", type=Path, help="Path to a file containing LogQL queries (one per line) for benchmarking.")
     parser.add_argument("--batch-size", type=int, default=500, help="Number of log lines per push request to Loki (default: 500, ignored if --query-only). Note: Loki has payload size limits.")
+    parser.add_argument("--batch-bytes", type=parse_size, help="Also cut a batch before the document that would take the encoded push request over this size, e.g. 5MB or 4MiB, so heterogeneous documents give steady request sizes that stay under Loki's grpc_server_max_recv_msg_size and distributor limits. Use --batch-size 0 to bound batches by bytes only. Request body sizes are always reported under `request_bytes` (default: no byte limit).")
+    parser.add_argument("--auto-batch", action="store_true", help="Tune the documents and bytes per request while ingesting, starting from --batch-size: larger or smaller batches are kept if they raise throughput without pushing median latency above 5s, 413 responses cap the request size and 429 responses halve it. The chosen size is logged and reported under `auto_batch`.")
+    parser.add_argument("--max-retries", type=int, default=5, help="Times a push rejected with 429 (rate limited) is sent again after a jittered exponential backoff; 0 disables retries (default: 5). The results separate first-attempt, retried and failed documents under `retries`.")
+    parser.add_argument("--retry-backoff", type=float, default=0.1, help="Seconds of the first retry's backoff; it doubles with every retry, up to 10s, and is randomized (default: 0.1).")
+    parser.add_argument("--retry-budget", type=float, default=0.2, help="Retries allowed per request across the run, so retries cannot multiply the load on an overloaded backend; past it, throttled requests fail (default: 0.2).")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of push requests kept outstanding; values above 1 use the asyncio push engine (default: 1, ignored if --query-only).")
+    parser.add_argument("--reader-workers", type=int, default=1, help="Number of processes decoding the data file in parallel shards (default: 1, decodes in-process).")
+    parser.add_argument("--reader-unordered", action="store_true", help="Consume decoded shards as they complete instead of in file order.")
+    parser.add_argument("--passthrough", action="store_true", help="Build request bodies straight from the raw NDJSON line bytes, skipping JSON decode and re-encode.")
+    parser.add_argument("--encoding", choices=PUSH_ENCODINGS, default="json", help="Push body format: json or protobuf (snappy-compressed, Loki's native format) (default: json).")
+    parser.add_argument("--compression", choices=REQUEST_COMPRESSION, default="none", help="Compress push request bodies on the wire (default: none).")
+    parser.add_argument("--compression-level", type=int, help="Compression level (default: 6 for gzip).")
+    parser.add_argument("--compare-encodings", action="store_true", help="Compare client CPU time and wire bytes of the json and protobuf encodings on --data-file, then exit without pushing.")
     parser.add_argument("--query-only", action="store_true", help="Run only the query benchmark (requires --queries-file).")
     parser.add_argument("--query-limit", type=int, default=100, help="Limit for number of results returned by Loki queries (default: 100).")
+    parser.add_argument("--target-qps", type=float, help="Send queries open-loop at this fixed rate, measuring latency from each query's intended send time (default: closed loop, back to back).")
+    parser.add_argument("--query-duration", type=float, help="Keep running queries for this many seconds, cycling through the queries file (default: one pass per client).")
+    parser.add_argument("--query-clients", type=int, help=f"Number of concurrent query clients, each on its own connection; with --target-qps, the number of sender threads (default: 1, or {DEFAULT_MAX_OUTSTANDING} with --target-qps).")
+    parser.add_argument("--query-order", choices=QUERY_ORDERS, default="round-robin", help="Order in which each client runs the queries: round-robin (file order, staggered start per client) or shuffled (default: round-robin).")
+    parser.add_argument("--query-passes", type=int, help="Run every query this many times, one pass over the queries file after the other, and report the first executions (cold caches) apart from the repeated ones (warm caches), with the latency the caches saved (default: off).")
+    parser.add_argument("--clear-cache", choices=("first", "every"), help="With --query-passes, move the query window back to a range no earlier query has touched (Loki has no API to clear its caches) before the first pass only, or before every pass to measure the uncached path throughout (default: never).")
+    parser.add_argument("--bypass-cache", action="store_true", help="Send Cache-Control: no-cache with every query, so Loki's query frontend never answers from its results cache.")
+    parser.add_argument("--max-docs", type=int, help="Push at most this many log lines from --data-file (default: the whole file).")
+    parser.add_argument("--ingest-rate", type=float, help="Pace ingestion to this many log lines per second (default: as fast as possible).")
+    parser.add_argument("--replay", action="store_true", help="Send the log lines on the schedule of their own @timestamp/timestamp/time, reproducing the bursts and lulls of the recorded traffic; batches are sent when full or after 1 second (see --batch-wait). Lag behind the schedule is reported under `replay`.")
+    parser.add_argument("--speed", type=float, help="Replay speed multiplier for --replay, e.g. 10 to replay an hour of logs in 6 minutes (default: 1).")
+    parser.add_argument("--mixed", action="store_true", help="Run ingestion and queries at the same time and report query latency under ingest load (requires --data-file or --generate, and --queries-file).")
+    parser.add_argument("--duration", type=float, help="Maximum run time in seconds for --mixed (default: until ingestion finishes).")
+    parser.add_argument("--series-interval", type=float, default=1.0, help="Seconds between time-series samples for --series-file and --mixed (default: 1.0).")
+    parser.add_argument("--results-file", type=Path, help="Write all parameters, the environment and the results as a versioned JSON document, for `python -m src.cli compare`.")
+    parser.add_argument("--trials", type=int, default=1, help="Repeat the whole benchmark this many times and report the mean and 95%% confidence interval of throughput and query latency across trials (default: 1).")
+    parser.add_argument("--warmup", type=parse_warmup, default=(0, 0.0), help="Warmup excluded from the results: a number of discarded trials (e.g. 1) or seconds excluded at the start of every trial (e.g. 30s). With --trials or --warmup, ingestion reports its steady-state docs/sec (default: none).")
+    parser.add_argument("--series-file", type=Path, help="Sample ingest throughput (docs/sec, bytes/sec, requests in flight, errors, request latency) every --series-interval and write the series to this file: CSV if it ends in .csv, NDJSON otherwise.")
+    parser.add_argument("--resources", action="store_true", help="Every --series-interval, also sample the client's CPU, memory and network use from /proc and Loki's /metrics (distributor lines and bytes received, discarded samples, ingester streams, chunks and flush queue, CPU, RSS), on the same rows as the throughput series (written with --series-file), to tell whether the load generator or the backend was the limit. Summarized under `resources`.")
+    parser.add_argument("--profile", type=Path, help="Sample the stacks of every thread of the benchmark every 5 ms and write them to this file as collapsed stacks (for flamegraph.pl or speedscope), logging the hottest functions at the end. The per-stage time breakdown under `stages` is always reported (default: off).")
+    parser.add_argument("--visibility-every", type=int, help="Tag every Nth ingested document with a unique marker and measure how long after its request was acknowledged it becomes searchable (default: off).")
+    parser.add_argument("--visibility-poll-interval", type=float, default=0.1, help="Seconds between searches for each outstanding marker; the resolution of the visibility latency (default: 0.1).")
+    parser.add_argument("--visibility-timeout", type=float, default=60.0, help="Seconds after which a marker that never became searchable counts as timed out (default: 60).")
     # Add arguments for query time range if needed
     # parser.add_argument("--query-start", help="Start time for range queries (RFC3339 or Unix timestamp).")
     # parser.add_argument("--query-end", help="End time for range queries (RFC3339 or Unix timestamp).")
@@ -61,17 +174,141 @@ def main():
             logger.warning("--data-file is ignored when using --query-only.")
         if args.batch_size != 500:
              logger.warning("--batch-size is ignored when using --query-only.")
+        if args.concurrency != 1:
+             logger.warning("--concurrency is ignored when using --query-only.")
     else:
-        if not args.data_file:
-            parser.error("--data-file is required unless --query-only is specified.")
-        if not args.data_file.is_file():
+        if args.generate is not None:
+            if args.data_file:
+                parser.error("--generate cannot be combined with --data-file.")
+            if args.generate < 1:
+                parser.error("--generate must be at least 1.")
+        elif not args.data_file:
+            parser.error("--data-file or --generate is required unless --query-only is specified.")
+        elif not args.data_file.is_file():
             logger.error(f"Data file not found: {args.data_file}")
             return
 
+    if args.mixed:
+        if args.query_only:
+            parser.error("--mixed cannot be combined with --query-only.")
+        if not args.queries_file:
+            parser.error("--queries-file is required with --mixed.")
+        if args.query_duration is not None:
+            logger.warning("--query-duration is ignored with --mixed; use --duration.")
+        if args.duration is not None and args.duration <= 0:
+            parser.error("--duration must be greater than 0.")
+    elif args.duration is not None:
+        logger.warning("--duration is ignored without --mixed.")
+    if args.series_interval <= 0:
+        parser.error("--series-interval must be greater than 0.")
+    if args.trials < 1:
+        parser.error("--trials must be at least 1.")
+    warmup_trials, warmup_seconds = args.warmup
+    repeated = args.trials > 1 or warmup_trials > 0 or warmup_seconds > 0
+    # Loki cannot delete what was pushed: every trial pushes to streams of its own (trial=<n>)
+    fresh_trials = (args.trials > 1 or warmup_trials > 0) and not args.query_only
+    if args.series_file and args.query_only:
+        logger.warning("--series-file is ignored when using --query-only.")
+    if args.resources and args.query_only:
+        logger.warning("--resources is ignored when using --query-only.")
+    if args.visibility_every is not None:
+        if args.visibility_every < 1:
+            parser.error("--visibility-every must be at least 1.")
+        if args.query_only:
+            logger.warning("--visibility-every is ignored when using --query-only.")
+    if args.visibility_poll_interval <= 0:
+        parser.error("--visibility-poll-interval must be greater than 0.")
+    if args.visibility_timeout <= 0:
+        parser.error("--visibility-timeout must be greater than 0.")
+    if args.timestamps == "compress":
+        if args.timestamp_span is None or args.timestamp_span <= 0:
+            parser.error("--timestamps compress requires --timestamp-span greater than 0.")
+    elif args.timestamp_span is not None:
+        logger.warning("--timestamp-span is ignored without --timestamps compress.")
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1.")
+    if args.max_streams < 1:
+        parser.error("--max-streams must be at least 1.")
+    if args.batch_wait is not None and args.batch_wait <= 0:
+        parser.error("--batch-wait must be greater than 0.")
+    for field in args.label_fields:
+        if label_name(field) in args.labels:
+            logger.warning(f"--label-fields '{field}' overrides the static label '{label_name(field)}' from --labels.")
+        if fresh_trials and label_name(field) == "trial":
+            parser.error(f"--label-fields '{field}' would override the per-trial 'trial' label; rename it or run one trial.")
+    if args.max_docs is not None and args.max_docs < 1:
+        parser.error("--max-docs must be at least 1.")
+    if args.ingest_rate is not None and args.ingest_rate <= 0:
+        parser.error("--ingest-rate must be greater than 0.")
+    if args.batch_size < 0:
+        parser.error("--batch-size cannot be negative.")
+    if args.batch_size == 0:
+        if args.batch_bytes is None:
+            parser.error("--batch-size 0 needs --batch-bytes.")
+        if args.auto_batch:
+            parser.error("--auto-batch needs a --batch-size to start from.")
+    if args.max_retries < 0:
+        parser.error("--max-retries cannot be negative.")
+    if args.retry_backoff <= 0:
+        parser.error("--retry-backoff must be greater than 0.")
+    if args.retry_budget < 0:
+        parser.error("--retry-budget cannot be negative.")
+    if args.speed is not None and args.speed <= 0:
+        parser.error("--speed must be greater than 0.")
+    if args.replay:
+        if args.ingest_rate is not None:
+            parser.error("--replay cannot be combined with --ingest-rate; use --speed to scale the recorded rate.")
+    elif args.speed is not None:
+        logger.warning("--speed is ignored without --replay.")
+
+    if args.target_qps is not None and args.target_qps <= 0:
+        parser.error("--target-qps must be greater than 0.")
+    if args.query_duration is not None and args.query_duration <= 0:
+        parser.error("--query-duration must be greater than 0.")
+    if args.query_clients is not None and args.query_clients < 1:
+        parser.error("--query-clients must be at least 1.")
+    query_clients = args.query_clients or (DEFAULT_MAX_OUTSTANDING if args.target_qps else 1)
+    if args.query_passes is not None:
+        if args.query_passes < 2:
+            parser.error("--query-passes must be at least 2.")
+        if args.target_qps is not None or args.query_duration is not None:
+            parser.error("--query-passes cannot be combined with --target-qps or --query-duration.")
+        if args.mixed:
+            logger.warning("--query-passes is ignored with --mixed.")
+        if warmup_seconds:
+            logger.warning("No query warmup is run with --query-passes: its first pass measures the cold caches.")
+    if args.clear_cache and not args.query_passes:
+        logger.warning("--clear-cache is ignored without --query-passes.")
+
+    if args.reader_workers < 1:
+        parser.error("--reader-workers must be at least 1.")
+
+    if args.compression_level is not None:
+        if args.compression == "none":
+            logger.warning("--compression-level is ignored without --compression.")
+        elif not 1 <= args.compression_level <= 9:
+            parser.error("--compression-level must be between 1 and 9 for gzip.")
+
     if args.queries_file and not args.queries_file.is_file():
         logger.error(f"Queries file specified but not found: {args.queries_file}")
         return
 
+    if args.compare_encodings:
+        if not args.data_file:
+            parser.error("--data-file is required with --compare-encodings.")
+        comparison = compare_push_encodings(str(args.data_file), args.labels, args.batch_size, label_fields=args.label_fields,
+                                            max_streams=args.max_streams)
+        print("\nPush Encoding Comparison:")
+        for key, value in comparison.items():
+            if isinstance(value, dict):
+                print(f"  {key}:")
+                for sub_key, sub_value in value.items():
+                    print(f"    {sub_key}: {sub_value}")
+            else:
+                print(f"  {key}: {value}")
+        return
+
     if args.no_verify_certs:
         logger.warning("SSL certificate verification is disabled.")
         # Warning filtering is handled within LokiClient now
@@ -84,7 +321,11 @@ def main():
             password=args.password,
             api_key=args.api_key,
             verify_certs=not args.no_verify_certs,
-            timeout=args.timeout
+            timeout=args.timeout,
+            encoding=args.encoding,
+            compression=args.compression,
+            compression_level=args.compression_level,
+            max_connections=max(10, args.concurrency, query_clients if args.mixed else 0)
         )
 
         # Check connection
@@ -96,48 +337,127 @@ def main():
         logger.error(f"An unexpected error occurred during Loki client initialization or connection check: {e}")
         return
 
-    # Run Benchmarks
-    if not args.query_only:
-        logger.info("--- Starting Ingestion Benchmark ---")
-        ingestion_results = run_ingestion(
-            loki_client,
-            args.labels, # Pass labels dictionary
-            str(args.data_file),
-            args.batch_size
-        )
-        logger.info("--- Ingestion Benchmark Finished ---")
-        print("\nIngestion Results:")
-        if isinstance(ingestion_results, dict):
-            for key, value in ingestion_results.items():
-                # Truncate long error lists
-                if key == 'error_details' and isinstance(value, list) and len(value) > 5:
-                    print(f"  {key}: {len(value)} errors (details truncated: {value[:5]}...)")
-                else:
-                    print(f"  {key}: {value}")
+    backend = {"name": "loki"}
+    if args.results_file:
+        build_info = loki_client.build_info()
+        if build_info:
+            backend.update(version=build_info.get("version"), revision=build_info.get("revision"))
+    generate_config = None
+    if args.generate and not args.query_only:
+        try:
+            generate_config = load_config(args.generate_config) if args.generate_config else {}
+            generator_format = build_generator(args.generate, generate_config).fmt
+        except (OSError, TypeError, ValueError) as e:
+            parser.error(f"Invalid --generate-config: {e}")
+        if generator_format != "ndjson" and not args.passthrough:
+            parser.error("Plain-text generated lines can only be pushed with --passthrough.")
+        if args.max_docs is not None:
+            logger.warning("--max-docs is ignored with --generate.")
+        args.max_docs = args.generate
+    elif args.generate_config:
+        logger.warning("--generate-config is ignored without --generate.")
+    ingest_options = dict(batch_size=args.batch_size, concurrency=args.concurrency, reader_workers=args.reader_workers,
+                          reader_ordered=not args.reader_unordered, passthrough=args.passthrough,
+                          max_docs=args.max_docs, ingest_rate=args.ingest_rate,
+                          series_interval=args.series_interval if args.series_file or repeated or args.resources else None,
+                          visibility_every=args.visibility_every, visibility_poll_interval=args.visibility_poll_interval,
+                          visibility_timeout=args.visibility_timeout, label_fields=args.label_fields,
+                          max_streams=args.max_streams, batch_wait=args.batch_wait, timestamp_mode=args.timestamps,
+                          timestamp_span=args.timestamp_span * 60 if args.timestamp_span else None,
+                          replay_speed=(args.speed or 1.0) if args.replay else None, auto_batch=args.auto_batch,
+                          max_retries=args.max_retries, retry_backoff=args.retry_backoff, retry_budget=args.retry_budget,
+                          batch_bytes=args.batch_bytes, monitor_resources=args.resources)
+    query_options = dict(limit=args.query_limit, target_qps=args.target_qps, clients=query_clients, order=args.query_order,
+                         bypass_cache=args.bypass_cache)
+
+    def run_once(trial, warmup):
+        """Runs one trial: the mixed workload, or ingestion followed by queries. Returns its results."""
+        series_file = None if warmup else trial_path(args.series_file, trial, args.trials)
+        run_results = {}
+        trial_ingest_options = ingest_options
+        if generate_config is not None:
+            # A fresh generator per trial: the same seed gives every trial the same data
+            trial_ingest_options = dict(ingest_options, generator=build_generator(args.generate, generate_config))
+        labels = args.labels
+        if fresh_trials:
+            labels = dict(args.labels, trial=f"warmup{trial + 1}" if warmup else str(trial + 1))
+
+        # Run Benchmarks
+        if args.mixed:
+            logger.info("--- Starting Mixed Workload Benchmark ---")
+            mixed_results = run_mixed(loki_client, labels, str(args.data_file), str(args.queries_file),
+                                      duration=args.duration, interval=args.series_interval,
+                                      ingest_options=trial_ingest_options, query_options=query_options)
+            logger.info("--- Mixed Workload Benchmark Finished ---")
+            if repeated:
+                mixed_results["ingestion"]["steady_state"] = steady_state(mixed_results["series"], "ingested_docs_per_sec",
+                                                                          warmup_seconds)
+            print_results("Mixed Workload Results", {k: v for k, v in mixed_results.items() if k in ("mode", "total_time", "resources")})
+            print_results("Ingestion Results", mixed_results["ingestion"])
+            print_results("Query Results", mixed_results["queries"])
+            print("\nTime Series:")
+            print(format_series(mixed_results["series"], SERIES_COLUMNS))
+            if series_file:
+                write_series(mixed_results["series"], series_file)
+            return {"ingestion": mixed_results["ingestion"], "queries": mixed_results["queries"],
+                    "mixed": {k: v for k, v in mixed_results.items() if k not in ("ingestion", "queries")}}
+
+        if not args.query_only:
+            logger.info("--- Starting Ingestion Benchmark ---")
+            ingestion_results = run_ingestion(
+                loki_client,
+                labels, # Pass labels dictionary
+                str(args.data_file),
+                **trial_ingest_options
+            )
+            logger.info("--- Ingestion Benchmark Finished ---")
+            if repeated and ingestion_results.get("series") is not None:
+                ingestion_results["steady_state"] = steady_state(ingestion_results["series"], "ingested_docs_per_sec",
+                                                                 warmup_seconds)
+            print_results("Ingestion Results", ingestion_results)
+            if series_file and ingestion_results.get("series") is not None:
+                write_series(ingestion_results["series"], series_file)
+            run_results["ingestion"] = ingestion_results
         else:
-            print("  Ingestion benchmark did not return expected results.")
+            logger.info("Skipping ingestion benchmark (--query-only specified).")
+
+        if args.queries_file:
+            if warmup_seconds and not args.query_passes:
+                logger.info(f"Warming up queries for {warmup_seconds:g}s (discarded)")
+                run_queries(loki_client, str(args.queries_file), duration=warmup_seconds, **query_options)
+            logger.info("\n--- Starting Query Benchmark ---")
+            # Construct time_range if args exist
+            # time_range = (args.query_start, args.query_end, args.query_step) if args.query_start and args.query_end else None
+            query_results = run_queries(
+                loki_client,
+                str(args.queries_file),
+                duration=args.query_duration,
+                passes=args.query_passes,
+                clear_cache=args.clear_cache,
+                **query_options
+                # time_range=time_range # Pass time range if implemented
+            )
+            logger.info("--- Query Benchmark Finished ---")
+            print_results("Query Results", query_results)
+            run_results["queries"] = query_results
+        elif args.query_only:
+            logger.error("Query-only mode specified, but no queries file provided or found.")
+        return run_results
+
+    if args.profile:
+        trial_results = run_profiled(lambda: run_trials(run_once, args.trials, warmup_trials), args.profile)
     else:
-        logger.info("Skipping ingestion benchmark (--query-only specified).")
-
-    if args.queries_file:
-        logger.info("\n--- Starting Query Benchmark ---")
-        # Construct time_range if args exist
-        # time_range = (args.query_start, args.query_end, args.query_step) if args.query_start and args.query_end else None
-        query_results = run_queries(
-            loki_client,
-            str(args.queries_file),
-            limit=args.query_limit
-            # time_range=time_range # Pass time range if implemented
-        )
-        logger.info("--- Query Benchmark Finished ---")
-        print("\nQuery Results:")
-        if isinstance(query_results, dict):
-            for key, value in query_results.items():
-                print(f"  {key}: {value}")
-        else:
-            print("  Query benchmark did not return expected results.")
-    elif args.query_only:
-        logger.error("Query-only mode specified, but no queries file provided or found.")
+        trial_results = run_trials(run_once, args.trials, warmup_trials)
+    if args.trials > 1:
+        summary = summarize_trials(trial_results)
+        reset_note = ", each pushing to its own trial=<n> streams" if fresh_trials else ""
+        print(f"\nTrial Summary ({args.trials} trials{reset_note}, mean ± 95% CI):")
+        if fresh_trials and args.queries_file:
+            print("  Queries see the entries of every earlier trial unless they select the trial label.")
+        print(format_trial_summary(summary))
+        save_results(args, {"trials": trial_results, "summary": summary}, backend, query_clients=query_clients)
+    else:
+        save_results(args, trial_results[0], backend, query_clients=query_clients)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
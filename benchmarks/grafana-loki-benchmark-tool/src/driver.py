@@ -0,0 +1,207 @@
+# Grafana Loki driver for the shared benchmark core (common/core.py)
+
+import json
+import logging
+import time
+from datetime import datetime, timezone, timedelta
+from .loki_client import LokiClient
+from . import loki_proto
+from .async_push import AsyncPushEngine
+from .streams import StreamMapper
+from common import fastjson
+from common.core import BackendDriver
+from common.passthrough import json_string
+from common.resources import parse_prometheus, pick_stats
+from common.timestamps import TimestampMapper
+
+logger = logging.getLogger(__name__)
+
+# --- Server statistics for the resource monitor ---
+# (column, Prometheus metric, scale), each metric summed over its label sets
+_METRIC_COUNTERS = (
+    ("server_lines_received", "loki_distributor_lines_received_total", 1),
+    ("server_bytes_received", "loki_distributor_bytes_received_total", 1),
+    ("server_discarded_samples", "loki_discarded_samples_total", 1),
+    ("server_chunks_flushed", "loki_ingester_chunks_flushed_total", 1),
+    ("server_cpu_seconds", "process_cpu_seconds_total", 1),
+)
+_METRIC_GAUGES = (
+    ("server_memory_streams", "loki_ingester_memory_streams", 1),
+    ("server_memory_chunks", "loki_ingester_memory_chunks", 1),
+    ("server_flush_queue", "loki_ingester_flush_queue_length", 1),
+    ("server_rss_bytes", "process_resident_memory_bytes", 1),
+)
+SERVER_STATS_TIMEOUT = 5  # Seconds; a slow /metrics must not hold up the sampler for long
+# Loki's query frontend splits a range query into sub-queries of this interval (split_queries_by_interval)
+# and caches results per sub-query, so only a range disjoint from every earlier one, and at least this
+# far from it, finds its results cache empty
+QUERY_SPLIT_INTERVAL_NS = 3600 * 10**9
+
+# --- Helper to turn a document into a Loki entry ---
+_ORIGINAL_TIMESTAMPS = TimestampMapper("original")
+
+def _to_loki_entry(doc):
+    """Returns a [timestamp_ns, log_line] pair for a log document, keeping its own timestamp (now if missing)."""
+    return [_ORIGINAL_TIMESTAMPS.ns_value(_ORIGINAL_TIMESTAMPS.doc_value(doc)), json.dumps(doc)]
+
+class LokiDriver(BackendDriver):
+    """
+    Pushes log entries to Loki streams and runs LogQL queries.
+
+    Each batch is split into streams by a StreamMapper (see streams.py): one stream
+    with the static labels, or one per combination of the promoted label fields, up
+    to a cap. All of a batch's streams go into the same push request.
+
+    Push bodies are built on the reading thread in the client's encoding (JSON or
+    snappy-compressed protobuf). In passthrough mode they are built straight from
+    the raw line bytes: the raw line becomes the log line as-is and the timestamp
+    is located without decoding the document; for JSON the payload around the
+    entries is spliced together from bytes, for protobuf the line bytes go into the
+    PushRequest unchanged.
+
+    A requests.Session is not thread-safe, so `clone` gives every worker thread and
+    query client its own LokiClient. The clones share this driver's compressor, so
+    the compression stats cover the whole run. With concurrency > 1 the pushes are
+    sent by the asyncio engine instead of worker threads (see async_push.py).
+
+    Loki has no API to clear its caches, so `clear_cache` moves the query window
+    instead: back by its own length, and at least one split interval, to a range no
+    earlier query has touched. The queries after it find no cached results for
+    their range, and repeating them over the same window can hit the cache. With
+    `bypass_cache` every query asks the query frontend to skip its results cache
+    (Cache-Control: no-cache) instead, so every run measures the uncached path.
+    """
+
+    name = "Loki"
+    request_name = "push"
+
+    def __init__(self, loki_client: LokiClient, labels: dict = None, passthrough: bool = False, limit: int = 1000,
+                 time_range_minutes: int = 60, label_fields: list = None, max_streams: int = 1000,
+                 timestamps: TimestampMapper = None, bypass_cache: bool = False):
+        """
+        Args:
+            loki_client: An initialized LokiClient (URL, auth, TLS, push encoding and compression).
+            labels: The labels applied to every pushed stream.
+            passthrough: Build push bodies from the raw line bytes instead of decoded documents.
+            limit: Maximum number of entries returned per query.
+            time_range_minutes: The duration in minutes of the query range, ending when the driver is created.
+            label_fields: Document fields promoted to stream labels (None: a single stream).
+            max_streams: Cap on the number of distinct streams (see StreamMapper).
+            timestamps: Entry timestamps (see common/timestamps.py; default: each document's own, now if missing).
+            bypass_cache: Ask Loki not to answer any query from its results cache.
+        """
+        self.client = loki_client
+        self.labels = labels or {"job": "benchmark_ingest"}
+        self.raw = passthrough
+        self.limit = limit
+        self.time_range_minutes = time_range_minutes
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - timedelta(minutes=time_range_minutes)
+        self.time_range = (str(int(start_time.timestamp() * 1e9)), str(int(end_time.timestamp() * 1e9)))
+        self.streams = StreamMapper(self.labels, label_fields, max_streams)
+        self.timestamps = timestamps or TimestampMapper("original")
+        self._json_prefixes = {}  # id(stream labels) -> b'{"stream":{...},"values":['
+        self._stats_client = None  # Own session for the sampling thread
+        self.bypass_cache = bypass_cache
+        self._window_shift_ns = max(time_range_minutes * 60 * 10**9, QUERY_SPLIT_INTERVAL_NS)
+        self._cache_clears = [0]  # Shared with the clones, so they all query the moved window
+
+    def encode_batch(self, docs):
+        # Timestamps first and serialization second, so the two are timed as separate stages. The
+        # stream mapper builds the entries in document order, so each one takes the next timestamp.
+        stamps_start = time.perf_counter()
+        stamps = iter(self._stamps(docs))
+        if self.stages is not None:
+            self.stages.add("timestamps", time.perf_counter() - stamps_start)
+        if not self.raw:
+            return self.client.encode_push(self.streams.group(docs, lambda doc: [next(stamps), json.dumps(doc)]))
+        if self.client.encoding == "protobuf":
+            return loki_proto.encode_push_body(self.streams.group_raw(docs, lambda line: (next(stamps), line)))
+        to_entry = lambda line: b'["' + next(stamps).encode() + b'",' + json_string(line) + b']'
+        parts = []
+        for stream in self.streams.group_raw(docs, to_entry):
+            prefix = self._json_prefixes.get(id(stream["stream"]))
+            if prefix is None:
+                prefix = self._json_prefixes[id(stream["stream"])] = b'{"stream":' + fastjson.dumps(stream["stream"]) + b',"values":['
+            parts.append(prefix + b','.join(stream["values"]) + b']}')
+        return b'{"streams":[' + b','.join(parts) + b']}'
+
+    def doc_size(self, doc):
+        line = doc if self.raw else fastjson.dumps(doc)
+        if self.client.encoding == "protobuf":
+            return len(line)
+        # The line as a JSON string in ["timestamp_ns","line"]: quotes and backslashes are escaped
+        return len(line) + line.count(b'"') + line.count(b'\\') + 25
+
+    def _stamps(self, docs):
+        """The timestamp_ns string of every entry of a batch: from the decoded document, or located in the raw line."""
+        timestamps = self.timestamps
+        if self.raw:
+            return [timestamps.ns_value(timestamps.line_value(line)) for line in docs]
+        return [timestamps.ns_value(timestamps.doc_value(doc)) for doc in docs]
+
+    def send_batch(self, body, doc_count):
+        success, error = self.client.push_raw(body)
+        if success:
+            return doc_count, 0, []
+        return 0, doc_count, [error if error.startswith("HTTP ") else f"RequestError: {error}"]
+
+    def parse_query(self, line):
+        return None if line.startswith('#') else line
+
+    def run_query(self, query):
+        # LokiClient.query logs the failure and returns None
+        time_range = self.time_range
+        if self._cache_clears[0]:
+            shift = self._cache_clears[0] * self._window_shift_ns
+            time_range = (str(int(time_range[0]) - shift), str(int(time_range[1]) - shift))
+        return self.client.query(query, limit=self.limit, time_range=time_range, no_cache=self.bypass_cache) is not None
+
+    def clear_cache(self):
+        self._cache_clears[0] += 1
+        shift_minutes = self._cache_clears[0] * self._window_shift_ns / 60e9
+        logger.info(f"Moved the query window {shift_minutes:g} minutes back, past every range queried so far.")
+
+    def health(self):
+        return self.client.check_connection()
+
+    def find_marker(self, marker, doc):
+        # Search around the entry's timestamp, which may be far from now for replayed data
+        ts = self.timestamps.line_value(doc) if self.raw else self.timestamps.doc_value(doc)
+        if ts:
+            entry_ns = int(self.timestamps.map(ts) * 1e9)
+            time_range = (str(entry_ns - 1_000_000_000), str(entry_ns + 1_000_000_000))
+        else:
+            now_ns = time.time_ns()
+            time_range = (str(now_ns - 600_000_000_000), str(now_ns + 60_000_000_000))
+        selector = ",".join(f'{key}="{value}"' for key, value in self.labels.items())
+        response = self.client.query(f'{{{selector}}} |= "{marker}"', limit=1, time_range=time_range)
+        if response is None:
+            return False
+        return any(stream.get("values") for stream in response.get("data", {}).get("result", []))
+
+    def clone(self):
+        clone = LokiDriver.__new__(LokiDriver)
+        clone.__dict__.update(self.__dict__)
+        clone.client = self.client.clone()
+        clone.client.compressor = self.client.compressor
+        return clone
+
+    def dispatcher(self, concurrency):
+        if concurrency <= 1:
+            return None
+        engine = AsyncPushEngine.from_client(self.client, concurrency=concurrency)
+        return lambda payloads, progress, on_ack, retry: engine.run(payloads, progress=progress, on_ack=on_ack, retry=retry)
+
+    def describe(self):
+        return {"passthrough": self.raw, "encoding": self.client.encoding, "timestamps": self.timestamps.describe()}
+
+    def stats(self, total_time):
+        return {"compression": self.client.compressor.stats(total_time), "streams": self.streams.stats()}
+
+    def server_stats(self):
+        # Distributor and ingester counters from /metrics (single binary, or a URL that routes it)
+        if self._stats_client is None:
+            self._stats_client = self.client.clone()
+        values = parse_prometheus(self._stats_client.metrics(timeout=SERVER_STATS_TIMEOUT))
+        return pick_stats(values, _METRIC_COUNTERS, _METRIC_GAUGES)
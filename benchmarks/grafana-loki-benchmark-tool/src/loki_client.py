@@ -1,29 +1,67 @@
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 import warnings
 import json
 from urllib.parse import urljoin
+from . import loki_proto
+from common.compression import Compressor
 
 logger = logging.getLogger(__name__)
 
+PUSH_ENCODINGS = ("json", "protobuf")
+# Request-body compression Loki's push endpoint accepts (Content-Encoding)
+REQUEST_COMPRESSION = ("none", "gzip")
+
+def encode_json_push(streams):
+    """Encodes stream objects as a JSON push request body."""
+    return json.dumps({"streams": streams}).encode('utf-8')
+
 class LokiClient:
-    def __init__(self, loki_url, user=None, password=None, api_key=None, verify_certs=True, timeout=30):
-        """Initializes the Grafana Loki client."""
+    def __init__(self, loki_url, user=None, password=None, api_key=None, verify_certs=True, timeout=30, encoding="json",
+                 compression="none", compression_level=None, max_connections=10):
+        """
+        Initializes the Grafana Loki client.
+
+        `encoding` selects the push body format: "json" or "protobuf" (snappy-compressed
+        logproto.PushRequest, Loki's native ingest format). `compression` additionally
+        compresses push bodies on the wire ("none" or "gzip", sent as Content-Encoding);
+        `self.compressor` records the CPU time and bytes this costs. `max_connections`
+        sizes the session's connection pool for callers that share it across threads.
+        """
+        if encoding not in PUSH_ENCODINGS:
+            raise ValueError(f"Unsupported push encoding '{encoding}'. Use one of: {', '.join(PUSH_ENCODINGS)}")
+        if compression not in REQUEST_COMPRESSION:
+            raise ValueError(f"Unsupported request compression '{compression}'. Use one of: {', '.join(REQUEST_COMPRESSION)}")
         self.loki_url = loki_url.rstrip('/') + '/' # Ensure trailing slash for urljoin
         self.user = user
         self.password = password
         self.api_key = api_key # Note: Loki often uses headers like X-Scope-OrgID or Basic Auth
         self.verify_certs = verify_certs
         self.timeout = timeout
+        self.encoding = encoding
+        self.push_content_type = loki_proto.CONTENT_TYPE if encoding == "protobuf" else "application/json"
+        self.compressor = Compressor(compression, compression_level)
+        self.max_connections = max_connections
         self.session = self._create_session()
 
         if not self.verify_certs:
             warnings.filterwarnings("ignore", message="Unverified HTTPS request")
 
+    def clone(self):
+        """Returns a client with the same settings and its own session (and connection pool)."""
+        return LokiClient(self.loki_url, user=self.user, password=self.password, api_key=self.api_key,
+                          verify_certs=self.verify_certs, timeout=self.timeout, encoding=self.encoding,
+                          compression=self.compressor.algorithm, compression_level=self.compressor.level,
+                          max_connections=self.max_connections)
+
     def _create_session(self):
         """Creates a requests session with authentication if provided."""
         session = requests.Session()
         session.verify = self.verify_certs
+        adapter = HTTPAdapter(pool_connections=self.max_connections, pool_maxsize=self.max_connections)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
 
         if self.api_key:
             # Loki might use a specific header for API keys, e.g., 'Authorization: Bearer <key>'
@@ -77,23 +115,48 @@ class LokiClient:
                          ...
                      ]
         """
+        return self.push_raw(self.encode_push(streams))
+
+    def encode_push(self, streams):
+        """Encodes stream objects as a push request body in the client's encoding."""
+        if self.encoding == "protobuf":
+            return loki_proto.encode_push_body(streams)
+        return encode_json_push(streams)
+
+    def push_raw(self, body):
+        """
+        Pushes an already-encoded push payload to Loki's /loki/api/v1/push endpoint.
+
+        Args:
+            body: The complete request body in the client's encoding (a JSON
+                  `{"streams": [...]}` document or a snappy-compressed PushRequest).
+
+        Returns:
+            A tuple (success, error_message). HTTP error responses are reported as
+            "HTTP <status>: <body>", like the async push engine does.
+        """
         endpoint = "loki/api/v1/push"
-        payload = {"streams": streams}
+        headers = {'Content-Type': self.push_content_type}
+        if self.compressor.enabled:
+            headers['Content-Encoding'] = self.compressor.content_encoding
         try:
-            response = self._make_request('POST', endpoint, data=json.dumps(payload))
+            body = self.compressor.compress(body)
+            response = self._make_request('POST', endpoint, data=body, headers=headers)
             # Loki push API returns 204 No Content on success
             if response.status_code == 204:
-                logger.debug(f"Successfully pushed {len(streams)} streams to Loki.")
+                logger.debug(f"Successfully pushed {len(body)} bytes to Loki.")
                 return True, None
             else:
                 # Should be caught by raise_for_status, but as a fallback
                 logger.warning(f"Loki push API returned unexpected status: {response.status_code} - Body: {response.text}")
                 return False, f"Unexpected status: {response.status_code}"
+        except requests.exceptions.HTTPError as e:
+            return False, f"HTTP {e.response.status_code}: {e.response.text[:200]}"
         except Exception as e:
             logger.error(f"Failed to push logs to Loki: {e}")
             return False, str(e) # Return error message
 
-    def query(self, logql_query, limit=100, time_range=None):
+    def query(self, logql_query, limit=100, time_range=None, no_cache=False):
         """
         Executes a LogQL query against Loki's /loki/api/v1/query or /loki/api/v1/query_range endpoint.
 
@@ -103,6 +166,8 @@ class LokiClient:
             time_range: Optional tuple (start_time, end_time) for range queries.
                         Times should be in Unix timestamp (seconds) or RFC3339 format.
                         If None, performs an instant query.
+            no_cache: Send `Cache-Control: no-cache`, which asks Loki's query frontend to
+                      skip its results cache for this query.
 
         Returns:
             The parsed JSON response from Loki, or None if an error occurs.
@@ -123,12 +188,27 @@ class LokiClient:
             # Optional 'time' param for instant query time, defaults to now
 
         try:
-            response = self._make_request('GET', endpoint, params=params)
+            headers = {'Cache-Control': 'no-cache'} if no_cache else None
+            response = self._make_request('GET', endpoint, params=params, headers=headers)
             return response.json() # Return parsed JSON
         except Exception as e:
             logger.error(f"Failed to execute LogQL query '{logql_query}': {e}")
             return None # Indicate error
 
+    def build_info(self):
+        """Returns Loki's build information (version, revision, ...) or None if it is not available."""
+        try:
+            return self._make_request('GET', "loki/api/v1/status/buildinfo").json()
+        except Exception as e:
+            logger.warning(f"Could not read Loki build info: {e}")
+            return None
+
+    def metrics(self, timeout=None):
+        """Returns the text of Loki's Prometheus /metrics endpoint. Raises on failure, without logging."""
+        response = self.session.get(urljoin(self.loki_url, "metrics"), timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.text
+
     def check_connection(self):
         """Checks if the Loki instance is reachable and ready."""
         endpoint = "ready" # Use the /ready endpoint
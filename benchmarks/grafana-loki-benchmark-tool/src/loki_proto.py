@@ -0,0 +1,142 @@
+# Snappy-compressed protobuf encoding of Loki push requests (logproto.PushRequest)
+#
+# The messages are encoded by hand so no generated code or protoc toolchain is needed:
+#
+#   message PushRequest   { repeated StreamAdapter streams = 1; }
+#   message StreamAdapter { string labels = 1; repeated EntryAdapter entries = 2; }
+#   message EntryAdapter  { google.protobuf.Timestamp timestamp = 1; string line = 2; }
+#   message Timestamp     { int64 seconds = 1; int32 nanos = 2; }
+
+try:
+    import snappy
+except ImportError:  # Only required for the protobuf encoding
+    snappy = None
+
+CONTENT_TYPE = "application/x-protobuf"
+
+# Wire types
+_VARINT = 0
+_LEN = 2
+
+def _require_snappy():
+    if snappy is None:
+        raise RuntimeError("The protobuf push encoding requires the 'python-snappy' package (pip install python-snappy).")
+
+# --- Encoding ---
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _tag(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+def _len_field(field, payload):
+    return _tag(field, _LEN) + _varint(len(payload)) + payload
+
+def format_labels(labels):
+    """Formats a label dict the way Loki expects it in StreamAdapter.labels: {k="v", ...}."""
+    pairs = []
+    for key, value in sorted(labels.items()):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{escaped}"')
+    return '{' + ', '.join(pairs) + '}'
+
+def _encode_entry(timestamp_ns, line):
+    seconds, nanos = divmod(int(timestamp_ns), 1_000_000_000)
+    timestamp = b''
+    if seconds:
+        timestamp += _tag(1, _VARINT) + _varint(seconds)
+    if nanos:
+        timestamp += _tag(2, _VARINT) + _varint(nanos)
+    if isinstance(line, str):
+        line = line.encode('utf-8')
+    return _len_field(1, timestamp) + _len_field(2, line)
+
+def encode_push_request(streams):
+    """
+    Encodes Loki stream objects as an uncompressed PushRequest message.
+
+    Args:
+        streams: A list of {"stream": {labels}, "values": [[timestamp_ns, line], ...]} objects,
+                 the same structure used for the JSON push API. Lines may be str or bytes.
+
+    Returns:
+        The serialized PushRequest as bytes.
+    """
+    out = bytearray()
+    for stream in streams:
+        body = bytearray(_len_field(1, format_labels(stream["stream"]).encode('utf-8')))
+        for timestamp_ns, line in stream["values"]:
+            body += _len_field(2, _encode_entry(timestamp_ns, line))
+        out += _len_field(1, bytes(body))
+    return bytes(out)
+
+def encode_push_body(streams):
+    """Returns the snappy-compressed PushRequest body for the given stream objects."""
+    _require_snappy()
+    return snappy.compress(encode_push_request(streams))
+
+# --- Decoding (used by the local stand-in server) ---
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def _iter_fields(data):
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if wire_type == _VARINT:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == _LEN:
+            length, pos = _read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type} for field {field}")
+        yield field, value
+
+def decode_push_request(data):
+    """
+    Decodes an uncompressed PushRequest into a list of (labels, [(timestamp_ns, line), ...]).
+    """
+    streams = []
+    for field, stream_bytes in _iter_fields(data):
+        if field != 1:
+            continue
+        labels = ''
+        entries = []
+        for stream_field, value in _iter_fields(stream_bytes):
+            if stream_field == 1:
+                labels = value.decode('utf-8')
+            elif stream_field == 2:
+                seconds = nanos = 0
+                line = b''
+                for entry_field, entry_value in _iter_fields(value):
+                    if entry_field == 1:
+                        for ts_field, ts_value in _iter_fields(entry_value):
+                            if ts_field == 1:
+                                seconds = ts_value
+                            elif ts_field == 2:
+                                nanos = ts_value
+                    elif entry_field == 2:
+                        line = entry_value
+                entries.append((seconds * 1_000_000_000 + nanos, line.decode('utf-8')))
+        streams.append((labels, entries))
+    return streams
+
+def decode_push_body(body):
+    """Decompresses and decodes a snappy-compressed PushRequest body."""
+    _require_snappy()
+    return decode_push_request(snappy.decompress(body))
@@ -0,0 +1,241 @@
+# Local stand-in for the Grafana Loki HTTP API, used to validate the benchmark tool without a cluster
+
+import argparse
+import gzip
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from . import loki_proto
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+RECENT_ENTRIES = 200000  # Entries kept for line-filter queries
+_LINE_FILTER = re.compile(r'\|=\s*"((?:[^"\\]|\\.)*)"')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def _parse_labels(labels):
+    """Parses a {k="v", ...} label string (see loki_proto.format_labels) back into a dict."""
+    return {key: json.loads(f'"{value}"') for key, value in _LABEL.findall(labels)}
+
+class StandinState:
+    """
+    Counters describing everything the stand-in has received.
+
+    The most recent entries are kept so that queries with a `|= "text"` line filter
+    can find them. An entry only becomes searchable `visibility_delay` seconds
+    after its push was acknowledged, emulating the ingester lag that the
+    benchmark's visibility probe measures.
+
+    Optional limits emulate Loki's push limits: bodies larger than `max_body_bytes`
+    are rejected with 413, and pushes beyond a token bucket of `rate_limit_bytes`
+    per second (holding up to `burst_bytes`) with 429, like the per-tenant
+    ingestion rate limit. `push_overhead` seconds are spent on every push, so
+    batch sizing has a measurable cost per request.
+    """
+
+    def __init__(self, visibility_delay=0.0, max_body_bytes=None, rate_limit_bytes=None, burst_bytes=None,
+                 push_overhead=0.0):
+        self.lock = threading.Lock()
+        self.visibility_delay = visibility_delay
+        self.max_body_bytes = max_body_bytes
+        self.rate_limit_bytes = rate_limit_bytes
+        self.burst_bytes = burst_bytes or rate_limit_bytes
+        self.push_overhead = push_overhead
+        self._tokens = self.burst_bytes
+        self._refilled = time.monotonic()
+        self.recent = deque(maxlen=RECENT_ENTRIES)  # (searchable_at, labels, timestamp_ns, line)
+        self.pushes = {"json": 0, "protobuf": 0}
+        self.streams = 0
+        self.active_streams = set()  # Distinct label sets seen
+        self.entries = 0
+        self.body_bytes = 0
+        self.rejected = 0
+        self.too_large = 0
+        self.rate_limited = 0
+
+    def admit(self, body_bytes):
+        """Applies the push limits to a body; returns the rejecting HTTP status and message, or None."""
+        if self.max_body_bytes and body_bytes > self.max_body_bytes:
+            with self.lock:
+                self.too_large += 1
+            return 413, f"request body too large: {body_bytes} bytes, limit {self.max_body_bytes}"
+        if self.rate_limit_bytes:
+            with self.lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst_bytes, self._tokens + (now - self._refilled) * self.rate_limit_bytes)
+                self._refilled = now
+                if body_bytes > self._tokens:
+                    self.rate_limited += 1
+                    return 429, f"Ingestion rate limit exceeded (limit: {self.rate_limit_bytes} bytes/sec)"
+                self._tokens -= body_bytes
+        return None
+
+    def record_push(self, encoding, streams, body_bytes):
+        searchable_at = time.monotonic() + self.visibility_delay
+        with self.lock:
+            self.pushes[encoding] += 1
+            self.streams += len(streams)
+            self.entries += sum(len(entries) for _, entries in streams)
+            self.body_bytes += body_bytes
+            for labels, entries in streams:
+                self.active_streams.add(labels)
+                self.recent.extend((searchable_at, labels, ts, line) for ts, line in entries)
+
+    def search(self, logql_query, limit):
+        """Returns the streams result for a query's `|= "text"` line filters (empty without filters)."""
+        needles = [json.loads(f'"{needle}"') for needle in _LINE_FILTER.findall(logql_query)]
+        if not needles:
+            return []
+        now = time.monotonic()
+        with self.lock:
+            entries = list(self.recent)
+        streams = {}
+        for searchable_at, labels, ts, line in reversed(entries):
+            if searchable_at <= now and all(needle in line for needle in needles):
+                streams.setdefault(labels, []).append([str(ts), line])
+                limit -= 1
+                if limit <= 0:
+                    break
+        return [{"stream": _parse_labels(labels), "values": values} for labels, values in streams.items()]
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "pushes": dict(self.pushes),
+                "streams": self.streams,
+                "active_streams": len(self.active_streams),
+                "entries": self.entries,
+                "body_bytes": self.body_bytes,
+                "rejected": self.rejected,
+                "too_large": self.too_large,
+                "rate_limited": self.rate_limited,
+            }
+
+    def metrics(self):
+        """The snapshot in Prometheus text format, under the names of Loki's own distributor and ingester metrics."""
+        s = self.snapshot()
+        discarded = s["too_large"] + s["rate_limited"] + s["rejected"]  # Rejected pushes, not their entries
+        samples = [
+            ("loki_distributor_lines_received_total", "counter", s["entries"]),
+            ("loki_distributor_bytes_received_total", "counter", s["body_bytes"]),
+            ("loki_discarded_samples_total", "counter", discarded),
+            ("loki_ingester_memory_streams", "gauge", s["active_streams"]),
+        ]
+        return "".join(f"# TYPE {name} {kind}\n{name} {value}\n" for name, kind, value in samples)
+
+def _decode_push(content_type, body):
+    """Decodes a push body into [(labels, [(timestamp_ns, line), ...]), ...] and names its encoding."""
+    if content_type.startswith(loki_proto.CONTENT_TYPE):
+        return "protobuf", loki_proto.decode_push_body(body)
+    payload = json.loads(body)
+    streams = []
+    for stream in payload["streams"]:
+        entries = [(int(ts), line) for ts, line in stream["values"]]
+        streams.append((loki_proto.format_labels(stream["stream"]), entries))
+    return "json", streams
+
+def make_handler(state):
+    class StandinHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send(self, status, body=b"", content_type="application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return self.rfile.read(length)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/ready":
+                self._send(200, b"ready", "text/plain")
+            elif path in ("/loki/api/v1/query_range", "/loki/api/v1/query"):
+                params = parse_qs(urlparse(self.path).query)
+                streams = state.search(params.get("query", [""])[0], int(params.get("limit", ["100"])[0]))
+                result = {"status": "success", "data": {"resultType": "streams", "result": streams}}
+                self._send(200, json.dumps(result).encode())
+            elif path == "/loki/api/v1/status/buildinfo":
+                self._send(200, json.dumps({"version": "standin", "revision": "", "branch": ""}).encode())
+            elif path == "/standin/stats":
+                self._send(200, json.dumps(state.snapshot()).encode())
+            elif path == "/metrics":
+                self._send(200, state.metrics().encode(), "text/plain; version=0.0.4")
+            else:
+                self._send(404, b"not found", "text/plain")
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            if path != "/loki/api/v1/push":
+                self._send(404, b"not found", "text/plain")
+                return
+            body = self._read_body()
+            if state.push_overhead:
+                time.sleep(state.push_overhead)
+            limited = state.admit(len(body))
+            if limited is not None:
+                self._send(limited[0], limited[1].encode(), "text/plain")
+                return
+            try:
+                if self.headers.get("Content-Encoding", "").lower() == "gzip":
+                    body = gzip.decompress(body)
+                encoding, streams = _decode_push(self.headers.get("Content-Type", ""), body)
+            except Exception as e:
+                with state.lock:
+                    state.rejected += 1
+                logger.warning(f"Rejected push body: {e}")
+                self._send(400, f"invalid push body: {e}".encode(), "text/plain")
+                return
+            state.record_push(encoding, streams, len(body))
+            self._send(204)
+
+    return StandinHandler
+
+def serve(host="127.0.0.1", port=3100, visibility_delay=0.0, max_body_bytes=None, rate_limit_bytes=None,
+          burst_bytes=None, push_overhead=0.0):
+    """Creates the stand-in server; call serve_forever() on the result (or run it in a thread)."""
+    state = StandinState(visibility_delay, max_body_bytes=max_body_bytes, rate_limit_bytes=rate_limit_bytes,
+                         burst_bytes=burst_bytes, push_overhead=push_overhead)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.state = state
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Grafana Loki push/query API")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=3100, help="Port to listen on (default: 3100).")
+    parser.add_argument("--visibility-delay", type=float, default=0.0, help="Seconds before pushed entries become searchable (default: 0).")
+    parser.add_argument("--max-body-mb", type=float, help="Reject push bodies larger than this many MB with 413 (default: no limit).")
+    parser.add_argument("--rate-limit-mb", type=float, help="Reject pushes beyond this many MB/sec with 429, like Loki's ingestion_rate_mb (default: no limit).")
+    parser.add_argument("--burst-mb", type=float, help="Burst size of the rate limit in MB, like ingestion_burst_size_mb (default: one second of --rate-limit-mb).")
+    parser.add_argument("--push-overhead", type=float, default=0.0, help="Seconds spent on every push before it is processed (default: 0).")
+    args = parser.parse_args()
+
+    mb = lambda value: int(value * 1024 * 1024) if value else None
+    server = serve(args.host, args.port, args.visibility_delay, max_body_bytes=mb(args.max_body_mb),
+                   rate_limit_bytes=mb(args.rate_limit_mb), burst_bytes=mb(args.burst_mb),
+                   push_overhead=args.push_overhead)
+    logger.info(f"Loki stand-in listening on http://{args.host}:{args.port} (stats at /standin/stats and /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info(f"Received: {server.state.snapshot()}")
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
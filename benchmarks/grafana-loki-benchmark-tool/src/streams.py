@@ -0,0 +1,144 @@
+# Mapping of log documents to Loki streams: promoted label fields and a stream cardinality cap
+
+import json
+import logging
+import re
+from common.passthrough import extract_field
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_VALUE = "_other"  # Label value of every promoted field once the stream cap is reached
+_INVALID_LABEL_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+def label_name(field):
+    """Turns a document field name into a valid Loki label name (e.g. service.name -> service_name)."""
+    name = _INVALID_LABEL_CHARS.sub('_', field)
+    return f"_{name}" if name[:1].isdigit() else name
+
+def parse_label_fields(value):
+    """Parses a comma-separated list of document fields to promote to labels."""
+    return [field.strip() for field in value.split(',') if field.strip()]
+
+class StreamMapper:
+    """
+    Decides which Loki stream each document belongs to.
+
+    Every stream carries the static `labels`. Each field in `label_fields` that a
+    document has (a string or number) is promoted to a label of the same name,
+    so the number of streams is the number of distinct value combinations seen.
+    Stream cardinality is what drives Loki's ingester memory, chunk count and query
+    fan-out, so `max_streams` caps it: once that many streams exist, documents
+    with a new combination go to one overflow stream whose promoted labels are all
+    `OVERFLOW_VALUE`, and are counted as overflow.
+
+    Streams are identified by the tuple of promoted values, so mapping a document
+    costs one field lookup per promoted field and one dict lookup; the label dict of
+    a stream is built once. The mapper is used from the reading thread only.
+    """
+
+    def __init__(self, labels, label_fields=None, max_streams=1000):
+        """
+        Args:
+            labels: Static labels applied to every stream.
+            label_fields: Document fields promoted to stream labels (None or empty: a single stream).
+            max_streams: Maximum number of distinct streams before documents go to the overflow stream.
+        """
+        self.labels = dict(labels)
+        self.label_fields = list(label_fields or [])
+        self.label_names = [label_name(field) for field in self.label_fields]
+        self.max_streams = max(1, max_streams)
+        self._streams = {}  # tuple of promoted values -> label dict
+        self._overflow_key = (OVERFLOW_VALUE,) * len(self.label_fields)
+        self._overflow_docs = 0
+        self._pushes = 0
+        self._streams_in_pushes = 0
+        self._max_streams_per_push = 0
+        self._warned = False
+
+    def _stream_labels(self, key):
+        """Returns the label dict for a tuple of promoted values, applying the cap."""
+        labels = self._streams.get(key)
+        if labels is not None:
+            return labels
+        if len(self._streams) >= self.max_streams and key != self._overflow_key:
+            self._overflow_docs += 1
+            if not self._warned:
+                self._warned = True
+                logger.warning(f"Stream cap of {self.max_streams} reached; further label combinations go to the "
+                               f"'{OVERFLOW_VALUE}' stream.")
+            key = self._overflow_key
+            labels = self._streams.get(key)
+            if labels is not None:
+                return labels
+        labels = dict(self.labels)
+        labels.update((name, value) for name, value in zip(self.label_names, key) if value is not None)
+        self._streams[key] = labels
+        return labels
+
+    def _key(self, values):
+        return tuple(None if value is None else value if isinstance(value, str) else json.dumps(value)
+                     for value in values)
+
+    def group(self, docs, to_entry):
+        """
+        Groups decoded documents into stream objects for one push request.
+
+        Args:
+            docs: The documents of the batch.
+            to_entry: Function turning a document into a [timestamp_ns, line] entry, called once
+                      per document in batch order.
+
+        Returns:
+            A list of {"stream": {labels}, "values": [...]} objects, in order of first appearance.
+        """
+        if not self.label_fields:
+            return self._count([{"stream": self._stream_labels(()), "values": [to_entry(doc) for doc in docs]}])
+        fields = self.label_fields
+        groups = {}
+        for doc in docs:
+            key = self._key([doc.get(field) for field in fields])
+            if key not in self._streams:
+                key = self._intern(key)
+            values = groups.get(key)
+            if values is None:
+                values = groups[key] = []
+            values.append(to_entry(doc))
+        return self._count([{"stream": self._streams[key], "values": values} for key, values in groups.items()])
+
+    def group_raw(self, lines, to_entry):
+        """Like `group` for raw NDJSON line bytes: promoted fields are found without decoding the lines."""
+        if not self.label_fields:
+            return self._count([{"stream": self._stream_labels(()), "values": [to_entry(line) for line in lines]}])
+        fields = self.label_fields
+        groups = {}
+        for line in lines:
+            key = self._key([extract_field(line, field) for field in fields])
+            if key not in self._streams:
+                key = self._intern(key)
+            values = groups.get(key)
+            if values is None:
+                values = groups[key] = []
+            values.append(to_entry(line))
+        return self._count([{"stream": self._streams[key], "values": values} for key, values in groups.items()])
+
+    def _intern(self, key):
+        """Creates the stream for a new value combination and returns the key it is stored under."""
+        labels = self._stream_labels(key)
+        return key if self._streams.get(key) is labels else self._overflow_key
+
+    def _count(self, streams):
+        self._pushes += 1
+        self._streams_in_pushes += len(streams)
+        self._max_streams_per_push = max(self._max_streams_per_push, len(streams))
+        return streams
+
+    def stats(self):
+        """Stream cardinality and packing figures for the run results."""
+        return {
+            "label_fields": self.label_fields,
+            "max_streams": self.max_streams,
+            "streams": len(self._streams),
+            "overflow_docs": self._overflow_docs,
+            "avg_streams_per_push": self._streams_in_pushes / self._pushes if self._pushes else 0,
+            "max_streams_per_push": self._max_streams_per_push,
+        }
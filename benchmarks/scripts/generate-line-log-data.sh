@@ -1,54 +1,31 @@
 #!/bin/bash
 
+# Thin wrapper around the Python generator (common/loggen.py), which writes
+# several hundred thousand lines per second instead of forking several processes per line.
+
 # Default values
 DEFAULT_LINES=1000
 OUTPUT_FILE="generated_logs.log"
+SEED_ARGS=()
 
 # --- Functions ---
 
 # Function to print usage instructions
 usage() {
-  echo "Usage: $0 [-n <number_of_lines>] [-o <output_file>]"
+  echo "Usage: $0 [-n <number_of_lines>] [-o <output_file>] [-s <seed>] [-- <generator options>]"
+  echo "  Generates plain-text log lines: <timestamp> [LEVEL] client=<ip> request_id=<id> : <message>"
   echo "  -n <number_of_lines>: Number of log lines to generate (default: $DEFAULT_LINES)"
-  echo "  -o <output_file>:     Name of the output log file (default: $OUTPUT_FILE)"
+  echo "  -o <output_file>:     Name of the output file (default: $OUTPUT_FILE)"
+  echo "  -s <seed>:            Random seed, for reproducible data (default: random)"
+  echo "  Options after -- go to the generator, e.g. -- --users 100000 --user-zipf 1.2 (see: python3 -m common.loggen -h)"
   exit 1
 }
 
-# Function to generate a random IP address (simple version)
-generate_ip() {
-  echo "$((RANDOM % 256)).$((RANDOM % 256)).$((RANDOM % 256)).$((RANDOM % 256))"
-}
-
-# Function to generate a random log level
-generate_level() {
-  local levels=("INFO" "WARN" "ERROR" "DEBUG" "TRACE")
-  echo "${levels[$((RANDOM % ${#levels[@]}))]}"
-}
-
-# Function to generate a random short message
-generate_message() {
-  local messages=(
-    "User logged in successfully"
-    "Configuration updated"
-    "Service started"
-    "Request processed"
-    "Database connection failed"
-    "File not found"
-    "Invalid input received"
-    "Cache cleared"
-    "Processing data chunk"
-    "System health check OK"
-    "Timeout occurred"
-    "Memory usage high"
-  )
-  echo "${messages[$((RANDOM % ${#messages[@]}))]}"
-}
-
 # --- Argument Parsing ---
 
 NUM_LINES=$DEFAULT_LINES
 
-while getopts "n:o:h" opt; do
+while getopts "n:o:s:h" opt; do
   case $opt in
     n)
       # Validate if the input is a positive integer
@@ -62,6 +39,9 @@ while getopts "n:o:h" opt; do
     o)
       OUTPUT_FILE=$OPTARG
       ;;
+    s)
+      SEED_ARGS=(--seed "$OPTARG")
+      ;;
     h)
       usage
       ;;
@@ -75,35 +55,11 @@ while getopts "n:o:h" opt; do
       ;;
   esac
 done
+shift $((OPTIND - 1))
 
 # --- Main Logic ---
 
-echo "Generating $NUM_LINES log lines into $OUTPUT_FILE..."
-
-# Clear the output file or create it if it doesn't exist
-> "$OUTPUT_FILE"
-
-# Loop to generate log lines
-for (( i=1; i<=NUM_LINES; i++ )); do
-  timestamp=$(date +"%Y-%m-%d %H:%M:%S.%3N")
-  level=$(generate_level)
-  ip=$(generate_ip)
-  message=$(generate_message)
-  request_id=$(head /dev/urandom | tr -dc A-Za-z0-9 | head -c 12) # Random request ID
-
-  # Construct the log line
-  log_line="$timestamp [$level] client=$ip request_id=$request_id : $message"
-
-  # Append to the output file
-  echo "$log_line" >> "$OUTPUT_FILE"
-
-  # Optional: Print progress every 1000 lines
-  if (( i % 1000 == 0 )); then
-     echo "Generated $i lines..."
-  fi
-
-done
-
-echo "Finished generating $NUM_LINES log lines in $OUTPUT_FILE."
-
-exit 0
\ No newline at end of file
+# The common package lives next to this directory
+BENCHMARKS_DIR="$(cd "$(dirname "$0")/.." && pwd)"
+PYTHONPATH="$BENCHMARKS_DIR${PYTHONPATH:+:$PYTHONPATH}" exec python3 -m common.loggen \
+  --format text -n "$NUM_LINES" -o "$OUTPUT_FILE" "${SEED_ARGS[@]}" "$@"
@@ -27,11 +27,12 @@ ES_DATA_FILE="${ES_DATA_FILE:-$DEFAULT_DATA_FILE}"
 DEFAULT_QUERIES_FILE="${BENCHMARK_TOOL_DIR}/../scripts/generated_queries.txt"
 ES_QUERIES_FILE="${ES_QUERIES_FILE:-}" # Default to empty (no query benchmark)
 ES_BATCH_SIZE="${ES_BATCH_SIZE:-1000}" # Default batch size
+ES_WORKERS="${ES_WORKERS:-1}" # Default number of concurrent bulk requests
 QUERY_ONLY_MODE="false" # Default to run ingestion + queries
 
 # --- Functions ---
 usage() {
-  echo "Usage: $0 [-h <host>] [-p <port>] [--scheme <scheme>] [--no-verify-certs] [-i <index>] [-d <data_file>] [-q <queries_file>] [-b <batch_size>] [-U <user>] [-P <password>] [-K <api_key>] [--query-only] [--help]"
+  echo "Usage: $0 [-h <host>] [-p <port>] [--scheme <scheme>] [--no-verify-certs] [-i <index>] [-d <data_file>] [-q <queries_file>] [-b <batch_size>] [-w <workers>] [-U <user>] [-P <password>] [-K <api_key>] [--query-only] [--help]"
   echo ""
   echo "  Runs the Python Elasticsearch benchmark tool using environment variables and optional overrides."
   echo "  Ensure the Python virtual environment for the tool is activated before running."
@@ -50,6 +51,7 @@ usage() {
   echo "    -d <data_file>:    Path to NDJSON data file (required unless --query-only, default: \$ES_DATA_FILE or '$ES_DATA_FILE')"
   echo "    -q <queries_file>: Path to queries file (required for query benchmark, default: \$ES_QUERIES_FILE or none, e.g., '$DEFAULT_QUERIES_FILE')"
   echo "    -b <batch_size>:   Ingestion batch size (ignored if --query-only, default: \$ES_BATCH_SIZE or '$ES_BATCH_SIZE')"
+  echo "    -w <workers>:      Concurrent bulk requests in flight (ignored if --query-only, default: \$ES_WORKERS or '$ES_WORKERS')"
   echo "    -U <user>:         Elasticsearch user (default: \$ELASTIC_USER or none)"
   echo "    -P <password>:     Elasticsearch password (default: \$ELASTIC_PASSWORD or none)"
   echo "    -K <api_key>:      Elasticsearch API key (default: \$ES_API_KEY or none)"
@@ -71,6 +73,7 @@ while [[ $# -gt 0 ]]; do
     -d) ES_DATA_FILE="$2"; shift; shift ;;
     -q) ES_QUERIES_FILE="$2"; shift; shift ;;
     -b) ES_BATCH_SIZE="$2"; shift; shift ;;
+    -w) ES_WORKERS="$2"; shift; shift ;;
     -U) ES_USER="$2"; shift; shift ;;
     -P) ES_PASSWORD="$2"; shift; shift ;;
     -K) ES_API_KEY="$2"; shift; shift ;;
@@ -130,6 +133,7 @@ PYTHON_CMD+=" --index-name \"$ES_INDEX_NAME\""
 if [[ "$QUERY_ONLY_MODE" == "false" ]]; then
     PYTHON_CMD+=" --data-file \"$ES_DATA_FILE\""
     PYTHON_CMD+=" --batch-size \"$ES_BATCH_SIZE\""
+    PYTHON_CMD+=" --workers \"$ES_WORKERS\""
 fi
 
 # Add optional arguments
@@ -176,6 +180,7 @@ echo "Index: $ES_INDEX_NAME"
 if [[ "$QUERY_ONLY_MODE" == "false" ]]; then
     echo "Data File: $ES_DATA_FILE"
     echo "Batch Size: $ES_BATCH_SIZE"
+    echo "Workers: $ES_WORKERS"
 fi
 [[ -n "$ES_QUERIES_FILE" ]] && echo "Queries File: $ES_QUERIES_FILE"
 echo "Executing command:"